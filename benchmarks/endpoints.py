@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""
+Benchmark of every FamilySearch endpoint against a local stand-in server
+
+The stand-in is a WSGI application serving the response fixtures from
+familysearch/tests, scaled up to realistic sizes: one person (or persona or
+version) per requested ID, pedigrees several generations deep, and hundreds
+of search and match results. By default it is called in-process through a
+WSGITransport, so only client-side costs are measured; with --http it is
+served on a local socket instead.
+
+Each benchmark is run repeatedly, and its throughput (calls per second) and
+50th, 95th, and 99th percentile latencies are reported. With --save, the
+results are written to a baseline file; later runs are compared with the
+baseline and exit with status 1 if any benchmark got slower than the
+tolerance allows.
+
+Usage: python benchmarks/endpoints.py [options] [benchmark names]
+"""
+
+import copy
+import optparse
+import os
+import sys
+import threading
+import time
+import urlparse
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from familysearch import FamilySearch
+from familysearch.transport import WSGITransport
+
+fixture_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'familysearch', 'tests')
+default_baseline = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def load_fixture(filename):
+    """Load a response fixture from familysearch/tests."""
+    f = open(os.path.join(fixture_dir, filename))
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    if filename.endswith('.json'):
+        return json.loads(data)
+    return data
+
+
+def person_id(n):
+    """Return the ID of the nth synthetic person."""
+    return 'P%03d-%03d' % (n // 1000 % 1000, n % 1000)
+
+
+class StandInServer(object):
+
+    """
+    A WSGI application serving scaled-up response fixtures
+
+    Response bodies are rendered once per URL and then reused, so that the
+    benchmarks measure the client rather than the stand-in.
+    """
+
+    def __init__(self, generations=8, results=200, places=20):
+        self.generations = generations
+        self.results = results
+        self.places = places
+        self.templates = {'person': load_fixture('person1.json')['persons'][0],
+                          'persona': load_fixture('persona.json')['personas'][0],
+                          'version': load_fixture('version_list.json')['versions'][0],
+                          'pedigree': load_fixture('pedigree.json')['pedigrees'][0],
+                          'search': load_fixture('search.json')['searches'][0],
+                          'match': load_fixture('match.json')['matches'][0],
+                          'place': load_fixture('place.json'),
+                          'name': load_fixture('name.json'),
+                          'date': load_fixture('date.json'),
+                          'culture': load_fixture('culture.json'),
+                          'login': load_fixture('login.json'),
+                          'properties': load_fixture('identity_properties.json'),
+                          'request_token': load_fixture('request_token.txt'),
+                          'access_token': load_fixture('access_token.txt')}
+        self.bodies = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        key = (environ.get('HTTP_HOST', ''), environ['PATH_INFO'], environ.get('QUERY_STRING', ''))
+        self.lock.acquire()
+        try:
+            if key not in self.bodies:
+                self.bodies[key] = self.render(environ)
+            (status, content_type, body) = self.bodies[key]
+        finally:
+            self.lock.release()
+        start_response(status, [('Content-Type', content_type),
+                                ('Content-Length', str(len(body)))])
+        return [body]
+
+    def render(self, environ):
+        """Return the (status, content type, body) of the response to a request."""
+        parts = environ['PATH_INFO'].strip('/').split('/')
+        (module, endpoint, ids) = (parts[0], parts[2], parts[3:])
+        if ids:
+            ids = ids[0].split(',')
+        if module == 'identity':
+            if endpoint in ('request_token', 'access_token'):
+                return ('200 OK', 'text/plain', self.templates[endpoint])
+            if endpoint == 'properties':
+                body = self.properties(environ)
+            else:
+                body = self.templates['login']
+        else:
+            body = getattr(self, endpoint)(ids or [person_id(0)],
+                                           urlparse.parse_qs(environ.get('QUERY_STRING', '')))
+        return ('200 OK', 'application/json', json.dumps(body))
+
+    def properties(self, environ):
+        base = '%s://%s/identity/v2/' % (environ['wsgi.url_scheme'], environ.get('HTTP_HOST', 'localhost'))
+        body = copy.deepcopy(self.templates['properties'])
+        for prop in body['properties']:
+            if prop['name'].endswith('.url'):
+                prop['value'] = base + prop['value'].split('/')[-1]
+        return body
+
+    def clone(self, template, id, **values):
+        result = copy.deepcopy(template)
+        result['id'] = id
+        result.update(values)
+        return result
+
+    def familytree(self, key, items):
+        return {key: items, 'version': '2.7.20110406.1514', 'statusCode': 200, 'statusMessage': 'OK'}
+
+    def person(self, ids, query):
+        return self.familytree('persons', [self.clone(self.templates['person'], id) for id in ids])
+
+    def persona(self, ids, query):
+        return self.familytree('personas', [self.clone(self.templates['persona'], id) for id in ids])
+
+    def version(self, ids, query):
+        return self.familytree('versions', [self.clone(self.templates['version'], id, requestedId=id)
+                                            for id in ids])
+
+    def pedigree(self, ids, query):
+        # Number the ancestors as in an Ahnentafel: the root is 1, and the
+        # parents of n are 2n and 2n + 1
+        persons = [self.clone(self.templates['person'], person_id(n))
+                   for n in range(1, 2 ** self.generations)]
+        return self.familytree('pedigrees', [self.clone(self.templates['pedigree'], id, requestedId=id,
+                                                        persons=persons)
+                                             for id in ids])
+
+    def search(self, ids, query):
+        result = self.templates['search']['search'][0]
+        results = [self.clone(result, person_id(n), score=5.0 - n * 0.01) for n in range(self.results)]
+        search = copy.deepcopy(self.templates['search'])
+        search.update({'count': len(results), 'search': results})
+        return self.familytree('searches', [search])
+
+    def match(self, ids, query):
+        result = self.templates['match']['match'][0]
+        results = [self.clone(result, person_id(n), score=0.9 - n * 0.001) for n in range(self.results)]
+        return self.familytree('matches', [self.clone(self.templates['match'], id, count=len(results),
+                                                      match=results)
+                                           for id in ids])
+
+    def authorities(self, endpoint, key, count):
+        body = copy.deepcopy(self.templates[endpoint])
+        items = body[endpoint + 's'][key]
+        body[endpoint + 's'][key] = [copy.deepcopy(items[0]) for i in range(count)]
+        return body
+
+    def place(self, ids, query):
+        return self.authorities('place', 'place', self.places)
+
+    def name(self, ids, query):
+        return self.authorities('name', 'name', self.places)
+
+    def date(self, ids, query):
+        return self.authorities('date', 'date', self.places)
+
+    def culture(self, ids, query):
+        body = copy.deepcopy(self.templates['culture'])
+        body['cultures'] = [self.clone(body['cultures'][0], str(n)) for n in range(self.places)]
+        return body
+
+
+def oauth_login(fs):
+    fs.logout()
+    fs.request_token()
+    fs.authorize()
+    fs.access_token('FAKE_VERIFIER')
+
+
+def make_benchmarks(persons):
+    """Return a list of (name, function) pairs, each function taking a FamilySearch object."""
+    ids = [person_id(n) for n in range(persons)]
+    return [('person', lambda fs: fs.person(ids)),
+            ('persona', lambda fs: fs.persona(ids)),
+            ('version', lambda fs: fs.version(ids)),
+            ('pedigree', lambda fs: fs.pedigree(ids[0])),
+            ('search', lambda fs: fs.search(givenName='John', familyName='Smith')),
+            ('match', lambda fs: fs.match(ids[0])),
+            ('place', lambda fs: fs.place('London')),
+            ('name', lambda fs: fs.name('John Smith')),
+            ('date', lambda fs: fs.date('1 Jan 2000')),
+            ('culture', lambda fs: fs.culture()),
+            ('login', lambda fs: fs.login('FAKE_USERNAME', 'FAKE_PASSWORD')),
+            ('initialize', lambda fs: (fs.initialize(), fs.authenticate('FAKE_USERNAME', 'FAKE_PASSWORD'))),
+            ('session', lambda fs: fs.session()),
+            ('oauth', oauth_login)]
+
+
+def percentile(sorted_values, fraction):
+    """Return a percentile of a sorted list of values (nearest-rank)."""
+    index = int(round(fraction * len(sorted_values) + 0.5)) - 1
+    return sorted_values[max(0, min(index, len(sorted_values) - 1))]
+
+
+def run(fn, fs, iterations, warmup):
+    """Call fn(fs) repeatedly, returning a dict of throughput and latency percentiles."""
+    for i in range(warmup):
+        fn(fs)
+    latencies = []
+    start = time.time()
+    for i in range(iterations):
+        call_start = time.time()
+        fn(fs)
+        latencies.append(time.time() - call_start)
+    elapsed = time.time() - start
+    latencies.sort()
+    return {'calls': iterations,
+            'throughput': iterations / elapsed,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99)}
+
+
+def serve(app):
+    """Serve app on a local socket in a background thread, returning its base URL."""
+    from wsgiref.simple_server import make_server, WSGIRequestHandler
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+    server = make_server('127.0.0.1', 0, app, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return 'http://127.0.0.1:%d' % server.server_port
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of each result from the baseline, returning the names of regressions."""
+    regressions = []
+    for (name, result) in results:
+        if name not in baseline:
+            continue
+        change = result['p50'] / baseline[name]['p50'] - 1
+        flag = ''
+        if change > tolerance:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        print '%-12s p50 %+7.1f%%  throughput %+7.1f%%  %s' % (
+            name, change * 100, (result['throughput'] / baseline[name]['throughput'] - 1) * 100, flag)
+    return regressions
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options] [benchmark names]')
+    parser.add_option('-n', '--iterations', type='int', default=50,
+                      help='timed calls per benchmark (default %default)')
+    parser.add_option('--warmup', type='int', default=3,
+                      help='untimed calls before timing each benchmark (default %default)')
+    parser.add_option('--persons', type='int', default=200,
+                      help='IDs requested from person, persona, and version (default %default)')
+    parser.add_option('--generations', type='int', default=8,
+                      help='generations in each pedigree (default %default)')
+    parser.add_option('--results', type='int', default=200,
+                      help='results of each search and match (default %default)')
+    parser.add_option('--http', action='store_true', default=False,
+                      help='serve the stand-in on a local socket instead of in-process')
+    parser.add_option('--baseline', default=default_baseline,
+                      help='baseline file (default %default)')
+    parser.add_option('--save', action='store_true', default=False,
+                      help='write the results to the baseline file')
+    parser.add_option('--tolerance', type='float', default=0.2,
+                      help='fractional p50 slowdown reported as a regression (default %default)')
+    (options, names) = parser.parse_args(argv)
+
+    app = StandInServer(options.generations, options.results)
+    if options.http:
+        fs = FamilySearch('Benchmark/1.0', 'FAKE_DEV_KEY', session='FAKE_SESSION_ID', base=serve(app))
+    else:
+        fs = FamilySearch('Benchmark/1.0', 'FAKE_DEV_KEY', session='FAKE_SESSION_ID',
+                          transport=WSGITransport(app))
+
+    results = []
+    print '%-12s %8s %12s %10s %10s %10s' % ('benchmark', 'calls', 'calls/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)')
+    for (name, fn) in make_benchmarks(options.persons):
+        if names and name not in names:
+            continue
+        result = run(fn, fs, options.iterations, options.warmup)
+        results.append((name, result))
+        print '%-12s %8d %12.1f %10.2f %10.2f %10.2f' % (name, result['calls'], result['throughput'],
+                                                         result['p50'] * 1000, result['p95'] * 1000,
+                                                         result['p99'] * 1000)
+
+    if options.save:
+        f = open(options.baseline, 'w')
+        try:
+            json.dump(dict(results), f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+        print 'Saved baseline to %s' % options.baseline
+    elif os.path.exists(options.baseline):
+        f = open(options.baseline)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        print
+        print 'Compared with %s:' % options.baseline
+        if compare(results, baseline, options.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
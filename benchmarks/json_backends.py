@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Benchmark of the JSON libraries jsoncodec can use
+
+Times decoding person, pedigree and search responses from the fake server
+(with null attributes added to every object, as the real API returns them)
+with each installed library, both plainly (jsoncodec.loads) and removing the
+nulls (jsoncodec.loads_clean, as every API response is decoded). Use the
+results to decide whether to force a library with FAMILYSEARCH_JSON.
+
+Usage: python benchmarks/json_backends.py [number of persons and results]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from familysearch import jsoncodec
+from familysearch.fakeserver import FakeServer
+from remove_nones import add_nulls
+
+
+def make_bodies(count):
+    """Return a list of (name, body) pairs of person, pedigree and search responses."""
+    server = FakeServer(size=100000, founders=100)
+    ids = ','.join([server.tree.id(number) for number in range(count)])
+    requests = [('%d persons' % count, '/familytree/v2/person/' + ids, 'parents=summary&families=summary'),
+                ('pedigree', '/familytree/v2/pedigree', 'ancestors=9'),
+                ('search', '/familytree/v2/search', 'givenName=John&maxResults=%d' % count)]
+    bodies = []
+    for (name, path, query) in requests:
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query}
+        body = server.respond(environ)[2]
+        bodies.append((name, jsoncodec.dumps(add_nulls(jsoncodec.loads(body)))))
+    return bodies
+
+
+def measure(fn, body):
+    """Return the fastest time (ms) of decoding a body with fn."""
+    return min(timeit.repeat(lambda: fn(body), number=3, repeat=5)) / 3 * 1000
+
+
+def main(count=500):
+    backends = [jsoncodec.make_backend(name) for name in jsoncodec.available()]
+    print 'Default library: %s' % jsoncodec.backend.name
+    print '%-14s %10s %-12s %12s %12s' % ('response', 'size (KB)', 'library', 'loads (ms)', 'clean (ms)')
+    for (name, body) in make_bodies(count):
+        expected = backends[-1].loads_clean(body)
+        for backend in backends:
+            assert backend.loads_clean(body) == expected
+            print '%-14s %10d %-12s %12.1f %12.1f' % (name, len(body) // 1024, backend.name,
+                                                      measure(backend.loads, body),
+                                                      measure(backend.loads_clean, body))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
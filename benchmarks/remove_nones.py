@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Benchmark of removing nulls while decoding large responses
+
+Compares decoding a response and then removing its nulls by rebuilding the
+whole response (as FamilyTreeV2._remove_nones used to) with
+jsoncodec.loads_clean, which removes them while decoding. Responses are large
+person lists and pedigrees from the fake server, with null attributes added
+to every object as the real API returns them.
+
+Peak memory is measured in a separate process for each approach, as the
+growth of its peak resident set size while decoding (read from /proc on
+Linux, where ru_maxrss would include the parent's peak).
+
+Usage: python benchmarks/remove_nones.py [number of persons]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import timeit
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from familysearch import jsoncodec
+from familysearch.fakeserver import FakeServer
+
+# Attributes the API returns as null on most objects
+NULL_ATTRIBUTES = ['notes', 'citations', 'disputes', 'contributors', 'modified', 'selected']
+
+def remove_nones(value):
+    """Remove all nulls from a decoded response by rebuilding it."""
+    if isinstance(value, dict):
+        return dict([(k, remove_nones(v)) for (k, v) in value.iteritems() if v is not None])
+    elif isinstance(value, list):
+        return [remove_nones(i) for i in value if i is not None]
+    else:
+        return value
+
+
+def two_pass(body):
+    """Decode a response, then remove nulls by rebuilding it."""
+    return remove_nones(json.loads(body))
+
+
+def fused(body):
+    """Decode a response, removing nulls while decoding."""
+    return jsoncodec.loads_clean(body)
+
+
+approaches = [('two-pass', two_pass), ('fused', fused)]
+
+
+def add_nulls(value):
+    """Add null attributes to every object in a decoded response."""
+    if isinstance(value, dict):
+        for item in value.values():
+            add_nulls(item)
+        for name in NULL_ATTRIBUTES:
+            value.setdefault(name, None)
+    elif isinstance(value, list):
+        for item in value:
+            add_nulls(item)
+    return value
+
+
+def make_bodies(persons):
+    """Return a list of (name, body) pairs of large responses."""
+    server = FakeServer(size=100000, founders=100)
+    ids = ','.join([server.tree.id(number) for number in range(persons)])
+    environ = {'REQUEST_METHOD': 'GET', 'QUERY_STRING': 'parents=summary&families=summary'}
+    bodies = []
+    for (name, path) in [('%d persons' % persons, '/familytree/v2/person/' + ids),
+                         ('pedigree', '/familytree/v2/pedigree')]:
+        environ['PATH_INFO'] = path
+        if name == 'pedigree':
+            environ['QUERY_STRING'] = 'ancestors=9'
+        body = server.respond(environ)[2]
+        bodies.append((name, json.dumps(add_nulls(json.loads(body)))))
+    return bodies
+
+
+def peak_memory(path, approach):
+    """Return the peak memory growth (KB) of decoding the body in path, in a new process."""
+    process = subprocess.Popen([sys.executable, __file__, '--memory', path, approach],
+                               stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    return int(output)
+
+
+def max_rss():
+    """Return the peak resident set size of this process (KB)."""
+    try:
+        f = open('/proc/self/status')
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    finally:
+        f.close()
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure_memory(path, approach):
+    """Decode the body in path with an approach, printing the peak memory growth (KB)."""
+    f = open(path)
+    try:
+        body = f.read()
+    finally:
+        f.close()
+    before = max_rss()
+    result = dict(approaches)[approach](body)
+    print max_rss() - before
+
+
+def main(persons=500):
+    print '%-14s %10s %12s %12s %14s %14s' % ('response', 'size (KB)', 'two-pass (ms)', 'fused (ms)',
+                                              'two-pass (KB)', 'fused (KB)')
+    for (name, body) in make_bodies(persons):
+        assert two_pass(body) == fused(body)
+        times = [min(timeit.repeat(lambda: fn(body), number=3, repeat=5)) / 3 * 1000
+                 for (approach, fn) in approaches]
+        (fd, path) = tempfile.mkstemp()
+        try:
+            os.write(fd, body)
+            os.close(fd)
+            memory = [peak_memory(path, approach) for (approach, fn) in approaches]
+        finally:
+            os.remove(path)
+        print '%-14s %10d %12.1f %12.1f %14d %14d' % (name, len(body) // 1024, times[0], times[1],
+                                                      memory[0], memory[1])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--memory']:
+        measure_memory(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
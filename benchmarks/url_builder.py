@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of the per-call cost of building request URLs
+
+Compares the single-pass FamilySearch._build_url with the previous approach,
+which split and re-joined the URL in _add_subpath and parsed and re-encoded
+the query string in _add_query_params, again in _add_json_format, and once
+more to add the sessionId parameter.
+
+Usage: python benchmarks/url_builder.py [number of calls]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from familysearch import FamilySearch
+
+fs = FamilySearch('Benchmark/1.0', 'FAKE_DEV_KEY', session='FAKE_SESSION_ID')
+person_url = fs.familytree_urls['person']
+
+
+def previous_url(person_id, options):
+    """Build a person URL the way it was built before _build_url."""
+    url = fs.familytree_base + 'person'
+    url = fs._add_subpath(url, person_id)
+    url = fs._add_query_params(url, options)
+    url = fs._add_json_format(url)
+    return fs._add_query_params(url, sessionId=fs.session_id)
+
+
+def single_pass_url(person_id, options):
+    """Build a person URL with _build_url."""
+    return fs._build_url(person_url, person_id, options)
+
+
+def main(number=20000):
+    cases = [('no options', ('ABCD-123', {})),
+             ("events='all'", ('ABCD-123', {'events': 'all'})),
+             ('four options', ('ABCD-123,EFGH-456', {'events': 'all', 'children': 'all',
+                                                    'parents': 'all', 'names': 'all'}))]
+    print '%-16s %14s %14s %8s' % ('case', 'before (us)', 'after (us)', 'speedup')
+    for (name, args) in cases:
+        before = min(timeit.repeat(lambda: previous_url(*args), number=number, repeat=3))
+        after = min(timeit.repeat(lambda: single_pass_url(*args), number=number, repeat=3))
+        print '%-16s %14.2f %14.2f %7.1fx' % (name, before / number * 1e6,
+                                              after / number * 1e6, before / after)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
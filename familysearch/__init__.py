@@ -26,6 +26,40 @@ fs = FamilySearch('ClientApp/1.0', 'developer_key', session='session_id')
 # Use the production system instead of the reference system
 fs = FamilySearch('ClientApp/1.0', 'developer_key', base='https://api.familysearch.org')
 
+# Keep up to 8 idle keep-alive connections per host (0 disables reuse)
+fs = FamilySearch('ClientApp/1.0', 'developer_key', pool_size=8)
+
+# Send requests to a WSGI application in-process instead of over the network
+from familysearch.transport import WSGITransport
+fs = FamilySearch('ClientApp/1.0', 'developer_key', transport=WSGITransport(app))
+
+# Retry failed GET requests up to 5 times, and see how many retries were made
+from familysearch.retry import RetryPolicy
+fs = FamilySearch('ClientApp/1.0', 'developer_key', retry_policy=RetryPolicy(max_attempts=5))
+print fs.retry_policy.retries, fs.retry_policy.retries_by_status
+
+# Make at most 10 requests per second (bursts of up to 20) with this key, shared
+# by all processes on this host
+from familysearch.ratelimit import RateLimiter, shared_directory
+limiter = RateLimiter(10, burst=20, directory=shared_directory())
+fs = FamilySearch('ClientApp/1.0', 'developer_key', rate_limiter=limiter)
+
+# Cache responses in up to 64 MB of memory (or on disk with cache.DiskStorage),
+# revalidating them with the server before use
+from familysearch.cache import MemoryStorage, ResponseCache
+cache = ResponseCache(MemoryStorage(max_bytes=64 * 1024 * 1024))
+fs = FamilySearch('ClientApp/1.0', 'developer_key', response_cache=cache)
+print cache.stats()
+
+# Keep family tree and authorities results in an SQLite database shared by
+# all processes, for up to a day
+from familysearch.store import SQLiteStore
+fs = FamilySearch('ClientApp/1.0', 'developer_key', store=SQLiteStore('/var/cache/familysearch/store.db', ttl=86400))
+
+# Memoize up to 100000 place, name, date, and culture results in memory
+from familysearch.cache import AuthoritiesCache
+fs = FamilySearch('ClientApp/1.0', 'developer_key', authorities_cache=AuthoritiesCache(max_entries=100000))
+
 # Log in with OAuth
 import webbrowser
 fs = FamilySearch('ClientApp/1.0', 'developer_key')
@@ -48,6 +82,10 @@ me = fs.person()
 person = fs.person('ABCD-123')
 persons = fs.person(['ABCD-123', 'EFGH-456'])
 
+# Retrieve any number of persons; long lists are requested in concurrent chunks
+fs.id_limits['person'] = 20
+persons = fs.person(person_ids)
+
 # Retrieve family tree details for a list of persons, specifying parameters
 persons = fs.person(['ABCD-123', 'EFGH-456'], events='all', children='all')
 
@@ -64,6 +102,11 @@ matches = fs.match('ABCD-123')
 # Compute match score between two persons
 match = fs.match('ABCD-123', id='EFGH-456')
 
+# Run requests concurrently, getting a Future for each result
+afs = AsyncFamilySearch('ClientApp/1.0', 'developer_key', session='session_id')
+futures = [afs.person(person_id) for person_id in ['ABCD-123', 'EFGH-456']]
+persons = [future.result() for future in futures]
+
 # For more examples, see README.rst
 """
 
@@ -71,6 +114,13 @@ import urllib
 import urllib2
 import urlparse
 
+import coalesce
+import jsoncodec
+import retry
+import workers
+from metrics import EVENTS, InstrumentedResponse, RequestInfo
+from transport import PooledTransport, TransportHandler
+
 # Support Python < 2.6
 if not hasattr(urlparse, 'parse_qs'):
     import cgi
@@ -103,21 +153,52 @@ class FamilySearch(object):
     persona -- get a persona or list of personas from the family tree
     version -- get the latest version number of a person from the family tree
     pedigree -- get the pedigree of a person or list of persons
+    iter_persons -- iterate over persons from the family tree as they are read
+    iter_personas -- iterate over personas from the family tree as they are read
+    iter_versions -- iterate over latest versions of persons as they are read
+    iter_ancestors -- crawl the ancestors of persons concurrently
+    iter_descendants -- crawl the descendants of persons concurrently
     search -- search for persons in the family tree
+    iter_search -- iterate over all pages of a search, prefetching the next
     match -- search for possible duplicates in the family tree
+    iter_matches -- compute match scores for many pairs of persons concurrently
+    find_duplicates -- find likely duplicates among persons, ranked by score
 
     place -- standardize a place name
     name -- standardize a person name
     date -- standardize a date
     culture -- look up culture IDs
 
+    add_hook -- run a function at a given stage of every request
+
     Public attributes:
 
     logged_in -- flag indicating whether this proxy instance is logged in
+    transport -- Transport sending all requests
+    connection_pool -- pool of keep-alive connections used by the default
+                       transport (None if another transport is used)
+    workers -- pool of threads used to request long lists of IDs concurrently
+    id_limits -- maximum number of IDs sent in one request, by endpoint
+    retry_policy -- RetryPolicy used for GET requests (including counters)
+    rate_limiter -- RateLimiter consulted before every request, or None
+    response_cache -- ResponseCache used for GET requests, or None
+    store -- store.SQLiteStore that family tree and authorities results are
+             read through, or None
+    authorities_cache -- cache.AuthoritiesCache memoizing Authorities
+                         results, or None
+    coalescer -- SingleFlight sharing identical concurrent GET requests, or None
+    hooks -- dict mapping each event in metrics.EVENTS to the hooks it runs
+             (see add_hook)
+    metrics -- MetricsRegistry collecting metrics from requests, or None
+    typed -- flag indicating whether family tree results are returned as
+             model objects instead of dicts
     """
 
     def __init__(self, agent, key, username=None, password=None, session=None,
-                 base='http://www.dev.usys.org'):
+                 base='http://www.dev.usys.org', pool_size=4, max_workers=4,
+                 retry_policy=None, rate_limiter=None, response_cache=None,
+                 coalesce_requests=True, transport=None, metrics=None, typed=False, store=None,
+                 authorities_cache=None):
         """
         Instantiate a FamilySearch proxy object.
 
@@ -129,12 +210,64 @@ class FamilySearch(object):
         session (optional) -- existing session ID to reuse
         base (optional) -- base URL for the API;
                            defaults to 'http://www.dev.usys.org' (the Reference System)
+        pool_size (optional) -- number of idle keep-alive connections to keep
+                                open per host (defaults to 4; 0 disables reuse)
+        max_workers (optional) -- number of concurrent requests used to fetch
+                                  long lists of IDs (defaults to 4)
+        retry_policy (optional) -- RetryPolicy for GET requests; defaults to
+                                   retry.RetryPolicy() (3 attempts for
+                                   connection errors and HTTP 5xx)
+        rate_limiter (optional) -- ratelimit.RateLimiter consulted before
+                                   every request (defaults to no limit)
+        response_cache (optional) -- cache.ResponseCache used for GET
+                                     requests (defaults to no caching)
+        coalesce_requests (optional) -- whether identical GET requests made
+                                        concurrently share a single request
+                                        (defaults to True)
+        transport (optional) -- transport.Transport sending all requests;
+                                defaults to a transport.PooledTransport
+                                keeping pool_size connections per host
+        metrics (optional) -- metrics.MetricsRegistry collecting metrics
+                              from every request (defaults to none)
+        typed (optional) -- whether person, persona, and pedigree (and their
+                            iterators) return compact model objects (see
+                            familysearch.model) instead of dicts
+                            (defaults to False)
+        store (optional) -- store.SQLiteStore keeping the results of
+                            person, persona, pedigree, and the Authorities
+                            endpoints, which are read through it (defaults
+                            to no store)
+        authorities_cache (optional) -- cache.AuthoritiesCache memoizing
+                                        the results of place, name, date,
+                                        and culture (defaults to none)
         """
         self.agent = '%s Python-FS-Stack/%s' % (agent, __version__)
         self.key = key
         self.session_id = session
         self.base = base
-        self.opener = urllib2.build_opener()
+        self.pool_size = pool_size
+        if transport is None:
+            transport = PooledTransport(pool_size)
+        self.transport = transport
+        self.connection_pool = getattr(transport, 'pool', None)
+        self.http_handlers = [TransportHandler(transport)]
+        self.opener = urllib2.build_opener(*self.http_handlers)
+        self.workers = workers.WorkerPool(max_workers)
+        if retry_policy is None:
+            retry_policy = retry.RetryPolicy()
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        self.coalescer = None
+        if coalesce_requests:
+            self.coalescer = coalesce.SingleFlight()
+        self.hooks = dict([(event, []) for event in EVENTS])
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.install(self)
+        self.typed = typed
+        self.store = store
+        self.authorities_cache = authorities_cache
 
         for mixin in self.__class__.__bases__:
             mixin.__init__(self)
@@ -149,7 +282,11 @@ class FamilySearch(object):
         return ({'agent': ' '.join(self.agent.split(' ')[:-1]),
                  'key': self.key,
                  'session': self.session_id,
-                 'base': self.base},
+                 'base': self.base,
+                 'pool_size': self.pool_size,
+                 'max_workers': self.workers.max_workers,
+                 'typed': self.typed,
+                 'store': self.store},
                 dict([(session, secret)
                       for (session, secret)
                       in self.oauth_secrets.iteritems()
@@ -164,28 +301,187 @@ class FamilySearch(object):
         if self.session_id in self.oauth_secrets:
             self.logged_in = False
 
+    def add_hook(self, event, hook):
+        """
+        Run a function at a given stage of every request.
+
+        The event must be one of metrics.EVENTS. The hook is called with the
+        event name and a metrics.RequestInfo describing the request.
+
+        """
+        if event not in self.hooks:
+            raise ValueError('unknown event: %s' % event)
+        self.hooks[event].append(hook)
+
     def _request(self, url, data=None):
         """
         Make a GET or a POST request to the FamilySearch API.
 
         Adds the User-Agent header and sets the response format to JSON.
-        If the data argument is supplied, makes a POST request.
+        If the data argument is supplied, makes a POST request; otherwise,
+        failed requests are retried according to retry_policy, and responses
+        may be served from response_cache after revalidation.
         Returns a file-like object representing the response.
 
         """
-        url = self._add_json_format(url)
+        params = {'dataFormat': 'application/json'}
         if self.logged_in and not self.cookies:
             # Add sessionId parameter to url if cookie is not set
-            url = self._add_query_params(url, sessionId=self.session_id)
+            params['sessionId'] = self.session_id
+        return self._open_url(self._add_query_params(url, params), data)
+
+    def _open_url(self, url, data=None, info=None):
+        """
+        Make a request to a URL that already includes dataFormat and sessionId.
+
+        Otherwise the same as _request. The hooks are run with info, or with
+        a new metrics.RequestInfo if it isn't given.
+
+        """
         request = urllib2.Request(url, data)
         request.add_header('User-Agent', self.agent)
+        if data is not None:
+            send = self._open
+        elif self.response_cache is not None:
+            send = lambda request: self.response_cache.open(request, self._get)
+        else:
+            send = self._get
         try:
-            return self.opener.open(request)
+            return self._send(request, send, info)
         except urllib2.HTTPError, error:
             if error.code == 401:
                 self.logged_in = False
             raise
 
+    def _send(self, request, send, info=None):
+        """
+        Send a request by calling send(request), running the request hooks.
+
+        Returns a file-like object representing the response, which runs the
+        after_body hooks once it has been read to the end.
+        """
+        if info is None:
+            info = RequestInfo(self._endpoint(request.get_full_url()), self.hooks)
+        info.method = request.get_method()
+        info.url = request.get_full_url()
+        info.event('before_send')
+        try:
+            response = send(request)
+        except Exception, error:
+            info.error = error
+            info.status = getattr(error, 'code', None)
+            info.event('on_error')
+            raise
+        info.status = getattr(response, 'code', None)
+        info.event('after_headers')
+        return InstrumentedResponse(response, info)
+
+    def _endpoint(self, url):
+        """
+        Return the label identifying the endpoint of a URL in metrics.
+
+        The label is the path of the endpoint (such as /familytree/v2/person),
+        without the IDs that may follow it, so that requests for different
+        IDs share their metrics.
+        """
+        path = urlparse.urlsplit(url)[2]
+        prefix = urlparse.urlsplit(self.base)[2].rstrip('/')
+        if not path.startswith(prefix + '/'):
+            return path
+        # API paths are /<module>/<version>/<endpoint>[/<IDs>]
+        return prefix + '/'.join(path[len(prefix):].split('/')[:4])
+
+    def _build_url(self, url, subpath=None, params=None):
+        """
+        Build the complete URL for an API request in a single pass.
+
+        url must be an endpoint URL without a query string (such as an entry
+        of familytree_urls). The subpath is appended to its path, and the
+        query string is built from params plus the dataFormat and (if needed)
+        sessionId parameters that _request would add.
+
+        """
+        if subpath:
+            url = url + '/' + subpath
+        query = {}
+        if params:
+            query.update(params)
+        query['dataFormat'] = 'application/json'
+        if self.logged_in and not self.cookies:
+            # Add sessionId parameter to url if cookie is not set
+            query['sessionId'] = self.session_id
+        return url + '?' + urllib.urlencode(query, True)
+
+    def _get_json(self, url, subpath=None, params=None):
+        """
+        Make a GET request to the FamilySearch API and return the decoded JSON response.
+
+        The URL is built by _build_url from an endpoint URL, subpath, and
+        query parameters. Null values are removed from the response while
+        it is decoded, so the after_clean hooks run right after after_decode.
+        Identical requests made concurrently (by several threads) are only
+        sent once; each caller decodes its own copy of the shared body.
+
+        """
+        info = RequestInfo(self._endpoint(url), self.hooks)
+        url = self._build_url(url, subpath, params)
+        if self.coalescer is None:
+            body = self._read_url(url, info)
+        else:
+            body = self.coalescer.call(url, self._read_url, url, info)
+        response = jsoncodec.loads_clean(body)
+        info.event('after_decode')
+        info.event('after_clean')
+        return response
+
+    def _iter_json(self, url, subpath, params, key):
+        """
+        Make a GET request to the FamilySearch API and yield the items of an array in the JSON response.
+
+        Like _get_json, but yields each item of the array stored under key as
+        soon as it has been read and decoded (see jsoncodec.iter_items),
+        instead of decoding the response once it has been read to the end.
+        The after_decode and after_clean hooks run once the response has
+        been read. Requests are never coalesced, since the response isn't
+        read all at once.
+
+        The response is closed when the iterator is exhausted, or when it is
+        closed or garbage collected before then (on Python 2.5 or later).
+        On older versions, callers must exhaust the iterator, or the
+        connection is not released.
+
+        """
+        info = RequestInfo(self._endpoint(url), self.hooks)
+        url = self._build_url(url, subpath, params)
+        response = self._open_url(url, None, info)
+        try:
+            for item in jsoncodec.iter_items(response, key):
+                yield item
+        finally:
+            response.close()
+        info.event('after_decode')
+        info.event('after_clean')
+
+    def _read_url(self, url, info=None):
+        """
+        Make a GET request to a complete API URL and return the response body.
+        """
+        return self._open_url(url, None, info).read()
+
+    def _get(self, request):
+        """
+        Send a GET request, retrying it according to retry_policy.
+        """
+        return self.retry_policy.call(self._open, request)
+
+    def _open(self, request):
+        """
+        Send a request using the opener, waiting for the rate limiter first.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(self.key)
+        return self.opener.open(request)
+
     def _add_subpath(self, url, subpath):
         """
         Add a subpath to the path component of the given URL.
@@ -221,3 +517,4 @@ class FamilySearch(object):
 import identity_v2
 import familytree_v2
 import authorities_v1
+from async_client import AsyncFamilySearch
@@ -0,0 +1,112 @@
+"""
+A module implementing a concurrent FamilySearch API proxy
+
+Main class: AsyncFamilySearch
+
+Python 2 has no asyncio, so instead of coroutines each AsyncFamilySearch
+method schedules the corresponding FamilySearch method on a pool of worker
+threads and immediately returns a Future. Because the calls are delegated to
+a FamilySearch instance, URL building and response processing are exactly
+those of the synchronous methods.
+
+Example usage:
+
+from familysearch import AsyncFamilySearch
+
+fs = AsyncFamilySearch('ClientApp/1.0', 'developer_key', max_workers=32)
+fs.login('username', 'password').result()
+futures = [fs.person(person_id) for person_id in person_ids]
+persons = [future.result() for future in futures]
+fs.close()
+"""
+
+from familysearch import FamilySearch
+import workers
+
+
+class AsyncFamilySearch(object):
+
+    """
+    A FamilySearch API proxy whose methods run concurrently and return Futures
+
+    The constructor accepts the same arguments as FamilySearch (passing on
+    any keyword arguments it doesn't use itself), plus max_workers, the
+    number of requests that may be in flight at once.
+
+    Every public FamilySearch request method is available; each returns a
+    workers.Future whose result() is the value the synchronous method would
+    have returned (or raises the exception it would have raised).
+
+    Public attributes:
+
+    fs -- the underlying (synchronous) FamilySearch instance
+    workers -- the WorkerPool running requests
+    logged_in -- flag indicating whether this proxy instance is logged in
+    session_id -- the current session ID
+    """
+
+    def __init__(self, agent, key, username=None, password=None, session=None,
+                 base='http://www.dev.usys.org', pool_size=None, max_workers=16, **kwargs):
+        """
+        Instantiate an AsyncFamilySearch proxy object.
+
+        Keyword arguments are the same as for FamilySearch, plus:
+        max_workers (optional) -- maximum number of concurrent requests
+                                  (defaults to 16)
+
+        pool_size defaults to max_workers, so that every worker can keep its
+        connection alive. Other keyword arguments (such as transport or
+        typed) are passed on to FamilySearch.
+        """
+        if pool_size is None:
+            pool_size = max_workers
+        self.fs = FamilySearch(agent, key, username, password, session, base,
+                               pool_size=pool_size, **kwargs)
+        self.workers = workers.WorkerPool(max_workers)
+
+    def close(self):
+        """
+        Stop the worker threads of this proxy and of its FamilySearch instance.
+
+        Requests already scheduled are completed first; no more can be made.
+        """
+        self.workers.shutdown()
+        self.fs.workers.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def logged_in(self):
+        """
+        Return whether the underlying FamilySearch proxy is logged in.
+        """
+        return self.fs.logged_in
+
+    @property
+    def session_id(self):
+        """
+        Return the session ID of the underlying FamilySearch proxy.
+        """
+        return self.fs.session_id
+
+
+def _async_method(name):
+    """
+    Create an AsyncFamilySearch method scheduling the named FamilySearch method.
+    """
+    def method(self, *args, **kwargs):
+        return self.workers.submit(getattr(self.fs, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(FamilySearch, name).__doc__
+    return method
+
+for _name in ('login', 'initialize', 'authenticate', 'logout', 'session',
+              'request_token', 'authorize', 'access_token',
+              'person', 'persona', 'version', 'pedigree', 'search', 'match',
+              'place', 'name', 'date', 'culture'):
+    setattr(AsyncFamilySearch, _name, _async_method(_name))
+del _name
@@ -4,11 +4,6 @@ A module implementing the Authorities version 1 API module
 Main class: AuthoritiesV1, meant to be mixed-in to the FamilySearch class
 """
 
-try:
-    import json
-except ImportError:
-    import simplejson as json
-
 class AuthoritiesV1(object):
 
     """
@@ -20,6 +15,8 @@ class AuthoritiesV1(object):
         Set up the URLs for this AuthoritiesV1 object.
         """
         self.authorities_base = self.base + '/authorities/v1/'
+        self.authorities_urls = dict([(endpoint, self.authorities_base + endpoint)
+                                      for endpoint in ('place', 'name', 'date', 'culture')])
 
     def place(self, place_id=None, options={}, **kw_options):
         """
@@ -27,13 +24,11 @@ class AuthoritiesV1(object):
         """
         if isinstance(place_id, list):
             place_id = ','.join(map(str, place_id))
-        url = self.authorities_base + 'place'
         if place_id:
-            url = self._add_subpath(url, str(place_id))
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['places']['place']
-        response = self._remove_nones(response)
+            place_id = str(place_id)
+        params = dict(options)
+        params.update(kw_options)
+        response = self._read_authority('place', place_id, params, lambda body: body['places']['place'])
         if len(response) == 1:
             return response[0]
         else:
@@ -43,13 +38,11 @@ class AuthoritiesV1(object):
         """
         Get an authoritative representation of a name or list of names from FamilySearch.
         """
-        url = self.authorities_base + 'name'
+        params = dict(options)
+        params.update(kw_options)
         if name:
-            kw_options['name'] = name
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['names']['name']
-        response = self._remove_nones(response)
+            params['name'] = name
+        response = self._read_authority('name', None, params, lambda body: body['names']['name'])
         if len(response) == 1:
             return response[0]
         else:
@@ -59,13 +52,11 @@ class AuthoritiesV1(object):
         """
         Get an authoritative representation of a date or list of dates from FamilySearch.
         """
-        url = self.authorities_base + 'date'
+        params = dict(options)
+        params.update(kw_options)
         if date:
-            kw_options['date'] = date
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['dates']['date']
-        response = self._remove_nones(response)
+            params['date'] = date
+        response = self._read_authority('date', None, params, lambda body: body['dates']['date'])
         if len(response) == 1:
             return response[0]
         else:
@@ -77,17 +68,36 @@ class AuthoritiesV1(object):
         """
         if isinstance(culture_id, list):
             culture_id = ','.join(map(str, culture_id))
-        url = self.authorities_base + 'culture'
         if culture_id:
-            url = self._add_subpath(url, str(culture_id))
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['cultures']
-        response = self._remove_nones(response)
+            culture_id = str(culture_id)
+        params = dict(options)
+        params.update(kw_options)
+        response = self._read_authority('culture', culture_id, params, lambda body: body['cultures'])
         if len(response) == 1:
             return response[0]
         else:
             return response
 
+    def _read_authority(self, endpoint, id, params, extract):
+        """
+        Read the list of results of an Authorities request.
+
+        extract returns the list of results from a decoded response. The
+        results are looked up in authorities_cache (if any), then read
+        through the store (if any), keyed by the ID (if any) and the query
+        parameters.
+        """
+        def read(ids=None):
+            return [extract(self._get_json(self.authorities_urls[endpoint], id, params))]
+
+        def read_stored():
+            if self.store is None:
+                return read()[0]
+            return self.store.read(endpoint, [id or ''], params, read)[0]
+
+        if self.authorities_cache is None:
+            return read_stored()
+        return self.authorities_cache.read(endpoint, id, params, read_stored)
+
 from familysearch import FamilySearch
 FamilySearch.__bases__ += (AuthoritiesV1,)
@@ -0,0 +1,681 @@
+"""
+Caching of FamilySearch API responses
+
+Main classes: ResponseCache, PersonCache, AuthoritiesCache, MemoryStorage, DiskStorage
+
+A ResponseCache keeps the bodies of GET responses that carry an ETag or
+Last-Modified header. When the same URL is requested again, the request is
+made conditional (If-None-Match/If-Modified-Since), and if the server answers
+304 Not Modified, the cached body is returned instead of being downloaded
+again. Bodies are kept in a pluggable storage backend: MemoryStorage (an LRU
+bounded by bytes) or DiskStorage (one file per entry).
+
+A PersonCache keeps decoded persons keyed by ID and version. Each lookup
+checks the latest versions of the requested persons with the version
+endpoint (which is much cheaper than the person endpoint and takes more IDs
+per request), and only reads the persons whose version changed.
+
+An AuthoritiesCache memoizes the results of the Authorities endpoints (place,
+name, date, and culture standardization), which hardly ever change, keyed by
+the normalized input and options, without any request at all.
+"""
+
+import httplib
+import os
+import tempfile
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+
+import jsoncodec
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    from hashlib import sha1
+except ImportError:
+    # Python < 2.5
+    from sha import new as sha1
+
+# Support Python < 2.6
+if not hasattr(urlparse, 'parse_qsl'):
+    import cgi
+    urlparse.parse_qsl = cgi.parse_qsl
+
+
+def cache_key(url, ignore=('sessionId',)):
+    """
+    Return a canonical form of a URL for use as a cache key.
+
+    Query parameters are sorted, and parameters named in ignore (by default,
+    the session ID) are removed.
+    """
+    parts = urlparse.urlsplit(url)
+    query = [(name, value)
+             for (name, value) in urlparse.parse_qsl(parts[3], True)
+             if name not in ignore]
+    query.sort()
+    return urlparse.urlunsplit((parts[0], parts[1].lower(), parts[2],
+                                urllib.urlencode(query), ''))
+
+
+class MemoryStorage(object):
+
+    """
+    A thread-safe in-memory LRU mapping bounded by total size and/or entries
+
+    Items are stored with a size; when the total size exceeds max_bytes or the
+    number of items exceeds max_entries, the least recently used items are
+    discarded.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_entries=None):
+        """
+        Instantiate a MemoryStorage.
+
+        Keyword arguments:
+        max_bytes (optional) -- maximum total size of stored items
+                                (defaults to 16 MB; None for no limit)
+        max_entries (optional) -- maximum number of stored items
+                                  (defaults to no limit)
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.bytes = 0
+        self._items = {}
+        # Circular doubly-linked list of [prev, next, key, value, size] links,
+        # from least to most recently used
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, 0]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """
+        Return the item stored for key (marking it as recently used), or default.
+        """
+        self._lock.acquire()
+        try:
+            link = self._items.get(key)
+            if link is None:
+                return default
+            self._unlink(link)
+            self._append(link)
+            return link[3]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value, size=0):
+        """
+        Store an item of the given size, discarding old items if necessary.
+        """
+        self._lock.acquire()
+        try:
+            link = self._items.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+                self.bytes -= link[4]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            link = [None, None, key, value, size]
+            self._items[key] = link
+            self._append(link)
+            self.bytes += size
+            while ((self.max_bytes is not None and self.bytes > self.max_bytes) or
+                   (self.max_entries is not None and len(self._items) > self.max_entries)):
+                oldest = self._root[1]
+                self._unlink(oldest)
+                del self._items[oldest[2]]
+                self.bytes -= oldest[4]
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        """
+        Remove the item stored for key, if any.
+        """
+        self._lock.acquire()
+        try:
+            link = self._items.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+                self.bytes -= link[4]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """
+        Remove all items.
+        """
+        self._lock.acquire()
+        try:
+            self._items.clear()
+            self._root[:] = [self._root, self._root, None, None, 0]
+            self.bytes = 0
+        finally:
+            self._lock.release()
+
+    def _append(self, link):
+        last = self._root[0]
+        link[0] = last
+        link[1] = self._root
+        last[1] = link
+        self._root[0] = link
+
+    def _unlink(self, link):
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+
+
+class DiskStorage(object):
+
+    """
+    A mapping stored on disk, with one pickled file per item
+
+    Items are written atomically, so one directory may be shared by several
+    threads and processes.
+    """
+
+    def __init__(self, directory):
+        """
+        Instantiate a DiskStorage.
+
+        Keyword arguments:
+        directory -- directory holding the stored items (created if needed)
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, key, default=None):
+        """
+        Return the item stored for key, or default.
+        """
+        try:
+            f = open(self._path(key), 'rb')
+        except IOError:
+            return default
+        try:
+            try:
+                (stored_key, value) = pickle.load(f)
+            except Exception:
+                # Ignore partially-written or corrupt files
+                return default
+        finally:
+            f.close()
+        if stored_key != key:
+            return default
+        return value
+
+    def set(self, key, value, size=0):
+        """
+        Store an item (size is ignored).
+        """
+        (fd, temp_path) = tempfile.mkstemp(dir=self.directory)
+        f = os.fdopen(fd, 'wb')
+        try:
+            pickle.dump((key, value), f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        try:
+            os.rename(temp_path, self._path(key))
+        except OSError:
+            # Windows can't rename over an existing file
+            self.delete(key)
+            os.rename(temp_path, self._path(key))
+
+    def delete(self, key):
+        """
+        Remove the item stored for key, if any.
+        """
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """
+        Remove all items.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                os.remove(os.path.join(self.directory, name))
+
+    def _path(self, key):
+        return os.path.join(self.directory, sha1(key).hexdigest() + '.cache')
+
+
+class ResponseCache(object):
+
+    """
+    A cache of GET responses, revalidated with ETag and Last-Modified
+
+    Public attributes (counters, updated as requests are made):
+
+    hits -- requests answered from the cache after a 304 Not Modified
+    misses -- requests for URLs that were not cached
+    revalidations -- conditional requests sent for cached URLs
+    stores -- responses stored in the cache
+    """
+
+    def __init__(self, storage=None):
+        """
+        Instantiate a ResponseCache.
+
+        Keyword arguments:
+        storage (optional) -- storage backend, such as MemoryStorage or
+                              DiskStorage (defaults to MemoryStorage())
+        """
+        if storage is None:
+            storage = MemoryStorage()
+        self.storage = storage
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters to zero.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stores = 0
+
+    def stats(self):
+        """
+        Return a dict of the counters and the hit ratio (the fraction of
+        requests answered from the cache).
+        """
+        lookups = self.misses + self.revalidations
+        ratio = 0.0
+        if lookups:
+            ratio = float(self.hits) / lookups
+        return {'hits': self.hits, 'misses': self.misses,
+                'revalidations': self.revalidations, 'stores': self.stores,
+                'hit_ratio': ratio}
+
+    def open(self, request, send):
+        """
+        Send a GET request through the cache.
+
+        send is called with the (possibly conditional) request and must return
+        a urllib2 response or raise urllib2.HTTPError. Returns a file-like
+        object representing the response.
+        """
+        url = request.get_full_url()
+        key = cache_key(url)
+        entry = self.storage.get(key)
+        if entry is None:
+            self._count('misses')
+        else:
+            self._count('revalidations')
+            if entry['etag']:
+                request.add_header('If-None-Match', entry['etag'])
+            if entry['last_modified']:
+                request.add_header('If-Modified-Since', entry['last_modified'])
+        try:
+            response = send(request)
+        except urllib2.HTTPError, error:
+            if error.code != 304 or entry is None:
+                raise
+            error.close()
+            self._count('hits')
+            return self._response(entry, url)
+        headers = response.info()
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if response.code != 200 or not (etag or last_modified):
+            return response
+        body = response.read()
+        response.close()
+        entry = {'body': body,
+                 'headers': str(headers),
+                 'etag': etag,
+                 'last_modified': last_modified}
+        self.storage.set(key, entry, len(body) + len(entry['headers']))
+        self._count('stores')
+        return self._response(entry, url)
+
+    def _response(self, entry, url):
+        """
+        Return a file-like response object for a cache entry.
+        """
+        headers = httplib.HTTPMessage(StringIO(entry['headers']))
+        response = urllib2.addinfourl(StringIO(entry['body']), headers, url)
+        response.code = 200
+        response.msg = 'OK'
+        return response
+
+    def _count(self, counter):
+        self._lock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self._lock.release()
+
+
+class PersonCache(object):
+
+    """
+    A cache of persons from the family tree, validated by their versions
+
+    Persons are stored under their ID and version. Each call to get reads
+    the latest versions of all requested persons (in batched version
+    requests), then reads only the persons that aren't stored at their
+    latest version (in batched person requests). Stored persons are shared
+    between callers when kept in memory, so they shouldn't be modified.
+
+    Public attributes:
+
+    fs -- FamilySearch instance making the requests
+    storage -- storage backend holding the persons
+    options -- dict of query parameters sent with each person request
+
+    Public attributes (counters, updated as persons are requested):
+
+    hits -- persons returned from the cache
+    misses -- persons read because they weren't cached at their latest version
+    validations -- version requests made (one per call to get)
+    """
+
+    def __init__(self, fs, storage=None, options={}, **kw_options):
+        """
+        Instantiate a PersonCache.
+
+        Keyword arguments:
+        fs -- FamilySearch instance making the requests
+        storage (optional) -- storage backend, such as MemoryStorage or
+                              DiskStorage (defaults to a MemoryStorage of up
+                              to 10000 persons)
+        options (optional) -- dict of query parameters sent with each person
+                              request, such as names='all' (also accepted as
+                              keyword arguments)
+        """
+        if storage is None:
+            storage = MemoryStorage(max_bytes=None, max_entries=10000)
+        self.fs = fs
+        self.storage = storage
+        self.options = dict(options)
+        self.options.update(kw_options)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters to zero.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.validations = 0
+
+    def stats(self):
+        """
+        Return a dict of the counters and the hit ratio (the fraction of
+        persons returned from the cache).
+        """
+        lookups = self.hits + self.misses
+        ratio = 0.0
+        if lookups:
+            ratio = float(self.hits) / lookups
+        return {'hits': self.hits, 'misses': self.misses, 'validations': self.validations,
+                'hit_ratio': ratio}
+
+    def get(self, person_ids):
+        """
+        Return a person or list of persons at their latest versions.
+
+        Returns a single person for a single ID, or a list in the same order
+        as a list of IDs. Persons the API returns no result for (such as
+        deleted ones) are None.
+        """
+        if not isinstance(person_ids, list):
+            return self.get([person_ids])[0]
+        if not person_ids:
+            return []
+        versions = self.fs.version(person_ids)
+        if not isinstance(versions, list):
+            versions = [versions]
+        self._count('validations')
+        # Merged persons are reported (and stored) under their new ID
+        latest = {}
+        for version in versions:
+            latest[version.get('requestedId') or version.get('id')] = (version.get('id'), version.get('version'))
+        persons = {}
+        missing = []
+        missing_ids = set()
+        for person_id in person_ids:
+            (current_id, version) = latest.get(person_id, (person_id, None))
+            person = None
+            if version is not None:
+                person = self.storage.get(self._key(current_id, version))
+            if person is None:
+                if person_id not in missing_ids:
+                    missing_ids.add(person_id)
+                    missing.append(person_id)
+            else:
+                persons[person_id] = person
+                self._count('hits')
+        if missing:
+            read = self.fs.person(missing, self.options)
+            if not isinstance(read, list):
+                read = [read]
+            # Results are matched to the requested IDs by requestedId or id
+            # (or the ID a merged person's version was reported under), not
+            # by position
+            requested = dict([(latest.get(person_id, (person_id, None))[0], person_id) for person_id in missing])
+            for person_id in missing:
+                requested[person_id] = person_id
+            for person in read:
+                person_id = requested.get(_requested_id(person)) or requested.get(_person_id(person))
+                if person_id is None or person_id in persons:
+                    continue
+                (current_id, version) = latest.get(person_id, (person_id, None))
+                version = _person_version(person) or version
+                if version is not None:
+                    self.storage.set(self._key(_person_id(person) or current_id, version), person, 1)
+                persons[person_id] = person
+            for person_id in missing:
+                self._count('misses')
+        return [persons.get(person_id) for person_id in person_ids]
+
+    def _key(self, person_id, version):
+        return '%s@%s' % (person_id, version)
+
+    def _count(self, counter):
+        self._lock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self._lock.release()
+
+
+def _person_id(person):
+    """
+    Return the ID of a person (a dict or model.Person).
+    """
+    if isinstance(person, dict):
+        return person.get('id')
+    return getattr(person, 'id', None)
+
+
+def _requested_id(person):
+    """
+    Return the ID a person (a dict or model.Person) was requested with, if the response says so, or None.
+    """
+    if isinstance(person, dict):
+        return person.get('requestedId')
+    return (getattr(person, 'extra', None) or {}).get('requestedId')
+
+
+def _person_version(person):
+    """
+    Return the version of a person (a dict or model.Person).
+    """
+    if isinstance(person, dict):
+        return person.get('version')
+    return getattr(person, 'version', None)
+
+
+# Query parameters of the Authorities endpoints holding text to standardize
+AUTHORITIES_TEXT_PARAMS = ('place', 'name', 'date')
+
+
+def _utf8(value):
+    """
+    Return a value as a UTF-8 byte string.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def normalize_query(value):
+    """
+    Return a text to standardize with runs of whitespace collapsed, or any other value unchanged.
+
+    Case is kept, since the Authorities API may treat texts differing only
+    in case as different queries.
+    """
+    if not isinstance(value, basestring):
+        return value
+    return ' '.join(value.split())
+
+
+def authorities_key(endpoint, id, params):
+    """
+    Return a cache key for an Authorities request.
+
+    The texts to standardize (place, name, and date) are normalized with
+    normalize_query; other options (such as locale and filter) are kept
+    as they are.
+    """
+    query = []
+    for (name, value) in params.items():
+        if not isinstance(value, list):
+            value = [value]
+        if name in AUTHORITIES_TEXT_PARAMS:
+            value = [normalize_query(v) for v in value]
+        query.extend([(_utf8(name), _utf8(v)) for v in value])
+    query.sort()
+    return '%s/%s?%s' % (endpoint, (id or '').strip(), urllib.urlencode(query))
+
+
+class AuthoritiesCache(object):
+
+    """
+    A memo of Authorities results, keyed by normalized input and options
+
+    Results are kept in memory (an LRU bounded by entries and/or bytes) and,
+    optionally, in a second storage backend (such as DiskStorage or
+    store.SQLiteStore) that outlives the process: results missing from
+    memory are looked up there before being requested. Results are shared
+    between callers, so they shouldn't be modified, and a result cached for
+    one spelling of a text (such as 'Paris,  France') is returned for the
+    others ('paris, france').
+
+    Public attributes:
+
+    memory -- MemoryStorage holding the results in memory
+    storage -- second storage backend, or None
+    ttl -- number of seconds results are kept (None for no expiry)
+
+    Public attributes (counters, updated as results are requested):
+
+    hits -- results returned from memory
+    storage_hits -- results returned from the second storage backend
+    misses -- results that had to be requested
+    """
+
+    def __init__(self, max_entries=100000, max_bytes=None, ttl=None, storage=None):
+        """
+        Instantiate an AuthoritiesCache.
+
+        Keyword arguments:
+        max_entries (optional) -- maximum number of results kept in memory
+                                  (defaults to 100000; None for no limit)
+        max_bytes (optional) -- maximum total size of the results kept in
+                                memory, as encoded JSON (defaults to no limit)
+        ttl (optional) -- number of seconds results are kept (defaults to no
+                          expiry)
+        storage (optional) -- second storage backend, such as DiskStorage or
+                              store.SQLiteStore, to persist results to
+                              (defaults to none)
+        """
+        self.memory = MemoryStorage(max_bytes=max_bytes, max_entries=max_entries)
+        self.storage = storage
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters to zero.
+        """
+        self.hits = 0
+        self.storage_hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Return a dict of the counters, the number and size of the results in
+        memory, and the hit ratio (the fraction of results returned without
+        a request).
+        """
+        lookups = self.hits + self.storage_hits + self.misses
+        ratio = 0.0
+        if lookups:
+            ratio = float(self.hits + self.storage_hits) / lookups
+        return {'hits': self.hits, 'storage_hits': self.storage_hits, 'misses': self.misses,
+                'entries': len(self.memory), 'bytes': self.memory.bytes, 'hit_ratio': ratio}
+
+    def read(self, endpoint, id, params, fetch):
+        """
+        Return the results of an Authorities request, calling fetch() to request them if needed.
+        """
+        key = authorities_key(endpoint, id, params)
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None and (entry[0] is None or entry[0] > now):
+            self._count('hits')
+            return entry[1]
+        if self.storage is not None:
+            entry = self.storage.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self.memory.set(key, entry, entry[2])
+                self._count('storage_hits')
+                return entry[1]
+        results = fetch()
+        expires = None
+        if self.ttl is not None:
+            expires = now + self.ttl
+        entry = (expires, results, len(jsoncodec.dumps(results)))
+        self.memory.set(key, entry, entry[2])
+        if self.storage is not None:
+            self.storage.set(key, entry, entry[2])
+        self._count('misses')
+        return results
+
+    def clear(self):
+        """
+        Remove all results from memory (but not from the second storage backend).
+        """
+        self.memory.clear()
+
+    def _count(self, counter):
+        self._lock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self._lock.release()
@@ -0,0 +1,244 @@
+"""
+Recording and replaying FamilySearch API traffic
+
+Main classes: Cassette, RecordingTransport, ReplayTransport
+
+A RecordingTransport wraps another transport and saves every request and
+response passing through it to a cassette file. A ReplayTransport later
+serves the recorded responses from the cassette, without any network, so
+that runs can be reproduced exactly (for example, to benchmark offline).
+
+Cassettes are gzip-compressed files holding one JSON-encoded interaction per
+line. Interactions are indexed by request method and canonical URL (with
+sorted query parameters and without the session ID); when a URL was recorded
+several times, its responses are replayed in the order they were recorded.
+Only canonical URLs are written, so cassettes never contain session IDs.
+
+Example usage:
+
+from familysearch import FamilySearch
+from familysearch.cassette import RecordingTransport, ReplayTransport
+
+recorder = RecordingTransport('crawl.cassette')
+fs = FamilySearch('ClientApp/1.0', 'developer_key', transport=recorder)
+# [make requests]
+recorder.close()
+
+fs = FamilySearch('ClientApp/1.0', 'developer_key',
+                  transport=ReplayTransport('crawl.cassette', latency=0.05))
+"""
+
+import base64
+import gzip
+import httplib
+import threading
+import time
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import jsoncodec
+from cache import cache_key
+from transport import PooledTransport, Response, Transport
+
+
+class CassetteMiss(KeyError):
+
+    """
+    Raised when a request being replayed was not recorded
+    """
+
+
+def interaction_key(method, url):
+    """
+    Return the key indexing a request in a cassette.
+    """
+    return '%s %s' % (method, cache_key(url))
+
+
+class Cassette(object):
+
+    """
+    A file of recorded interactions, indexed by request
+
+    Public attributes:
+
+    path -- path of the cassette file
+    interactions -- dict mapping interaction keys to lists of interactions
+    """
+
+    def __init__(self, path):
+        """
+        Instantiate a Cassette, loading the file at path if it exists.
+        """
+        self.path = path
+        self.interactions = {}
+        self._file = None
+        self._lock = threading.Lock()
+        try:
+            f = gzip.open(path, 'rb')
+        except IOError:
+            # The file doesn't exist yet
+            return
+        try:
+            try:
+                for line in f:
+                    interaction = jsoncodec.loads(line)
+                    self.interactions.setdefault(interaction['key'], []).append(interaction)
+            except (IOError, EOFError):
+                # Keep what could be read from a cassette that wasn't closed
+                pass
+        finally:
+            f.close()
+
+    def __len__(self):
+        return sum([len(interactions) for interactions in self.interactions.values()])
+
+    def append(self, interaction):
+        """
+        Add an interaction, appending it to the cassette file.
+
+        The file is kept open (and flushed after each interaction) until
+        close is called.
+        """
+        line = jsoncodec.dumps(interaction, separators=(',', ':')) + '\n'
+        self._lock.acquire()
+        try:
+            self.interactions.setdefault(interaction['key'], []).append(interaction)
+            if self._file is None:
+                self._file = gzip.open(self.path, 'ab')
+            self._file.write(line)
+            self._file.flush()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """
+        Close the cassette file.
+        """
+        self._lock.acquire()
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        finally:
+            self._lock.release()
+
+
+def encode_body(body):
+    """
+    Return a dict representing a body (text if possible) for JSON encoding.
+    """
+    try:
+        return {'body': body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'body_base64': base64.b64encode(body)}
+
+
+def decode_body(interaction):
+    """
+    Return the body stored in an interaction as a byte string.
+    """
+    if 'body_base64' in interaction:
+        return base64.b64decode(interaction['body_base64'])
+    return interaction['body'].encode('utf-8')
+
+
+class RecordingTransport(Transport):
+
+    """
+    A transport recording every interaction passing through another transport
+    """
+
+    def __init__(self, path, transport=None):
+        """
+        Instantiate a RecordingTransport.
+
+        Keyword arguments:
+        path -- path of the cassette file (appended to if it exists)
+        transport (optional) -- transport actually sending requests
+                                (defaults to a PooledTransport)
+        """
+        if transport is None:
+            transport = PooledTransport()
+        self.transport = transport
+        self.cassette = Cassette(path)
+
+    def send(self, request):
+        response = self.transport.send(request)
+        body = response.body.read()
+        response.body.close()
+        url = cache_key(request.get_full_url())
+        interaction = {'key': interaction_key(request.get_method(), url),
+                       'method': request.get_method(),
+                       'url': url,
+                       'status': response.status,
+                       'reason': response.reason,
+                       'headers': str(response.headers)}
+        interaction.update(encode_body(body))
+        self.cassette.append(interaction)
+        return Response(response.status, response.reason, response.headers, StringIO(body))
+
+    def close(self):
+        self.cassette.close()
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+
+    """
+    A transport serving recorded responses from a cassette
+
+    Each recorded response for a request is served in turn; once they have
+    all been served, the last one is repeated. Requests that weren't recorded
+    raise CassetteMiss.
+    """
+
+    def __init__(self, path, latency=0):
+        """
+        Instantiate a ReplayTransport.
+
+        Keyword arguments:
+        path -- path of the cassette file
+        latency (optional) -- simulated latency in seconds added to each
+                              request, or a function returning it (given the
+                              interaction being replayed); defaults to 0
+        """
+        self.cassette = Cassette(path)
+        self.latency = latency
+        self.sleep = time.sleep
+        self._served = {}
+        self._lock = threading.Lock()
+
+    def send(self, request):
+        key = interaction_key(request.get_method(), request.get_full_url())
+        interactions = self.cassette.interactions.get(key)
+        if not interactions:
+            raise CassetteMiss('no recorded response for %s' % key)
+        self._lock.acquire()
+        try:
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+        finally:
+            self._lock.release()
+        interaction = interactions[min(index, len(interactions) - 1)]
+        latency = self.latency
+        if callable(latency):
+            latency = latency(interaction)
+        if latency:
+            self.sleep(latency)
+        headers = httplib.HTTPMessage(StringIO(interaction['headers']))
+        return Response(interaction['status'], interaction['reason'], headers,
+                        StringIO(decode_body(interaction)))
+
+    def rewind(self):
+        """
+        Start serving each request's recorded responses from the beginning again.
+        """
+        self._lock.acquire()
+        try:
+            self._served.clear()
+        finally:
+            self._lock.release()
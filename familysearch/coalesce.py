@@ -0,0 +1,73 @@
+"""
+Coalescing of identical concurrent requests
+
+Main class: SingleFlight
+"""
+
+import sys
+import threading
+
+from workers import Future
+
+
+class SingleFlight(object):
+
+    """
+    Run at most one call at a time for each key, sharing its result
+
+    If a call for a key is made while another call for the same key is still
+    running, the second caller waits for the first call to finish and gets its
+    result (or exception) instead of running the call again.
+
+    Public attributes (counters, updated as calls are made):
+
+    calls -- number of calls actually run
+    shared -- number of callers that shared the result of a running call
+    """
+
+    def __init__(self):
+        """
+        Instantiate a SingleFlight.
+        """
+        self.calls = 0
+        self.shared = 0
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def call(self, key, fn, *args, **kwargs):
+        """
+        Return fn(*args, **kwargs), or the result of a running call with the same key.
+        """
+        self._lock.acquire()
+        try:
+            future = self._running.get(key)
+            if future is None:
+                future = self._running[key] = Future()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        finally:
+            self._lock.release()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except:
+            exc_info = sys.exc_info()
+            self._finish(key)
+            future.set_exc_info(exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key):
+        self._lock.acquire()
+        try:
+            del self._running[key]
+        finally:
+            self._lock.release()
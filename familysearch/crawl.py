@@ -0,0 +1,456 @@
+"""
+A module implementing concurrent crawls of the family tree
+
+Main classes: AncestorCrawler, DescendantCrawler
+
+A crawl starts from a set of root persons and walks their relationships
+generation by generation. Persons whose relatives still need to be read
+form the frontier, which is requested in batches (several IDs per request),
+with a bounded number of requests in flight on the FamilySearch instance's
+worker pool. Each person is reported once, as soon as the response
+containing it has been read, with the generation and path through which it
+was first reached.
+
+Example usage:
+
+from familysearch.crawl import AncestorCrawler
+
+crawler = AncestorCrawler(fs, generations=12, max_concurrency=8)
+for ancestor in crawler.crawl(['ABCD-123', 'EFGH-456']):
+    print ancestor.generation, ancestor.id, ' > '.join(ancestor.path)
+"""
+
+import heapq
+import Queue
+
+import model
+
+
+def _person_id(person):
+    """
+    Return the ID of a person (a dict or model.Person).
+    """
+    if isinstance(person, model.Model):
+        return person.id
+    return person.get('id')
+
+
+def _requested_id(person):
+    """
+    Return the ID a person (a dict or model.Person) was requested with, if the response says so, or None.
+    """
+    if isinstance(person, model.Model):
+        return (person.extra or {}).get('requestedId')
+    return person.get('requestedId')
+
+
+def _child_ids(person):
+    """
+    Return the IDs of the children in all families of a person (a dict or model.Person).
+    """
+    ids = []
+    if isinstance(person, model.Model):
+        for family in person.families or []:
+            ids.extend([child.id for child in family.children or []])
+    else:
+        for family in person.get('families') or []:
+            ids.extend([child['id'] for child in family.get('child', [])])
+    return ids
+
+
+def _parent_ids(person):
+    """
+    Return the IDs of the first set of parents of a person (a dict or model.Person).
+    """
+    if isinstance(person, model.Model):
+        if person.parents and person.parents[0].parents:
+            return [parent.id for parent in person.parents[0].parents]
+        return []
+    parents = person.get('parents')
+    if parents:
+        return [parent['id'] for parent in parents[0].get('parent', [])]
+    return []
+
+
+class Found(object):
+
+    """
+    A person found by a crawl
+
+    Public attributes:
+
+    id -- person ID
+    generation -- number of generations between the root and this person
+                  (0 for the roots themselves)
+    person -- the person, as returned by the FamilySearch instance (a dict,
+              or a model.Person if it is typed)
+    path -- tuple of the person IDs from the root to this person (inclusive)
+    root -- person ID of the root this person was reached from
+    """
+
+    __slots__ = ('generation', 'person', '_node')
+
+    def __init__(self, node, generation, person):
+        self._node = node
+        self.generation = generation
+        self.person = person
+
+    def _get_id(self):
+        return self._node[0]
+    id = property(_get_id)
+
+    def _get_path(self):
+        # Paths are kept as (id, previous node) links shared between relatives
+        path = []
+        node = self._node
+        while node is not None:
+            path.append(node[0])
+            node = node[1]
+        path.reverse()
+        return tuple(path)
+    path = property(_get_path)
+
+    def _get_root(self):
+        node = self._node
+        while node[1] is not None:
+            node = node[1]
+        return node[0]
+    root = property(_get_root)
+
+    def __repr__(self):
+        return '%s(%r, generation=%d)' % (self.__class__.__name__, self.id, self.generation)
+
+
+class Ancestor(Found):
+
+    """
+    An ancestor found by an AncestorCrawler
+    """
+
+    __slots__ = ()
+
+
+class Crawler(object):
+
+    """
+    Base class for crawlers requesting their frontier in concurrent batches
+
+    Subclasses schedule persons with _schedule, read a batch in _request
+    (called on a worker thread), and turn its result into found persons in
+    _process (called on the crawling thread, which alone updates the set of
+    seen persons and the frontier).
+
+    Public attributes:
+
+    fs -- FamilySearch instance making the requests
+    max_concurrency -- maximum number of requests in flight at once
+    batch_size -- maximum number of persons requested at once
+    depth_first -- flag indicating whether the deepest generations of the
+                   frontier are requested first (keeping the frontier small)
+                   instead of the shallowest
+    max_frontier -- maximum number of persons in the frontier, or None for
+                    no limit
+    requests -- number of requests made by the current crawl
+    truncated -- number of persons the current crawl did not request (nor
+                 walk beyond) because the frontier was full
+    """
+
+    def __init__(self, fs, max_concurrency=None, batch_size=None, depth_first=False, max_frontier=None):
+        if max_concurrency is None:
+            max_concurrency = max(1, fs.workers.max_workers)
+        self.fs = fs
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.depth_first = depth_first
+        self.max_frontier = max_frontier
+        self.requests = 0
+        self.truncated = 0
+        self._frontier = []
+        self._seen = set()
+        self._sequence = 0
+
+    def _start(self, person_ids):
+        """
+        Reset the crawl state and schedule the roots.
+        """
+        if not isinstance(person_ids, list):
+            person_ids = [person_ids]
+        self.requests = 0
+        self.truncated = 0
+        self._frontier = []
+        self._seen = set()
+        for person_id in person_ids:
+            if person_id not in self._seen:
+                self._seen.add(person_id)
+                self._schedule((person_id, None), 0)
+
+    def _schedule(self, node, generation):
+        """
+        Add a person (the last link of a path) to the frontier, unless it is full.
+        """
+        if self.max_frontier is not None and len(self._frontier) >= self.max_frontier:
+            self.truncated += 1
+            return
+        self._sequence += 1
+        priority = (self.depth_first and [-generation] or [generation])[0]
+        heapq.heappush(self._frontier, (priority, self._sequence, node, generation))
+
+    def _next_batch(self, size):
+        """
+        Remove up to size (node, generation) pairs from the frontier, in priority order.
+        """
+        batch = []
+        while self._frontier and len(batch) < size:
+            (priority, sequence, node, generation) = heapq.heappop(self._frontier)
+            batch.append((node, generation))
+        return batch
+
+    def _run(self, batch_size):
+        """
+        Request the frontier until it is empty, yielding what each response adds.
+
+        New requests are sent before the persons found by the last one are
+        yielded, so that the requests proceed while the caller works.
+        """
+        done = Queue.Queue()
+        pending = 0
+        found = []
+        while True:
+            while self._frontier and pending < self.max_concurrency:
+                batch = self._next_batch(batch_size)
+                self.requests += 1
+                future = self.fs.workers.submit(self._request, batch)
+                future.add_done_callback(lambda future, batch=batch: done.put((batch, future)))
+                pending += 1
+            for item in found:
+                yield item
+            if not pending:
+                break
+            (batch, future) = done.get()
+            pending -= 1
+            found = self._process(batch, future.result())
+
+    def _request(self, batch):
+        raise NotImplementedError
+
+    def _process(self, batch, result):
+        raise NotImplementedError
+
+
+class AncestorCrawler(Crawler):
+
+    """
+    A crawler walking up the ancestors of root persons with pedigree requests
+
+    Each pedigree request returns several generations of ancestors at once.
+    Parents beyond the last generation of a response form the frontier and
+    are requested in the next round. Only the first set of parents of each
+    person is followed. Ancestors reachable through more than one line (or
+    from more than one root) are reported once, and their ancestors are only
+    requested once.
+
+    The roots themselves are reported as generation 0. Persons that haven't
+    been read yet are only kept as IDs, so the crawl's memory grows with the
+    number of ancestors seen (plus the frontier, which depth_first keeps to
+    a few responses' worth), not with the size of the persons. max_frontier
+    puts a hard limit on the frontier: parents found while it is full are
+    not requested (and their ancestors are not found), and are counted in
+    truncated.
+
+    Public attributes (in addition to those of Crawler):
+
+    generations -- number of generations to walk up from each root
+    pedigree_generations -- number of generations requested per pedigree
+    """
+
+    def __init__(self, fs, generations, pedigree_generations=4, max_concurrency=None,
+                 batch_size=None, depth_first=False, max_frontier=None):
+        """
+        Instantiate an AncestorCrawler.
+
+        Keyword arguments:
+        fs -- FamilySearch instance making the requests (its pedigree results
+              may be dicts or model objects)
+        generations -- number of generations to walk up from each root
+        pedigree_generations (optional) -- number of generations of
+                                           ancestors requested per pedigree
+                                           (defaults to 4)
+        max_concurrency (optional) -- maximum number of pedigree requests in
+                                      flight at once (defaults to the
+                                      number of fs.workers)
+        batch_size (optional) -- maximum number of persons whose pedigrees
+                                 are requested at once (defaults to
+                                 fs.id_limits['pedigree'])
+        depth_first (optional) -- whether to request the deepest persons of
+                                  the frontier first, keeping it small
+                                  (defaults to False: shallowest first, so
+                                  that each ancestor is found through its
+                                  shortest path)
+        max_frontier (optional) -- maximum number of persons waiting to be
+                                   requested; parents beyond it are left
+                                   out of the crawl (defaults to no limit)
+        """
+        Crawler.__init__(self, fs, max_concurrency, batch_size, depth_first, max_frontier)
+        self.generations = generations
+        self.pedigree_generations = pedigree_generations
+
+    def crawl(self, person_ids):
+        """
+        Walk up the ancestors of a person or list of persons, yielding an Ancestor for each.
+
+        Ancestors are yielded as soon as the pedigree containing them has
+        been read, so they are not in generation order. Crawls of the same
+        crawler must not overlap.
+        """
+        self._start(person_ids)
+        return self._run(self.batch_size or self.fs.id_limits['pedigree'])
+
+    def _request(self, batch):
+        ids = [node[0] for (node, generation) in batch]
+        lowest = min([generation for (node, generation) in batch])
+        ancestors = min(self.pedigree_generations, self.generations - lowest)
+        pedigrees = self.fs.pedigree(ids, ancestors=ancestors)
+        if not isinstance(pedigrees, list):
+            pedigrees = [pedigrees]
+        return pedigrees
+
+    def _process(self, batch, pedigrees):
+        requested = dict([(node[0], (node, generation)) for (node, generation) in batch])
+        found = []
+        for pedigree in pedigrees:
+            if isinstance(pedigree, model.Model):
+                (pedigree_id, requested_id, persons) = (pedigree.id, pedigree.requested_id, pedigree.persons)
+            else:
+                (pedigree_id, requested_id, persons) = (pedigree.get('id'), pedigree.get('requestedId'),
+                                                        pedigree.get('persons'))
+            (node, generation) = requested.get(requested_id) or requested.get(pedigree_id) or (None, None)
+            if node is None:
+                continue
+            if pedigree_id is not None and pedigree_id != node[0]:
+                # The requested person has been merged into another one
+                if pedigree_id in self._seen:
+                    continue
+                self._seen.add(pedigree_id)
+                node = (pedigree_id, node[1])
+            persons = dict([(_person_id(person), person) for person in persons or []])
+            queue = [(node, generation)]
+            for (node, generation) in queue:
+                person = persons.get(node[0])
+                if person is None:
+                    continue
+                found.append(Ancestor(node, generation, person))
+                if generation >= self.generations:
+                    continue
+                for parent_id in _parent_ids(person):
+                    if parent_id in self._seen:
+                        continue
+                    self._seen.add(parent_id)
+                    if parent_id in persons:
+                        queue.append(((parent_id, node), generation + 1))
+                    else:
+                        self._schedule((parent_id, node), generation + 1)
+        return found
+
+
+class Descendant(Found):
+
+    """
+    A descendant found by a DescendantCrawler
+    """
+
+    __slots__ = ()
+
+
+class DescendantCrawler(Crawler):
+
+    """
+    A crawler walking down the descendants of root persons with person requests
+
+    Each generation is read breadth first with person requests for batches
+    of IDs (asking for the children in every family of each person), the
+    next generation being scheduled as each response is read. Children
+    shared by several families (or reachable from several roots, through
+    pedigree collapse) are reported once and only requested once.
+
+    The roots themselves are reported as generation 0.
+
+    Public attributes (in addition to those of Crawler):
+
+    generations -- number of generations to walk down from each root, or
+                   None for all of them
+    options -- dict of query parameters sent with each person request
+    """
+
+    def __init__(self, fs, generations=None, options={}, max_concurrency=None, batch_size=None,
+                 depth_first=False, max_frontier=None):
+        """
+        Instantiate a DescendantCrawler.
+
+        Keyword arguments:
+        fs -- FamilySearch instance making the requests (its person results
+              may be dicts or model objects)
+        generations (optional) -- number of generations to walk down from
+                                  each root (defaults to all of them)
+        options (optional) -- dict of query parameters sent with each person
+                              request (children='all' is always added)
+        max_concurrency (optional) -- maximum number of person requests in
+                                      flight at once (defaults to the
+                                      number of fs.workers)
+        batch_size (optional) -- maximum number of persons requested at once
+                                 (defaults to fs.id_limits['person'])
+        depth_first (optional) -- whether to request the deepest persons of
+                                  the frontier first, keeping it small
+                                  (defaults to False)
+        max_frontier (optional) -- maximum number of persons waiting to be
+                                   requested; children beyond it are left
+                                   out of the crawl (defaults to no limit)
+        """
+        Crawler.__init__(self, fs, max_concurrency, batch_size, depth_first, max_frontier)
+        self.generations = generations
+        self.options = dict(options)
+        self.options['children'] = 'all'
+
+    def crawl(self, person_ids):
+        """
+        Walk down the descendants of a person or list of persons, yielding a Descendant for each.
+
+        Descendants are yielded as soon as they have been read, mostly (but
+        not strictly) in generation order. Crawls of the same crawler must
+        not overlap.
+        """
+        self._start(person_ids)
+        return self._run(self.batch_size or self.fs.id_limits['person'])
+
+    def _request(self, batch):
+        persons = self.fs.person([node[0] for (node, generation) in batch], self.options)
+        if not isinstance(persons, list):
+            persons = [persons]
+        return persons
+
+    def _process(self, batch, persons):
+        # Persons are matched to the batch by ID rather than by position;
+        # requested persons missing from the response (such as deleted
+        # ones) are not reported, and persons that weren't requested are
+        # ignored
+        requested = dict([(node[0], (node, generation)) for (node, generation) in batch])
+        found = []
+        for person in persons:
+            person_id = _person_id(person)
+            (node, generation) = (requested.pop(_requested_id(person), None) or requested.pop(person_id, None) or
+                                  (None, None))
+            if node is None:
+                continue
+            if person_id is not None and person_id != node[0]:
+                # The requested person has been merged into another one
+                if person_id in self._seen:
+                    continue
+                self._seen.add(person_id)
+                node = (person_id, node[1])
+            found.append(Descendant(node, generation, person))
+            if self.generations is not None and generation >= self.generations:
+                continue
+            for child_id in _child_ids(person):
+                if child_id not in self._seen:
+                    self._seen.add(child_id)
+                    self._schedule((child_id, node), generation + 1)
+        return found
@@ -1,7 +1,4 @@
-try:
-    import json
-except ImportError:
-    import simplejson as json
+from familysearch import jsoncodec as json
 
 
 # Define `all` function for Python < 2.5
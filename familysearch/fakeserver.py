@@ -0,0 +1,812 @@
+"""
+A synthetic, deterministic stand-in for the FamilySearch API
+
+Main classes: SyntheticTree, FakeServer
+
+FakeServer is a WSGI application implementing the Family Tree version 2,
+Authorities version 1, and Identity version 2 endpoints used by this module,
+returning JSON shaped like the real API's (and like the fixtures in
+familysearch/tests). Its data comes from a SyntheticTree: a family tree of
+any size (millions of persons) generated lazily from a seed, so the same
+seed always gives the same persons, pedigrees, versions, personas, search
+results, and matches, without storing anything.
+
+The server can also simulate latency, random errors (HTTP 503), and
+throttling (HTTP 429 with a Retry-After header) for load testing.
+
+Example usage:
+
+from familysearch import FamilySearch
+from familysearch.fakeserver import FakeServer
+from familysearch.transport import WSGITransport
+
+# In-process, without sockets
+server = FakeServer(size=1000000, seed=42)
+fs = FamilySearch('ClientApp/1.0', 'developer_key', transport=WSGITransport(server))
+fs.login('username', 'password')
+pedigree = fs.pedigree(ancestors=6)
+
+# Or on a local socket, from the command line:
+#   python -m familysearch.fakeserver --port 8080 --size 1000000 --latency 0.05
+fs = FamilySearch('ClientApp/1.0', 'developer_key', base='http://localhost:8080')
+
+The tree is built generation by generation. The first generation has
+founders persons; every couple has four children, so each generation is
+twice the size of the one before. Men have even person numbers and women odd
+ones. Each man is married to a woman of his generation, chosen by a seeded
+permutation, and children take their father's surname. Persons are linked to their
+relatives in person responses when the parents, families, or children
+option is given (for example, fs.person(id, parents='summary')), and
+always in pedigree responses.
+"""
+
+import base64
+import datetime
+import random
+import sys
+import threading
+import time
+import urlparse
+
+from collections import deque
+
+# Support Python < 2.6
+if not hasattr(urlparse, 'parse_qs'):
+    import cgi
+    urlparse.parse_qs = cgi.parse_qs
+
+import jsoncodec
+from ratelimit import TokenBucket
+
+GIVEN_NAMES = {
+    'Male': ['John', 'William', 'James', 'George', 'Charles', 'Thomas', 'Joseph',
+             'Henry', 'Robert', 'Edward', 'Samuel', 'David', 'Richard', 'Peter',
+             'Daniel', 'Benjamin', 'Isaac', 'Jacob', 'Walter', 'Albert'],
+    'Female': ['Mary', 'Elizabeth', 'Sarah', 'Margaret', 'Ann', 'Jane', 'Catherine',
+               'Alice', 'Emma', 'Hannah', 'Ellen', 'Martha', 'Susan', 'Eliza',
+               'Emily', 'Harriet', 'Rebecca', 'Agnes', 'Clara', 'Lucy'],
+}
+
+SURNAMES = ['Smith', 'Jones', 'Williams', 'Brown', 'Taylor', 'Davies', 'Wilson',
+            'Evans', 'Thomas', 'Johnson', 'Roberts', 'Walker', 'Wright', 'Robinson',
+            'Thompson', 'White', 'Hughes', 'Edwards', 'Green', 'Hall', 'Wood',
+            'Harris', 'Lewis', 'Martin', 'Jackson', 'Clarke', 'Clark', 'Turner',
+            'Hill', 'Scott', 'Cooper', 'Morris', 'Ward', 'Moore', 'King', 'Watson',
+            'Baker', 'Harrison', 'Morgan', 'Patel', 'Young', 'Allen', 'Mitchell',
+            'James', 'Anderson', 'Phillips', 'Lee', 'Bell', 'Parker', 'Davis',
+            'Jensen', 'Nielsen', 'Hansen', 'Pedersen', 'Andersen', 'Larsen',
+            'Olsen', 'Christensen', 'Petersen', 'Rasmussen', 'Mueller', 'Schmidt',
+            'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Schulz',
+            'Hoffmann']
+
+# (official name, normalized name, place ID, ISO code)
+PLACES = [('London', 'London, London, England', '5061446', 'GB-ENG'),
+          ('Paris', 'Paris, Ville de Paris, France', '5061509', 'FR'),
+          ('Liverpool', 'Liverpool, Lancashire, England', '5062101', 'GB-ENG'),
+          ('Manchester', 'Manchester, Lancashire, England', '5062122', 'GB-ENG'),
+          ('Copenhagen', 'Copenhagen, Denmark', '5070417', 'DK'),
+          ('Oslo', 'Oslo, Norway', '5070562', 'NO'),
+          ('Hamburg', 'Hamburg, Germany', '5071207', 'DE'),
+          ('Boston', 'Boston, Suffolk, Massachusetts, United States', '5080041', 'US-MA'),
+          ('Salt Lake City', 'Salt Lake City, Salt Lake, Utah, United States', '5080777', 'US-UT'),
+          ('Philadelphia', 'Philadelphia, Philadelphia, Pennsylvania, United States', '5080593', 'US-PA')]
+
+CULTURES = ['North America', 'Latin America', 'Western Europe', 'Eastern Europe',
+            'Scandinavia', 'British Isles', 'East Asia', 'South Asia', 'Africa',
+            'Oceania']
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+
+# A prime used to pair the men and women of each generation
+PAIRING_MULTIPLIER = 2654435761
+
+ID_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+ID_SPACE = 36 ** 7
+
+# Julian day number of datetime.date.min, to convert ordinals to astro dates
+JULIAN_DAY_OFFSET = 1721425
+
+FAMILYTREE_VERSION = '2.7.20110406.1514'
+AUTHORITIES_VERSION = '1.8.20110324.1454'
+IDENTITY_VERSION = '2.7.20110324.1454'
+
+
+def _inverse(a, m):
+    """
+    Return the inverse of a modulo m.
+    """
+    (r0, r1, t0, t1) = (m, a % m, 0, 1)
+    while r1:
+        q = r0 // r1
+        (r0, r1, t0, t1) = (r1, r0 - q * r1, t1, t0 - q * t1)
+    return t0 % m
+
+
+class SyntheticTree(object):
+
+    """
+    A deterministic family tree generated lazily from a seed
+
+    Persons are numbered from 0 to size - 1, and identified by IDs (like
+    'KWCB-HZN') that are a scrambled encoding of their numbers.
+
+    Public attributes:
+
+    size -- number of persons in the tree
+    founders -- number of persons in the first generation
+    seed -- seed from which everything about the tree is generated
+    versions -- dict mapping person numbers to versions overriding the
+                generated ones (see touch)
+    """
+
+    def __init__(self, size=1000000, founders=1000, seed=0):
+        """
+        Instantiate a SyntheticTree.
+
+        Keyword arguments:
+        size (optional) -- number of persons (defaults to 1000000)
+        founders (optional) -- number of persons in the first generation,
+                               rounded up to a multiple of 4 (defaults to 1000)
+        seed (optional) -- seed for generating the tree (defaults to 0)
+        """
+        self.size = size
+        self.founders = max(4, (founders + 3) // 4 * 4)
+        self.seed = seed
+        self.versions = {}
+        rng = random.Random(seed)
+        self._id_multiplier = rng.randrange(ID_SPACE // 3, ID_SPACE) | 1
+        while self._id_multiplier % 3 == 0:
+            self._id_multiplier += 2
+        self._id_inverse = _inverse(self._id_multiplier, ID_SPACE)
+        self._id_offset = rng.randrange(ID_SPACE)
+        self._pairings = {}
+        self._surname_founders = {}
+        for number in range(0, min(self.founders, size)):
+            self._surname_founders.setdefault(self._founder_surname(number), []).append(number)
+
+    def id(self, number):
+        """
+        Return the ID of a person.
+        """
+        value = (number * self._id_multiplier + self._id_offset) % ID_SPACE
+        digits = []
+        for i in range(7):
+            digits.append(ID_ALPHABET[value % 36])
+            value //= 36
+        digits.reverse()
+        return '%s-%s' % (''.join(digits[:4]), ''.join(digits[4:]))
+
+    def number(self, id):
+        """
+        Return the number of the person with an ID, raising KeyError if there is none.
+        """
+        digits = id.replace('-', '').upper()
+        if len(digits) != 7 or [d for d in digits if d not in ID_ALPHABET]:
+            raise KeyError(id)
+        value = 0
+        for d in digits:
+            value = value * 36 + ID_ALPHABET.index(d)
+        number = (value - self._id_offset) * self._id_inverse % ID_SPACE
+        if number >= self.size:
+            raise KeyError(id)
+        return number
+
+    def generation_start(self, generation):
+        """
+        Return the number of the first person of a generation.
+        """
+        return self.founders * ((1 << generation) - 1)
+
+    def locate(self, number):
+        """
+        Return (generation, index within the generation) of a person.
+        """
+        generation = 0
+        while number >= self.generation_start(generation + 1):
+            generation += 1
+        return (generation, number - self.generation_start(generation))
+
+    def _number(self, generation, index):
+        number = self.generation_start(generation) + index
+        if number >= self.size:
+            return None
+        return number
+
+    def gender(self, number):
+        """
+        Return 'Male' or 'Female'.
+        """
+        if number % 2:
+            return 'Female'
+        return 'Male'
+
+    def spouse(self, number):
+        """
+        Return the number of a person's spouse, or None.
+        """
+        (generation, index) = self.locate(number)
+        (multiplier, offset, inverse, couples) = self._pairing(generation)
+        if index % 2:
+            index = (index // 2 - offset) * inverse % couples * 2
+        else:
+            index = (index // 2 * multiplier + offset) % couples * 2 + 1
+        return self._number(generation, index)
+
+    def _pairing(self, generation):
+        """
+        Return the (multiplier, offset, inverse, couples) pairing a generation.
+
+        The man with index 2k is married to the woman with index
+        2((multiplier * k + offset) % couples) + 1.
+        """
+        if generation not in self._pairings:
+            couples = self.founders << generation >> 1
+            offset = random.Random((self.seed << 16) + generation).randrange(couples)
+            self._pairings[generation] = (PAIRING_MULTIPLIER % couples, offset,
+                                          _inverse(PAIRING_MULTIPLIER, couples), couples)
+        return self._pairings[generation]
+
+    def parents(self, number):
+        """
+        Return the numbers of a person's (father, mother), or None for a founder.
+        """
+        (generation, index) = self.locate(number)
+        if generation == 0:
+            return None
+        father = self._number(generation - 1, index // 4 * 2)
+        return (father, self.spouse(father))
+
+    def children(self, number):
+        """
+        Return the numbers of a person's children.
+        """
+        (generation, index) = self.locate(number)
+        spouse = self.spouse(number)
+        if spouse is None:
+            return []
+        if index % 2:
+            (generation, index) = self.locate(spouse)
+        first = self._number(generation + 1, index // 2 * 4)
+        if first is None:
+            return []
+        return [child for child in range(first, first + 4) if child < self.size]
+
+    def ancestors(self, number, generations):
+        """
+        Return the numbers of a person and their ancestors, breadth first.
+
+        Ancestors reached through more than one line appear only once.
+        """
+        result = [number]
+        seen = set([number])
+        current = [number]
+        for i in range(generations):
+            parents = []
+            for person in current:
+                for parent in self.parents(person) or ():
+                    if parent not in seen:
+                        seen.add(parent)
+                        parents.append(parent)
+            result.extend(parents)
+            current = parents
+        return result
+
+    def _random(self, number):
+        return random.Random((self.seed << 48) + number)
+
+    def _founder_surname(self, number):
+        return SURNAMES[self._random(number).randrange(len(SURNAMES))]
+
+    def surname(self, number):
+        """
+        Return a person's surname (inherited from their father).
+        """
+        parents = self.parents(number)
+        while parents is not None:
+            number = parents[0]
+            parents = self.parents(number)
+        return self._founder_surname(number)
+
+    def version(self, number):
+        """
+        Return the current version of a person.
+        """
+        if number in self.versions:
+            return self.versions[number]
+        return str(self._random(number).randrange(10 ** 11, 10 ** 12))
+
+    def touch(self, number):
+        """
+        Simulate a change to a person, giving them a new version.
+        """
+        self.versions[number] = str(int(self.version(number)) + 1)
+
+    def person(self, number):
+        """
+        Return a dict describing a person.
+
+        Its keys are id, number, version, gender, given, surname, generation,
+        birth and death (datetime.dates), and birth_place and death_place
+        (entries of PLACES).
+        """
+        rng = self._random(number)
+        (generation, index) = self.locate(number)
+        gender = self.gender(number)
+        given = rng.choice(GIVEN_NAMES[gender])
+        birth = datetime.date(1600 + generation * 28 + rng.randrange(10), rng.randrange(1, 13),
+                              rng.randrange(1, 29))
+        death = datetime.date(birth.year + rng.randrange(30, 90), rng.randrange(1, 13),
+                              rng.randrange(1, 29))
+        return {'id': self.id(number),
+                'number': number,
+                'version': self.version(number),
+                'gender': gender,
+                'given': given,
+                'surname': self.surname(number),
+                'generation': generation,
+                'birth': birth,
+                'birth_place': PLACES[rng.randrange(len(PLACES))],
+                'death': death,
+                'death_place': PLACES[rng.randrange(len(PLACES))]}
+
+    def search(self, given=None, surname=None, gender=None, limit=1000, scan=100000):
+        """
+        Return the numbers of persons matching a name and gender, in a stable order.
+
+        At most limit persons are returned, and at most scan persons are
+        examined.
+        """
+        if surname is not None:
+            queue = deque(self._surname_founders.get(surname.title(), []))
+        else:
+            queue = deque(range(min(scan, self.size)))
+        results = []
+        examined = 0
+        while queue and len(results) < limit and examined < scan:
+            number = queue.popleft()
+            examined += 1
+            if (gender is None or self.gender(number) == gender) and \
+               (given is None or self.person(number)['given'] == given.title()):
+                results.append(number)
+            if surname is not None and self.gender(number) == 'Male':
+                # Children share the surname of their father
+                queue.extend(self.children(number))
+        return results
+
+
+class FakeServer(object):
+
+    """
+    A WSGI application simulating the FamilySearch API with a SyntheticTree
+
+    Public attributes:
+
+    tree -- the SyntheticTree served
+    me -- number of the person returned for the current user
+    latency -- seconds to wait before each response, or a (minimum,
+               maximum) pair to wait a random time between
+    error_rate -- fraction of requests answered with HTTP 503
+    throttle -- TokenBucket limiting the request rate, or None
+    requests -- number of requests received
+    sleep -- function used to wait (time.sleep)
+    """
+
+    def __init__(self, size=1000000, seed=0, founders=1000, tree=None, me=None,
+                 latency=0, error_rate=0, rate=None, burst=None):
+        """
+        Instantiate a FakeServer.
+
+        Keyword arguments:
+        size (optional) -- number of persons in the tree (defaults to 1000000)
+        seed (optional) -- seed for the tree and simulated errors (defaults to 0)
+        founders (optional) -- persons in the first generation of the tree
+        tree (optional) -- SyntheticTree to serve instead of a new one
+        me (optional) -- number of the current user's person (defaults to
+                         the first person of the last complete generation)
+        latency (optional) -- seconds to wait before each response, or a
+                              (minimum, maximum) pair (defaults to 0)
+        error_rate (optional) -- fraction of requests answered with HTTP 503
+                                 (defaults to 0)
+        rate (optional) -- requests per second allowed before answering with
+                           HTTP 429 (defaults to no limit)
+        burst (optional) -- requests allowed at once when throttling
+                            (defaults to rate)
+        """
+        if tree is None:
+            tree = SyntheticTree(size, founders, seed)
+        self.tree = tree
+        if me is None:
+            generation = tree.locate(tree.size - 1)[0]
+            me = tree.generation_start(max(0, generation - 1))
+        self.me = me
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle = None
+        if rate:
+            self.throttle = TokenBucket(rate, burst)
+        self.requests = 0
+        self.sleep = time.sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sessions = 0
+
+    def __call__(self, environ, start_response):
+        try:
+            (status, headers, body) = self.respond(environ)
+        except KeyError:
+            (status, headers, body) = self.error(404, 'Not Found')
+        except ValueError:
+            (status, headers, body) = self.error(400, 'Bad Request')
+        headers = headers + [('Content-Length', str(len(body)))]
+        start_response(status, headers)
+        return [body]
+
+    def respond(self, environ):
+        """
+        Return the (status, headers, body) of the response to a request.
+        """
+        self._lock.acquire()
+        try:
+            self.requests += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+            latency = self.latency
+            if isinstance(latency, tuple):
+                latency = self._random.uniform(*latency)
+        finally:
+            self._lock.release()
+        if latency:
+            self.sleep(latency)
+        if self.throttle is not None and not self.throttle.try_acquire():
+            (status, headers, body) = self.error(429, 'Too Many Requests')
+            retry_after = max(1, int(1.0 / self.throttle.rate + 0.999))
+            return (status, headers + [('Retry-After', str(retry_after))], body)
+        if failed:
+            return self.error(503, 'Service Unavailable')
+
+        parts = [part for part in environ.get('PATH_INFO', '').split('/') if part]
+        if len(parts) < 3:
+            raise KeyError(environ.get('PATH_INFO'))
+        (module, endpoint, ids) = ('/'.join(parts[:2]), parts[2], parts[3:])
+        if ids:
+            ids = ','.join(ids).split(',')
+        query = urlparse.parse_qs(environ.get('QUERY_STRING', ''))
+        if environ.get('REQUEST_METHOD') == 'POST':
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            for (name, values) in urlparse.parse_qs(environ['wsgi.input'].read(length)).items():
+                query.setdefault(name, []).extend(values)
+        handler = getattr(self, '_%s_%s' % (module.split('/')[0], endpoint), None)
+        if handler is None:
+            raise KeyError(endpoint)
+        return handler(environ, ids, query)
+
+    def error(self, code, message):
+        """
+        Return the (status, headers, body) of an error response.
+        """
+        body = jsoncodec.dumps({'statusCode': code, 'statusMessage': message})
+        return ('%d %s' % (code, message), [('Content-Type', 'application/json')], body)
+
+    def _json(self, body):
+        body['statusCode'] = 200
+        body['statusMessage'] = 'OK'
+        return ('200 OK', [('Content-Type', 'application/json')], jsoncodec.dumps(body))
+
+    def _text(self, body):
+        return ('200 OK', [('Content-Type', 'text/plain')], body)
+
+    # Identity version 2
+
+    def _new_session(self):
+        self._lock.acquire()
+        try:
+            self._sessions += 1
+            return 'USYS%08X.%d' % (self.tree.seed & 0xffffffff, self._sessions)
+        finally:
+            self._lock.release()
+
+    def _session(self, query):
+        if 'sessionId' in query:
+            session = query['sessionId'][0]
+        else:
+            session = self._new_session()
+        return self._json({'session': {'id': session}, 'version': IDENTITY_VERSION})
+
+    def _identity_login(self, environ, ids, query):
+        return self._json({'session': {'id': self._new_session()}, 'version': IDENTITY_VERSION})
+
+    _identity_initialize = _identity_login
+
+    def _identity_authenticate(self, environ, ids, query):
+        return self._session(query)
+
+    def _identity_session(self, environ, ids, query):
+        return self._session(query)
+
+    def _identity_logout(self, environ, ids, query):
+        return self._session(query)
+
+    def _identity_properties(self, environ, ids, query):
+        base = '%s://%s/identity/v2/' % (environ.get('wsgi.url_scheme', 'http'),
+                                         environ.get('HTTP_HOST') or environ.get('SERVER_NAME', 'localhost'))
+        properties = [{'name': 'user.max.ids', 'value': '10'},
+                      {'name': 'request.token.url', 'value': base + 'request_token'},
+                      {'name': 'authorize.url', 'value': base + 'authorize'},
+                      {'name': 'access.token.url', 'value': base + 'access_token'}]
+        return self._json({'properties': properties, 'version': IDENTITY_VERSION})
+
+    def _identity_request_token(self, environ, ids, query):
+        return self._text('oauth_token=%s&oauth_token_secret=%s&oauth_callback_confirmed=true'
+                          % (self._new_session(), 'FAKE_SECRET'))
+
+    def _identity_access_token(self, environ, ids, query):
+        token = query.get('oauth_token', [None])[0] or self._new_session()
+        return self._text('oauth_token=%s&oauth_token_secret=%s' % (token, 'FAKE_SECRET'))
+
+    # Family Tree version 2
+
+    def _numbers(self, ids):
+        if not ids:
+            return [self.me]
+        return [self.tree.number(id) for id in ids]
+
+    def _date(self, date):
+        return {'original': '%04d%02d%02d' % (date.year, date.month, date.day),
+                'normalized': '%d %s %d' % (date.day, MONTHS[date.month - 1], date.year),
+                'gedcom': '%d %s %d' % (date.day, MONTHS[date.month - 1], date.year),
+                'numeric': '%04d-%02d-%02d' % (date.year, date.month, date.day),
+                'astro': {'earliest': str(date.toordinal() + JULIAN_DAY_OFFSET),
+                          'latest': str(date.toordinal() + JULIAN_DAY_OFFSET)},
+                'selected': False}
+
+    def _place(self, place):
+        return {'original': place[0],
+                'normalized': {'value': place[1], 'id': place[2], 'version': '4.4.0.5m'},
+                'selected': False}
+
+    def _reference(self, number):
+        return {'id': self.tree.id(number), 'gender': self.tree.gender(number)}
+
+    def _person(self, number, query={}, summary=False):
+        """
+        Return the JSON representation of a person.
+        """
+        tree = self.tree
+        person = tree.person(number)
+        full_text = '%s %s' % (person['given'], person['surname'])
+        name = {'forms': [{'fullText': full_text}]}
+        events = [{'value': {'type': 'Birth', 'date': self._date(person['birth']),
+                             'place': self._place(person['birth_place'])}}]
+        if not summary:
+            name['type'] = 'Name'
+            name['forms'][0]['pieces'] = [
+                {'predelimiters': '', 'value': person['given'], 'postdelimiters': ' ', 'type': 'Given'},
+                {'predelimiters': '', 'value': person['surname'], 'postdelimiters': '', 'type': 'Family'}]
+            events.append({'value': {'type': 'Death', 'date': self._date(person['death']),
+                                     'place': self._place(person['death_place'])}})
+        result = {'assertions': {'names': [{'value': name}],
+                                 'genders': [{'value': {'type': person['gender']}}],
+                                 'events': events},
+                  'id': person['id'],
+                  'version': person['version']}
+        if 'parents' in query and query['parents'] != ['none']:
+            parents = tree.parents(number)
+            if parents:
+                result['parents'] = [{'parent': [self._reference(parent) for parent in parents
+                                                 if parent is not None]}]
+        if ('families' in query and query['families'] != ['none']) or \
+           ('children' in query and query['children'] != ['none']):
+            spouse = tree.spouse(number)
+            if spouse is not None:
+                result['families'] = [{'parent': [self._reference(number), self._reference(spouse)],
+                                       'child': [self._reference(child) for child in tree.children(number)]}]
+        return result
+
+    def _familytree(self, key, items):
+        return self._json({key: items, 'version': FAMILYTREE_VERSION})
+
+    def _familytree_person(self, environ, ids, query):
+        return self._familytree('persons', [self._person(number, query) for number in self._numbers(ids)])
+
+    def _familytree_persona(self, environ, ids, query):
+        return self._familytree('personas', [self._person(number, query) for number in self._numbers(ids)])
+
+    def _familytree_version(self, environ, ids, query):
+        versions = []
+        for number in self._numbers(ids):
+            id = self.tree.id(number)
+            versions.append({'requestedId': id, 'id': id, 'version': self.tree.version(number)})
+        return self._familytree('versions', versions)
+
+    def _familytree_pedigree(self, environ, ids, query):
+        generations = min(int(query.get('ancestors', ['4'])[0]), 9)
+        pedigrees = []
+        for number in self._numbers(ids):
+            persons = [self._person(ancestor, {'parents': ['summary']}, True)
+                       for ancestor in self.tree.ancestors(number, generations)]
+            id = self.tree.id(number)
+            pedigrees.append({'requestedId': id, 'id': id, 'persons': persons})
+        return self._familytree('pedigrees', pedigrees)
+
+    def _search_terms(self, query):
+        terms = {}
+        for (name, values) in query.items():
+            terms[name.split('.')[0]] = values[0]
+        return terms
+
+    def _candidates(self, terms, exclude=None):
+        numbers = self.tree.search(terms.get('givenName'), terms.get('familyName'),
+                                   terms.get('gender'))
+        return [number for number in numbers if number != exclude]
+
+    def _results(self, numbers, start, count, key):
+        results = []
+        for rank in range(start, min(start + count, len(numbers))):
+            score = round(5.0 - 4.0 * rank / max(1, len(numbers)), 3)
+            number = numbers[rank]
+            results.append({'score': score, 'id': self.tree.id(number),
+                            'person': self._person(number, summary=True)})
+            if key == 'match':
+                results[-1]['score'] = round(score / 5.0, 3)
+                results[-1]['confidence'] = ['High', 'Medium', 'Low'][min(2, rank * 3 // max(1, len(numbers)))]
+        return results
+
+    def _familytree_search(self, environ, ids, query):
+        if 'contextId' in query:
+            # The context ID encodes the original search terms
+            terms = jsoncodec.loads(base64.urlsafe_b64decode(query['contextId'][0]))
+        else:
+            terms = self._search_terms(dict([(name, values) for (name, values) in query.items()
+                                             if name not in ('maxResults', 'startIndex', 'sessionId',
+                                                             'dataFormat')]))
+        context = base64.urlsafe_b64encode(jsoncodec.dumps(terms, sort_keys=True))
+        start = int(query.get('startIndex', ['0'])[0])
+        count = int(query.get('maxResults', ['10'])[0])
+        numbers = self._candidates(terms)
+        search = {'count': len(numbers), 'close': len(numbers), 'partial': len(numbers),
+                  'search': self._results(numbers, start, count, 'search'), 'contextId': context}
+        return self._familytree('searches', [search])
+
+    def _familytree_match(self, environ, ids, query):
+        count = int(query.get('maxResults', ['10'])[0])
+        matches = []
+        if ids:
+            for number in self._numbers(ids):
+                person = self.tree.person(number)
+                numbers = self._candidates({'givenName': person['given'], 'familyName': person['surname'],
+                                            'gender': person['gender']}, number)
+                if 'id' in query:
+                    # Score one pair: by its rank among the candidates, or lowest if it isn't one
+                    other = self.tree.number(query['id'][0])
+                    if other not in numbers:
+                        numbers = numbers + [other]
+                    matches.append({'id': person['id'], 'count': 1,
+                                    'match': self._results(numbers, numbers.index(other), 1, 'match')})
+                    continue
+                matches.append({'id': person['id'], 'count': len(numbers),
+                                'match': self._results(numbers, 0, count, 'match')})
+        else:
+            numbers = self._candidates(self._search_terms(query))
+            matches.append({'count': len(numbers), 'match': self._results(numbers, 0, count, 'match')})
+        return self._familytree('matches', matches)
+
+    # Authorities version 1
+
+    def _authorities(self, key, value):
+        body = {'names': None, 'dates': None, 'places': None, 'deprecated': None,
+                'version': AUTHORITIES_VERSION}
+        body[key] = value
+        return self._json(body)
+
+    def _authorities_place(self, environ, ids, query):
+        places = []
+        for id in ids:
+            matches = [place for place in PLACES if place[2] == id]
+            if not matches:
+                raise KeyError(id)
+            places.append((matches[0], id, None))
+        for text in query.get('place', []):
+            matches = [place for place in PLACES if text.lower() in place[1].lower()] or \
+                      [PLACES[sum(map(ord, text.lower())) % len(PLACES)]]
+            places.extend([(place, None, text) for place in matches])
+        return self._authorities('places', {
+            'count': len(places), 'version': '4.6.0.2',
+            'place': [{'official': place[0], 'normalized': [place[1]], 'id': place[2],
+                       'type': 'Populated Place', 'requestedId': requested, 'original': original,
+                       'culture': '4', 'iso': place[3]}
+                      for (place, requested, original) in places]})
+
+    def _authorities_name(self, environ, ids, query):
+        names = []
+        for text in query.get('name', []):
+            words = text.split()
+            pieces = [{'predelimiters': '', 'value': word, 'postdelimiters': ' ', 'type': 'Given',
+                       'text': word} for word in words[:-1]]
+            pieces.extend([{'predelimiters': '', 'value': word, 'postdelimiters': '', 'type': 'Family',
+                            'text': word} for word in words[-1:]])
+            names.append({'pieces': pieces,
+                          'fields': [{'type': piece['type'], 'text': piece['text']} for piece in pieces],
+                          'original': text})
+        return self._authorities('names', {'count': len(names), 'version': '4.6.0', 'name': names})
+
+    def _authorities_date(self, environ, ids, query):
+        dates = []
+        for text in query.get('date', []):
+            date = None
+            for format in ('%d %b %Y', '%d %B %Y', '%B %d %Y', '%b %d %Y', '%m-%d-%y', '%Y-%m-%d', '%Y'):
+                try:
+                    parsed = time.strptime(text.strip().title(), format)
+                except ValueError:
+                    continue
+                date = datetime.date(parsed[0], parsed[1], parsed[2])
+                break
+            result = {'original': text, 'requested': text, 'ambiguous': False, 'valid': date is not None}
+            if date is not None:
+                normalized = self._date(date)
+                result['normalized'] = normalized['normalized']
+                bound = {'normalized': normalized['normalized'], 'numeric': normalized['numeric'],
+                         'astro': normalized['astro']['earliest'], 'original': None, 'requested': None,
+                         'ambiguous': None, 'valid': None}
+                result['earliest'] = bound
+                result['latest'] = dict(bound)
+            dates.append(result)
+        return self._authorities('dates', {'count': len(dates), 'version': '1.5.7.2', 'date': dates})
+
+    def _authorities_culture(self, environ, ids, query):
+        ids = ids or [str(n) for n in range(1, len(CULTURES) + 1)]
+        cultures = []
+        for id in ids:
+            if not id.isdigit() or not 1 <= int(id) <= len(CULTURES):
+                raise KeyError(id)
+            cultures.append({'requestedId': id, 'value': CULTURES[int(id) - 1], 'id': id})
+        body = {'names': None, 'dates': None, 'places': None, 'deprecated': None,
+                'version': AUTHORITIES_VERSION, 'cultures': cultures}
+        return self._json(body)
+
+
+def serve(app, host='localhost', port=8080):
+    """
+    Return a multithreaded wsgiref server serving app (call serve_forever to run it).
+    """
+    import SocketServer
+    from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+    class ThreadingWSGIServer(SocketServer.ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+    server = ThreadingWSGIServer((host, port), QuietHandler)
+    server.set_app(app)
+    return server
+
+
+def main(argv=None):
+    import optparse
+    parser = optparse.OptionParser(usage='%prog [options]',
+                                   description='Serve a synthetic FamilySearch API.')
+    parser.add_option('--host', default='localhost', help='host to listen on (default %default)')
+    parser.add_option('--port', type='int', default=8080, help='port to listen on (default %default)')
+    parser.add_option('--size', type='int', default=1000000, help='persons in the tree (default %default)')
+    parser.add_option('--seed', type='int', default=0, help='seed for the tree (default %default)')
+    parser.add_option('--founders', type='int', default=1000,
+                      help='persons in the first generation (default %default)')
+    parser.add_option('--latency', type='float', default=0, help='seconds to wait per request (default %default)')
+    parser.add_option('--error-rate', type='float', default=0,
+                      help='fraction of requests failing with HTTP 503 (default %default)')
+    parser.add_option('--rate', type='float', default=None,
+                      help='requests per second allowed before HTTP 429 (default unlimited)')
+    (options, args) = parser.parse_args(argv)
+    app = FakeServer(options.size, options.seed, options.founders, latency=options.latency,
+                     error_rate=options.error_rate, rate=options.rate)
+    server = serve(app, options.host, options.port)
+    print 'Serving %d persons on http://%s:%d (current user %s)' % (
+        options.size, options.host, server.server_port, app.tree.id(app.me))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
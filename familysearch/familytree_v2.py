@@ -4,10 +4,9 @@ A module implementing the Family Tree version 2 API module
 Main class: FamilyTreeV2, meant to be mixed-in to the FamilySearch class
 """
 
-try:
-    import json
-except ImportError:
-    import simplejson as json
+import crawl
+import matching
+import model
 
 class FamilyTreeV2(object):
 
@@ -15,115 +14,266 @@ class FamilyTreeV2(object):
     A mix-in implementing the Family Tree version 2 endpoints
     """
 
+    # Maximum number of IDs to send in a single request to each multi-ID
+    # endpoint; longer lists are split up and requested concurrently
+    id_limits = {'person': 10, 'persona': 10, 'version': 100, 'pedigree': 10}
+
     def __init__(self):
         """
         Set up the URLs for this FamilyTreeV2 object.
         """
         self.familytree_base = self.base + '/familytree/v2/'
-
-    def _remove_nones(self, arg):
-        """
-        Remove all None values from a nested dict structure.
-
-        This method exists because the FamilySearch API returns all attributes
-        in a JSON response, with empty values set to null instead of being
-        hidden from the response.
-
-        """
-        if isinstance(arg, dict):
-            return dict([(k, self._remove_nones(v)) for (k, v) in arg.iteritems() if v is not None])
-        elif isinstance(arg, list):
-            return [self._remove_nones(i) for i in arg if i is not None]
-        else:
-            return arg
+        self.familytree_urls = dict([(endpoint, self.familytree_base + endpoint)
+                                     for endpoint in ('person', 'persona', 'version',
+                                                      'pedigree', 'search', 'match')])
+        self.id_limits = dict(FamilyTreeV2.id_limits)
 
     def person(self, person_id=None, options={}, **kw_options):
         """
         Get a representation of a person or list of persons from the family tree.
         """
-        if isinstance(person_id, list):
-            person_id = ','.join(person_id)
-        elif person_id == 'me':
+        if person_id == 'me':
             person_id = None
-        url = self.familytree_base + 'person'
-        if person_id:
-            url = self._add_subpath(url, person_id)
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['persons']
-        response = self._remove_nones(response)
-        if len(response) == 1:
-            return response[0]
-        else:
-            return response
+        return self._read_ids('person', 'persons', person_id, options, kw_options)
 
     def persona(self, persona_id, options={}, **kw_options):
         """
         Get a representation of a persona or list of personas from the family tree.
         """
-        if isinstance(persona_id, list):
-            persona_id = ','.join(persona_id)
-        url = self.familytree_base + 'persona'
-        if persona_id:
-            url = self._add_subpath(url, persona_id)
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['personas']
-        response = self._remove_nones(response)
-        if len(response) == 1:
-            return response[0]
-        else:
-            return response
+        return self._read_ids('persona', 'personas', persona_id, options, kw_options)
 
     def version(self, person_id):
         """
         Read the latest version of a person or list of persons from the family tree.
         """
-        if isinstance(person_id, list):
-            person_id = ','.join(person_id)
-        url = self.familytree_base + 'version'
-        if person_id:
-            url = self._add_subpath(url, person_id)
-        response = json.load(self._request(url))['versions']
-        response = self._remove_nones(response)
-        if len(response) == 1:
-            return response[0]
-        else:
-            return response
+        return self._read_ids('version', 'versions', person_id, {}, {})
 
     def pedigree(self, person_id=None, options={}, **kw_options):
         """
         Get a pedigree for the given person or list of persons from the family tree.
         """
-        if isinstance(person_id, list):
-            person_id = ','.join(person_id)
-        elif person_id == 'me':
+        if person_id == 'me':
             person_id = None
-        url = self.familytree_base + 'pedigree'
-        if person_id:
-            url = self._add_subpath(url, person_id)
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['pedigrees']
-        response = self._remove_nones(response)
+        return self._read_ids('pedigree', 'pedigrees', person_id, options, kw_options)
+
+    def iter_persons(self, person_ids=None, options={}, **kw_options):
+        """
+        Iterate over a person or list of persons from the family tree.
+
+        Each person is yielded as soon as it has been read from the response.
+        """
+        if person_ids == 'me':
+            person_ids = None
+        return self._iter_ids('person', 'persons', person_ids, options, kw_options)
+
+    def iter_personas(self, persona_ids, options={}, **kw_options):
+        """
+        Iterate over a persona or list of personas from the family tree.
+
+        Each persona is yielded as soon as it has been read from the response.
+        """
+        return self._iter_ids('persona', 'personas', persona_ids, options, kw_options)
+
+    def iter_versions(self, person_ids):
+        """
+        Iterate over the latest versions of a person or list of persons from the family tree.
+
+        Each version is yielded as soon as it has been read from the response.
+        """
+        return self._iter_ids('version', 'versions', person_ids, {}, {})
+
+    def iter_ancestors(self, person_ids, generations, **kw_options):
+        """
+        Iterate over the ancestors of a person or list of persons, up to a number of generations.
+
+        Each ancestor is yielded once, as a crawl.Ancestor (with its
+        generation and path from the root), as soon as it has been read.
+        Pedigrees are requested concurrently; keyword arguments are passed
+        to crawl.AncestorCrawler.
+        """
+        return crawl.AncestorCrawler(self, generations, **kw_options).crawl(person_ids)
+
+    def iter_descendants(self, person_ids, generations=None, **kw_options):
+        """
+        Iterate over the descendants of a person or list of persons, up to a number of generations.
+
+        Each descendant is yielded once, as a crawl.Descendant (with its
+        generation and path from the root), as soon as it has been read.
+        Each generation is requested concurrently in batches; keyword
+        arguments are passed to crawl.DescendantCrawler.
+        """
+        return crawl.DescendantCrawler(self, generations, **kw_options).crawl(person_ids)
+
+    def _read_ids(self, endpoint, key, ids, options, kw_options):
+        """
+        Read an ID or list of IDs from one of the multi-ID family tree endpoints.
+
+        Lists longer than id_limits[endpoint] are split into chunks that are
+        requested concurrently; the results are combined in input order.
+        Returns a single result, or a list if there is more than one. If
+        typed is set, results are returned as model objects (see _typed).
+        If there is a store, only the IDs it doesn't have are requested,
+        except for versions, which are always requested (see _discard_stale).
+
+        """
+        url = self.familytree_urls[endpoint]
+        params = dict(options)
+        params.update(kw_options)
+
+        def read_chunk(chunk):
+            if isinstance(chunk, list):
+                chunk = ','.join(chunk)
+            return self._get_json(url, chunk, params)[key]
+
+        def read(ids):
+            if isinstance(ids, list):
+                limit = self.id_limits[endpoint]
+                chunks = [ids[i:i + limit] for i in range(0, len(ids), limit)] or [ids]
+            else:
+                chunks = [ids]
+            if len(chunks) == 1:
+                return read_chunk(chunks[0])
+            results = []
+            for chunk_results in self.workers.map(read_chunk, chunks):
+                results.extend(chunk_results)
+            return results
+
+        if self.store is not None and ids and endpoint != 'version':
+            if not isinstance(ids, list):
+                ids = ids.split(',')
+            response = self.store.read(endpoint, ids, params, read)
+        else:
+            response = read(ids)
+            if endpoint == 'version':
+                self._discard_stale(response)
+        response = self._typed(key, response)
         if len(response) == 1:
             return response[0]
         else:
             return response
 
+    def _iter_ids(self, endpoint, key, ids, options, kw_options):
+        """
+        Iterate over the results for an ID or list of IDs from one of the multi-ID family tree endpoints.
+
+        Unlike _read_ids, lists longer than id_limits[endpoint] are split into
+        chunks requested one after another, and each result is yielded as
+        soon as it has been read, in input order, so that only one chunk of
+        the response is held in memory at a time. If there is a store, each
+        chunk (other than of versions) is read through it, and only yielded
+        once it has been read.
+
+        """
+        if isinstance(ids, list):
+            limit = self.id_limits[endpoint]
+            chunks = [ids[i:i + limit] for i in range(0, len(ids), limit)]
+        else:
+            chunks = [ids]
+
+        url = self.familytree_urls[endpoint]
+        params = dict(options)
+        params.update(kw_options)
+        model_class = self.typed and model.results.get(key)
+
+        def read_chunk(chunk):
+            return list(self._iter_json(url, ','.join(chunk), params, key))
+
+        for chunk in chunks:
+            if self.store is not None and chunk and endpoint != 'version':
+                if not isinstance(chunk, list):
+                    chunk = chunk.split(',')
+                results = self.store.read(endpoint, chunk, params, read_chunk)
+            else:
+                if isinstance(chunk, list):
+                    chunk = ','.join(chunk)
+                results = self._iter_json(url, chunk, params, key)
+                if self.store is not None and endpoint == 'version':
+                    results = list(results)
+                    self._discard_stale(results)
+            for result in results:
+                if model_class:
+                    result = model_class.from_json(result)
+                yield result
+
+    def _discard_stale(self, versions):
+        """
+        Remove the persons kept in the store at older versions than a list of version results.
+
+        Versions aren't stored, since they are how changes are detected;
+        instead, reading them makes the store drop the persons that changed.
+        """
+        if self.store is None:
+            return
+        latest = [(version.get('requestedId') or version.get('id'), version.get('version'))
+                  for version in versions if version.get('version') is not None]
+        if latest:
+            self.store.discard_stale('person', latest)
+
+    def _typed(self, key, results):
+        """
+        Convert a list of results to model objects if typed is set and there is a model for them.
+        """
+        model_class = self.typed and model.results.get(key)
+        if model_class:
+            return [model_class.from_json(result) for result in results]
+        return results
+
     def search(self, options={}, **kw_options):
         """
         Search for persons in the family tree.
 
         This method only supports GET parameters, not an XML payload.
         """
-        url = self.familytree_base + 'search'
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['searches']
-        response = self._remove_nones(response)
+        params = dict(options)
+        params.update(kw_options)
+        response = self._get_json(self.familytree_urls['search'], None, params)['searches']
         return response[0]
 
+    def iter_search(self, options={}, page_size=50, limit=None, **kw_options):
+        """
+        Iterate over the results of a search in the family tree, across all pages.
+
+        Pages of page_size results are requested with the contextId of the
+        search, each one in the background while the previous one is being
+        consumed. Stops after limit results (if given), or at the count of
+        results reported by the search. Results for persons that were
+        already yielded are skipped. If startIndex is given, the search
+        starts from that result.
+        """
+        params = dict(options)
+        params.update(kw_options)
+        if limit is not None:
+            if limit <= 0:
+                return
+            page_size = min(page_size, limit)
+        params['maxResults'] = page_size
+        page = self.search(params)
+        seen = set()
+        start = int(params.get('startIndex', 0))
+        while True:
+            results = page.get('search') or []
+            context_id = page.get('contextId', params.get('contextId'))
+            start += len(results)
+            more = bool(results and context_id) and (page.get('count') is None or start < page.get('count'))
+            next_page = None
+            if more and (limit is None or len(seen) + len(results) < limit):
+                next_page = self.workers.submit(self.search, contextId=context_id, startIndex=start,
+                                                maxResults=page_size)
+            for result in results:
+                if limit is not None and len(seen) >= limit:
+                    return
+                if result.get('id') in seen:
+                    continue
+                seen.add(result.get('id'))
+                yield result
+            if next_page is None and more and limit is not None and len(seen) < limit:
+                # Duplicates were skipped, so the limit hasn't been reached after all
+                next_page = self.workers.submit(self.search, contextId=context_id, startIndex=start,
+                                                maxResults=page_size)
+            if next_page is None:
+                return
+            page = next_page.result()
+
     def match(self, person_id=None, options={}, **kw_options):
         """
         Search for possible duplicates in the family tree.
@@ -132,14 +282,35 @@ class FamilyTreeV2(object):
         """
         if isinstance(person_id, list):
             person_id = ','.join(person_id)
-        url = self.familytree_base + 'match'
-        if person_id:
-            url = self._add_subpath(url, person_id)
-        if options or kw_options:
-            url = self._add_query_params(url, options, **kw_options)
-        response = json.load(self._request(url))['matches']
-        response = self._remove_nones(response)
+        params = dict(options)
+        params.update(kw_options)
+        response = self._get_json(self.familytree_urls['match'], person_id, params)['matches']
         return response[0]
 
+    def iter_matches(self, pairs, max_concurrency=None, options={}, **kw_options):
+        """
+        Compute match scores for an iterable of (person ID, candidate ID) pairs concurrently.
+
+        Each distinct pair is scored once (repeated and reversed pairs are
+        skipped), and yielded as a matching.MatchResult as soon as its score
+        has been read. See matching.match_pairs.
+        """
+        params = dict(options)
+        params.update(kw_options)
+        return matching.match_pairs(self, pairs, max_concurrency, params)
+
+    def find_duplicates(self, persons, min_score=None, options={}, **kw_options):
+        """
+        Find likely duplicates among persons, returning matching.MatchResults ranked by score.
+
+        Persons (dicts, model objects, or persons found by a crawl) are
+        grouped locally by name, birth year, and birth place, and only pairs
+        in the same group are scored with match requests. Keyword arguments
+        are passed to matching.DedupPipeline.
+        """
+        pipeline = matching.DedupPipeline(self, **kw_options)
+        pipeline.add(persons)
+        return pipeline.run(min_score, options)
+
 from familysearch import FamilySearch
 FamilySearch.__bases__ += (FamilyTreeV2,)
@@ -36,7 +36,7 @@ class IdentityV2(object):
 
         cookie_handler = urllib2.HTTPCookieProcessor()
         self.cookies = cookie_handler.cookiejar
-        self.opener = urllib2.build_opener(cookie_handler)
+        self.opener = urllib2.build_opener(cookie_handler, *self.http_handlers)
 
     @property
     def identity_properties(self):
@@ -45,7 +45,7 @@ class IdentityV2(object):
         """
         url = self.identity_base + 'properties'
         if not hasattr(self, '_identity_properties'):
-            self._identity_properties = identity.parse(self._request(url)).properties
+            self._identity_properties = self._parse_identity(self._request(url)).properties
         return self._identity_properties
 
     def login(self, username, password):
@@ -61,7 +61,7 @@ class IdentityV2(object):
         credentials = urllib.urlencode({'username': username,
                                         'password': password,
                                         'key': self.key})
-        self.session_id = identity.parse(self._request(url, credentials)).session.id
+        self.session_id = self._parse_identity(self._request(url, credentials)).session.id
         self.logged_in = True
         return self.session_id
 
@@ -77,7 +77,7 @@ class IdentityV2(object):
         self.cookies.clear()
         url = self.identity_base + 'initialize'
         key = urllib.urlencode({'key': self.key})
-        self.session_id = identity.parse(self._request(url, key)).session.id
+        self.session_id = self._parse_identity(self._request(url, key)).session.id
         return self.session_id
 
     def authenticate(self, username, password):
@@ -93,7 +93,7 @@ class IdentityV2(object):
             # Set sessionId parameter if the session ID is not set in a cookie
             credentials['sessionId'] = self.session_id
         credentials = urllib.urlencode(credentials)
-        self.session_id = identity.parse(self._request(url, credentials)).session.id
+        self.session_id = self._parse_identity(self._request(url, credentials)).session.id
         self.logged_in = True
         return self.session_id
 
@@ -116,7 +116,7 @@ class IdentityV2(object):
 
         """
         url = self.identity_base + 'session'
-        self.session_id = identity.parse(self._request(url)).session.id
+        self.session_id = self._parse_identity(self._request(url)).session.id
         self.logged_in = True
         return self.session_id
 
@@ -186,6 +186,14 @@ class IdentityV2(object):
         self.logged_in = True
         return response
 
+    def _parse_identity(self, response):
+        """
+        Decode an Identity response, running the after_decode hooks.
+        """
+        result = identity.parse(response)
+        response.request_info.event('after_decode')
+        return result
+
     def _oauth_request(self, url, token_secret='', params={}, **kw_params):
         """
         Make an OAuth request.
@@ -217,7 +225,7 @@ class IdentityV2(object):
         request = urllib2.Request(url, data)
         request.add_header('User-Agent', self.agent)
         try:
-            return self.opener.open(request)
+            return self._send(request, self._open)
         except urllib2.HTTPError, error:
             if error.code == 401:
                 self.logged_in = False
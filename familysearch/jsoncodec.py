@@ -0,0 +1,406 @@
+"""
+Encoding and decoding JSON with the best available library
+
+Main functions: loads_clean, iter_items, load, loads, dumps, use
+
+Every module in this package decodes JSON through this one, which uses a
+backend wrapping one of the JSON libraries below, chosen when this module is
+imported: the first one installed, in the order of BACKENDS, unless the
+FAMILYSEARCH_JSON environment variable names another. Call use to switch
+backends at run time. Encoding (which is never on a hot path here) always
+uses the standard json module, or simplejson if json is unavailable.
+
+The FamilySearch API returns every attribute in a JSON response, with empty
+values set to null instead of being left out. loads_clean removes them while
+decoding, through a hook called for each JSON object as it is built, or (with
+libraries where that is faster) in place afterwards, instead of rebuilding the
+whole decoded response in a second pass. iter_items decodes the items of a
+large array in a response one at a time, as they are read from the network.
+
+Example usage:
+
+from familysearch import jsoncodec
+
+print jsoncodec.backend.name
+jsoncodec.use('simplejson')
+
+Or, from the shell:
+
+FAMILYSEARCH_JSON=json python crawl.py
+"""
+
+import os
+import re
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+def _remove_nones_list(items):
+    """
+    Remove None items from a decoded list (and any lists nested in it).
+    """
+    return [(item.__class__ is list and [_remove_nones_list(item)] or [item])[0]
+            for item in items if item is not None]
+
+
+def _remove_nones_pairs(pairs):
+    """
+    Build a dict from decoded (key, value) pairs, leaving out None values.
+
+    Used as the object_pairs_hook, so the dict is never built with them.
+    """
+    return dict([(key, (value.__class__ is list and [_remove_nones_list(value)] or [value])[0])
+                 for (key, value) in pairs if value is not None])
+
+
+def _remove_nones_object(obj):
+    """
+    Remove None values from a decoded dict, in place.
+
+    Used as the object_hook with json modules that don't support
+    object_pairs_hook (before Python 2.7 and simplejson 2.1).
+    """
+    for key in [key for (key, value) in obj.iteritems() if value is None or value.__class__ is list]:
+        value = obj[key]
+        if value is None:
+            del obj[key]
+        else:
+            obj[key] = _remove_nones_list(value)
+    return obj
+
+
+def _remove_nones_in_place(value):
+    """
+    Remove None values from a decoded response in place, without copying it.
+    """
+    if value.__class__ is dict:
+        for key in [key for (key, item) in value.iteritems() if item is None]:
+            del value[key]
+        for item in value.itervalues():
+            if item.__class__ is dict or item.__class__ is list:
+                _remove_nones_in_place(item)
+    elif value.__class__ is list:
+        if None in value:
+            value[:] = [item for item in value if item is not None]
+        for item in value:
+            if item.__class__ is dict or item.__class__ is list:
+                _remove_nones_in_place(item)
+    return value
+
+
+class Backend(object):
+
+    """
+    A JSON library that supports decoding hooks (like json and simplejson)
+
+    Public attributes:
+
+    name -- name of the library's module
+    module -- the library's module
+    """
+
+    def __init__(self, name, module):
+        self.name = name
+        self.module = module
+        try:
+            module.loads('{}', object_pairs_hook=_remove_nones_pairs)
+            self.hooks = {'object_pairs_hook': _remove_nones_pairs}
+        except TypeError:
+            self.hooks = {'object_hook': _remove_nones_object}
+        self.decoder = module.JSONDecoder(**self.hooks)
+
+    def loads(self, data):
+        """
+        Decode a JSON document.
+        """
+        return self.module.loads(data)
+
+    def loads_clean(self, data):
+        """
+        Decode a JSON document, removing all null values from it.
+        """
+        result = self.module.loads(data, **self.hooks)
+        if result.__class__ is list:
+            result = _remove_nones_list(result)
+        return result
+
+    def raw_decode_clean(self, data, index):
+        """
+        Decode the JSON value starting at data[index], removing all null values from it.
+
+        Returns the value and the index where it ends. Raises ValueError if
+        the value is invalid or incomplete.
+        """
+        (result, end) = self.decoder.raw_decode(data, index)
+        if result.__class__ is list:
+            result = _remove_nones_list(result)
+        return (result, end)
+
+
+class InPlaceBackend(Backend):
+
+    """
+    A JSON library that removes nulls in place after decoding
+
+    Used for libraries without decoding hooks (like ujson), and for those
+    whose C decoders slow down more calling a Python hook for every object
+    than a walk over the decoded response takes (like simplejson).
+    """
+
+    def __init__(self, name, module):
+        self.name = name
+        self.module = module
+        if hasattr(module, 'JSONDecoder'):
+            self.decoder = module.JSONDecoder()
+        else:
+            # Libraries without incremental decoding leave it to json
+            self.raw_decode_clean = Backend('json', json).raw_decode_clean
+
+    def loads_clean(self, data):
+        return _remove_nones_in_place(self.module.loads(data))
+
+    def raw_decode_clean(self, data, index):
+        (result, end) = self.decoder.raw_decode(data, index)
+        return (_remove_nones_in_place(result), end)
+
+
+class SimplejsonBackend(InPlaceBackend):
+
+    """
+    simplejson, decoding documents to unicode first
+
+    Given a byte string, simplejson returns ASCII strings as str instead of
+    unicode, unlike json and ujson; given unicode, it returns unicode (and
+    is no slower), so results have the same types with every backend. The
+    unread data of iter_items is a byte string, so it is decoded with json.
+    """
+
+    def __init__(self, name, module):
+        InPlaceBackend.__init__(self, name, module)
+        self.raw_decode_clean = Backend('json', json).raw_decode_clean
+
+    def loads(self, data):
+        return self.module.loads(_text(data))
+
+    def loads_clean(self, data):
+        return _remove_nones_in_place(self.module.loads(_text(data)))
+
+
+def _text(data):
+    """
+    Return a JSON document as unicode (decoding it from UTF-8 if necessary).
+    """
+    if isinstance(data, str):
+        return data.decode('utf-8')
+    return data
+
+
+# Names of the supported libraries, in order of preference, with their
+# backend classes. simplejson comes first although ujson decodes faster: it
+# decodes every document exactly as the json module does (ujson rejects
+# integers beyond 64 bits and drops unpaired surrogates), and removing nulls,
+# which every API response goes through, takes about as long with either (see
+# benchmarks/json_backends.py). Both are faster than json.
+BACKENDS = [('simplejson', SimplejsonBackend),
+            ('ujson', InPlaceBackend),
+            ('json', Backend)]
+
+
+def available():
+    """
+    Return the names of the supported JSON libraries that are installed.
+    """
+    names = []
+    for (name, backend_class) in BACKENDS:
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def make_backend(name):
+    """
+    Return a backend for the named library.
+
+    Raises ValueError if the library isn't supported, or ImportError if it
+    isn't installed.
+    """
+    for (backend_name, backend_class) in BACKENDS:
+        if backend_name == name:
+            return backend_class(name, __import__(name))
+    raise ValueError('unsupported JSON library: %s' % name)
+
+
+def use(name=None):
+    """
+    Decode JSON with the named library from now on, and return its backend.
+
+    If name is None, uses the library named by the FAMILYSEARCH_JSON
+    environment variable, or else the first one of BACKENDS installed.
+    """
+    global backend
+    if name is None:
+        name = os.environ.get('FAMILYSEARCH_JSON') or available()[0]
+    backend = make_backend(name)
+    return backend
+
+
+backend = None
+use()
+
+# Number of bytes iter_items reads at a time
+CHUNK_SIZE = 65536
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _StreamDecoder(object):
+
+    """
+    A decoder of JSON values read a chunk at a time from a file-like object
+
+    Values are decoded with the backend's raw_decode_clean from a buffer of
+    unread data, which grows (reading twice as much each time) until it
+    holds a whole value.
+    """
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.data = ''
+        self.index = 0
+        self.eof = False
+
+    def items(self, key):
+        """
+        Yield the items of the array stored under key in the top-level object.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.index += 1
+        else:
+            while True:
+                name = self.value()
+                self.expect(':')
+                if name == key and self.peek() == '[':
+                    self.index += 1
+                    if self.peek() == ']':
+                        self.index += 1
+                    else:
+                        while True:
+                            yield self.value()
+                            if self.expect(',]') == ']':
+                                break
+                else:
+                    self.value()
+                if self.expect(',}') == '}':
+                    break
+        while not self.eof:
+            self.eof = not self.fp.read(self.chunk_size)
+
+    def read(self, size):
+        """
+        Add up to size bytes to the unread data, returning False at the end of the document.
+        """
+        if self.eof:
+            return False
+        chunk = self.fp.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.data = self.data[self.index:] + chunk
+        self.index = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace, returning the next character ('' at the end of the document).
+        """
+        while True:
+            self.index = _WHITESPACE.match(self.data, self.index).end()
+            if self.index < len(self.data):
+                return self.data[self.index]
+            if not self.read(self.chunk_size):
+                return ''
+
+    def expect(self, chars):
+        """
+        Consume the next character, raising ValueError unless it is one of chars.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expecting one of %r: %r' % (chars, self.data[self.index:self.index + 20]))
+        self.index += 1
+        return char
+
+    def value(self):
+        """
+        Decode the next value.
+        """
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                (result, end) = backend.raw_decode_clean(self.data, self.index)
+            except ValueError:
+                # The value may be incomplete
+                if not self.read(size):
+                    raise
+            else:
+                # A number at the end of the data may be incomplete
+                if end < len(self.data) or not self.read(size):
+                    self.index = end
+                    return result
+            size = max(size, len(self.data) - self.index)
+
+
+def loads_clean(data):
+    """
+    Decode a JSON document, removing all null values from it.
+
+    Null values are removed from objects and lists, at any depth, as if
+    they had been removed from the decoded document afterwards (the API
+    returns every attribute, with empty values set to null).
+    """
+    return backend.loads_clean(data)
+
+
+def iter_items(fp, key, chunk_size=CHUNK_SIZE):
+    """
+    Decode the items of an array in a JSON object read from a file-like object.
+
+    Yields each item of the array stored under key in the top-level object,
+    with null values removed (as by loads_clean), as soon as it has been read,
+    so only a chunk of the document is held in memory at a time. Nothing is
+    yielded if the object has no such array. The document is read to the end
+    once the array is finished; its other members are decoded but ignored.
+
+    Raises ValueError if the document isn't a valid JSON object.
+    """
+    return _StreamDecoder(fp, chunk_size).items(key)
+
+
+def loads(data):
+    """
+    Decode a JSON document.
+    """
+    return backend.loads(data)
+
+
+def load(fp):
+    """
+    Decode a JSON document read from a file-like object.
+    """
+    return backend.loads(fp.read())
+
+
+def dumps(obj, **kw):
+    """
+    Encode an object as JSON (with json.dumps, accepting the same arguments).
+    """
+    return json.dumps(obj, **kw)
@@ -0,0 +1,259 @@
+"""
+Persistent (keep-alive) HTTP connections for urllib2
+
+Main classes: ConnectionPool, KeepAliveHTTPHandler, KeepAliveHTTPSHandler
+
+The handlers replace urllib2's default HTTP and HTTPS handlers, which close
+the connection after every request. Connections are instead returned to a
+shared ConnectionPool once the response body has been read completely, and
+reused by the next request to the same host. All other urllib2 processing
+(cookies, error handling, etc.) is left untouched.
+"""
+
+import httplib
+import socket
+import threading
+import urllib2
+
+
+# Methods of requests that are safe to resend after a stale connection fails
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+
+class ConnectionPool(object):
+
+    """
+    A thread-safe pool of idle HTTP connections, kept separately for each host
+
+    At most max_per_host idle connections are kept for each (scheme, host)
+    pair; connections released beyond that limit are closed. A max_per_host
+    of 0 disables connection reuse entirely.
+    """
+
+    def __init__(self, max_per_host=4):
+        """
+        Instantiate a ConnectionPool.
+
+        Keyword arguments:
+        max_per_host (optional) -- maximum number of idle connections to keep
+                                   for each host (defaults to 4)
+        """
+        self.max_per_host = max_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, host):
+        """
+        Return an idle connection to the given host, or None if there is none.
+        """
+        self._lock.acquire()
+        try:
+            connections = self._idle.get((scheme, host))
+            if connections:
+                return connections.pop()
+            return None
+        finally:
+            self._lock.release()
+
+    def put(self, scheme, host, connection):
+        """
+        Return a connection to the pool, closing it if the pool is full.
+        """
+        self._lock.acquire()
+        try:
+            connections = self._idle.setdefault((scheme, host), [])
+            if len(connections) < self.max_per_host:
+                connections.append(connection)
+                return
+        finally:
+            self._lock.release()
+        connection.close()
+
+    def idle(self, scheme, host):
+        """
+        Return the number of idle connections kept for the given host.
+        """
+        self._lock.acquire()
+        try:
+            return len(self._idle.get((scheme, host), ()))
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """
+        Close and forget all idle connections.
+        """
+        self._lock.acquire()
+        try:
+            idle = self._idle
+            self._idle = {}
+        finally:
+            self._lock.release()
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class _PooledResponse(object):
+
+    """
+    Socket-like wrapper around an httplib.HTTPResponse
+
+    Hands the connection back to the pool as soon as the response has been
+    read to the end, or closes the connection if the response is closed early.
+    """
+
+    def __init__(self, pool, scheme, host, connection, response):
+        self._pool = pool
+        self._key = (scheme, host)
+        self._connection = connection
+        self._response = response
+
+    def recv(self, amt=None):
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def close(self):
+        if self._connection is None:
+            return
+        if self._response.isclosed():
+            self._release()
+        else:
+            # Unread data is left on the connection, so it can't be reused
+            self._response.close()
+            self._connection.close()
+            self._connection = None
+
+    def _release(self):
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        if self._response.will_close:
+            connection.close()
+        else:
+            self._pool.put(self._key[0], self._key[1], connection)
+
+
+class KeepAliveHandlerMixin:
+
+    """
+    Common implementation of the keep-alive HTTP and HTTPS handlers
+    """
+
+    def __init__(self, pool=None):
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
+
+    def _keepalive_open(self, scheme, req):
+        """
+        Send a request over a pooled connection and return an addinfourl object.
+        """
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        for (name, value) in req.headers.items():
+            if name not in headers:
+                headers[name] = value
+        headers = dict([(name.title(), value) for (name, value) in headers.items()])
+
+        connection = self.pool.get(scheme, host)
+        try:
+            connection, response = self._send(connection, req, headers)
+        except (urllib2.URLError, httplib.HTTPException):
+            # A reused connection may have been closed by the server while it
+            # was idle, so retry once on a new connection, unless the request
+            # may have reached the server and isn't safe to send twice
+            if connection is None or req.get_method() not in IDEMPOTENT_METHODS:
+                raise
+            connection, response = self._send(None, req, headers)
+
+        fp = socket._fileobject(_PooledResponse(self.pool, scheme, host,
+                                                connection, response),
+                                close=True)
+        resp = urllib2.addinfourl(fp, response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+    def _send(self, connection, req, headers):
+        """
+        Send a request and return a (connection, response) tuple.
+
+        If connection is None, a new connection is made.
+        """
+        if connection is None:
+            connection = self._new_connection(req)
+        try:
+            connection.request(req.get_method(), req.get_selector(), req.data, headers)
+            return connection, connection.getresponse()
+        except socket.error, error:
+            connection.close()
+            raise urllib2.URLError(error)
+        except httplib.HTTPException:
+            connection.close()
+            raise
+
+    def _new_connection(self, req):
+        """
+        Create a new connection for the given request.
+        """
+        raise NotImplementedError
+
+
+class KeepAliveHTTPHandler(KeepAliveHandlerMixin, urllib2.HTTPHandler):
+
+    """
+    A urllib2 handler that reuses HTTP connections from a ConnectionPool
+    """
+
+    def __init__(self, pool=None):
+        urllib2.HTTPHandler.__init__(self)
+        KeepAliveHandlerMixin.__init__(self, pool)
+
+    def http_open(self, req):
+        return self._keepalive_open('http', req)
+
+    def _new_connection(self, req):
+        # Look up the connection class at call time so that it can be replaced
+        # (by wsgi_intercept, for example)
+        if hasattr(req, 'timeout'):
+            return httplib.HTTPConnection(req.get_host(), timeout=req.timeout)
+        return httplib.HTTPConnection(req.get_host())
+
+
+if hasattr(httplib, 'HTTPSConnection'):
+    class KeepAliveHTTPSHandler(KeepAliveHandlerMixin, urllib2.HTTPSHandler):
+
+        """
+        A urllib2 handler that reuses HTTPS connections from a ConnectionPool
+        """
+
+        def __init__(self, pool=None):
+            urllib2.HTTPSHandler.__init__(self)
+            KeepAliveHandlerMixin.__init__(self, pool)
+
+        def https_open(self, req):
+            return self._keepalive_open('https', req)
+
+        def _new_connection(self, req):
+            if hasattr(req, 'timeout'):
+                return httplib.HTTPSConnection(req.get_host(), timeout=req.timeout)
+            return httplib.HTTPSConnection(req.get_host())
+
+
+def keepalive_handlers(pool):
+    """
+    Return a list of keep-alive handlers sharing the given ConnectionPool.
+    """
+    handlers = [KeepAliveHTTPHandler(pool)]
+    if hasattr(httplib, 'HTTPSConnection'):
+        handlers.append(KeepAliveHTTPSHandler(pool))
+    return handlers
@@ -0,0 +1,343 @@
+"""
+A module for scoring many pairs of persons as possible duplicates
+
+Main classes: MatchResult, DedupPipeline
+Main functions: pair_key, match_pairs, normalize_name, blocking_keys
+
+The match endpoint scores one pair of persons per request (the person in the
+URL and the candidate in the id parameter). match_pairs scores an iterable
+of pairs with a bounded number of requests in flight on the FamilySearch
+instance's worker pool, skipping repeated pairs (in either order), and
+yields each score as soon as it has been read.
+
+Scoring every pair of persons in a large tree is out of the question, so
+DedupPipeline first groups persons locally into blocks sharing a normalized
+name, birth year bucket, and birth place, and only scores pairs of persons
+in the same block.
+
+Example usage:
+
+from familysearch.matching import DedupPipeline, match_pairs
+
+for result in match_pairs(fs, [('ABCD-123', 'EFGH-456'), ('ABCD-123', 'IJKL-789')]):
+    print result.person_id, result.candidate_id, result.score, result.confidence
+
+pipeline = DedupPipeline(fs)
+pipeline.add(fs.iter_descendants('ABCD-123'))
+for result in pipeline.run(min_score=0.5):
+    print result.person_id, result.candidate_id, result.score
+"""
+
+import re
+import unicodedata
+
+import crawl
+import model
+
+
+def pair_key(person_id, candidate_id):
+    """
+    Return a key identifying a pair of persons regardless of their order.
+    """
+    if candidate_id < person_id:
+        return (candidate_id, person_id)
+    return (person_id, candidate_id)
+
+
+class MatchResult(object):
+
+    """
+    The match score of a pair of persons
+
+    Public attributes:
+
+    person_id -- ID of the person whose matches were requested
+    candidate_id -- ID of the person it was scored against
+    score -- match score (between 0 and 1), or None if the candidate was not
+             returned or the request failed
+    confidence -- match confidence ('High', 'Medium', or 'Low'), or None
+    match -- the match result for the candidate, as returned by the API (a
+             dict), or None
+    error -- exception raised by the request, or None if it succeeded
+    """
+
+    __slots__ = ('person_id', 'candidate_id', 'score', 'confidence', 'match', 'error')
+
+    def __init__(self, person_id, candidate_id, match=None, error=None):
+        self.person_id = person_id
+        self.candidate_id = candidate_id
+        self.match = match
+        self.error = error
+        self.score = None
+        self.confidence = None
+        if match is not None:
+            self.score = match.get('score')
+            self.confidence = match.get('confidence')
+
+    def __repr__(self):
+        return 'MatchResult(%r, %r, score=%r)' % (self.person_id, self.candidate_id, self.score)
+
+
+def _candidate_match(result, candidate_id):
+    """
+    Return the entry for a candidate in a match response, or None.
+
+    If the candidate has been merged into another person, its entry has the
+    ID of that person and the candidate's ID as requestedId. Entries for
+    other persons are never returned.
+    """
+    for match in result.get('match') or []:
+        if match.get('id') == candidate_id or match.get('requestedId') == candidate_id:
+            return match
+    return None
+
+
+def match_pairs(fs, pairs, max_concurrency=None, options={}):
+    """
+    Score pairs of persons concurrently, yielding a MatchResult for each as soon as it has been read.
+
+    Pairs of the same person, and pairs already seen (in either order), are
+    skipped. pairs is only consumed as requests finish, so it may be a long
+    generator; only the keys of the pairs seen are kept. Results are yielded
+    in the order the requests finish. A failed request does not stop the
+    others: its MatchResult has the exception in error.
+
+    Keyword arguments:
+    fs -- FamilySearch instance making the requests
+    pairs -- iterable of (person ID, candidate ID) pairs
+    max_concurrency (optional) -- maximum number of match requests in flight
+                                  at once (defaults to the number of
+                                  fs.workers)
+    options (optional) -- dict of query parameters sent with each request
+    """
+    def unique_pairs():
+        seen = set()
+        for (person_id, candidate_id) in pairs:
+            key = pair_key(person_id, candidate_id)
+            if person_id == candidate_id or key in seen:
+                continue
+            seen.add(key)
+            yield (person_id, candidate_id)
+
+    def score(pair):
+        return fs.match(pair[0], options, id=pair[1])
+
+    for ((person_id, candidate_id), future) in fs.workers.imap_unordered(score, unique_pairs(), max_concurrency):
+        error = future.exception()
+        if error is not None:
+            yield MatchResult(person_id, candidate_id, error=error)
+        else:
+            yield MatchResult(person_id, candidate_id, _candidate_match(future.result(), candidate_id))
+
+
+_YEAR = re.compile(r'(\d{4})')
+
+
+def normalize_name(text):
+    """
+    Return a name reduced to its first and last words, in lower case without accents, or None.
+
+    The first and last words are usually the given name and surname, so
+    middle names and initials don't split up duplicates.
+    """
+    if not text:
+        return None
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    text = ''.join([c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c)])
+    words = re.findall(r'\w+', text.lower(), re.UNICODE)
+    if not words:
+        return None
+    return ' '.join([words[0], words[-1]])
+
+
+def _names_and_birth(person):
+    """
+    Return the full names, birth date texts, and birth place ID of a person (a dict or model.Person).
+    """
+    if isinstance(person, model.Model):
+        names = [name.full_text for name in person.names]
+        birth = person.birth
+        if birth is None:
+            return (names, [], None)
+        dates = []
+        if birth.date is not None:
+            dates = [birth.date.numeric, birth.date.normalized, birth.date.original]
+        place_id = None
+        if birth.place is not None:
+            place_id = birth.place.id
+        return (names, dates, place_id)
+    assertions = person.get('assertions') or {}
+    names = []
+    for assertion in assertions.get('names') or []:
+        forms = (assertion.get('value') or {}).get('forms') or []
+        if forms:
+            names.append(forms[0].get('fullText'))
+    for assertion in assertions.get('events') or []:
+        event = assertion.get('value') or {}
+        if event.get('type') == 'Birth':
+            date = event.get('date') or {}
+            place = (event.get('place') or {}).get('normalized') or {}
+            return (names, [date.get('numeric'), date.get('normalized'), date.get('original')], place.get('id'))
+    return (names, [], None)
+
+
+def _year(dates):
+    """
+    Return the year of the first of a list of date texts that has one, or None.
+    """
+    for date in dates:
+        if date:
+            match = _YEAR.search(date)
+            if match:
+                return int(match.group(1))
+    return None
+
+
+def blocking_keys(person, bucket_years=10, use_place=True):
+    """
+    Return the blocking keys of a person (a dict or model.Person).
+
+    There is one key per distinct normalized name, combined with the birth
+    year bucket (the birth year divided by bucket_years) and, if use_place
+    is set, the ID of the normalized birth place. An unknown year or place
+    is None in the key. Persons without a name have no keys.
+    """
+    (names, dates, place_id) = _names_and_birth(person)
+    year = _year(dates)
+    bucket = None
+    if year is not None:
+        bucket = year // bucket_years
+    if not use_place:
+        place_id = None
+    keys = []
+    for name in names:
+        name = normalize_name(name)
+        if name is not None and (name, bucket, place_id) not in keys:
+            keys.append((name, bucket, place_id))
+    return keys
+
+
+class DedupPipeline(object):
+
+    """
+    A pipeline finding likely duplicates among persons, scoring only pairs in the same block
+
+    Persons are added from person results or crawls, and grouped into
+    blocks by their blocking keys (see blocking_keys). Only the IDs of the
+    persons are kept. Running the pipeline scores every pair of persons
+    sharing a block with match_pairs, and ranks them by score.
+
+    Blocks larger than max_block_size (typically a common name with unknown
+    birth details) are skipped rather than scored pair by pair, since their
+    number of pairs grows with the square of their size; they are listed by
+    oversized_blocks.
+
+    Public attributes:
+
+    fs -- FamilySearch instance making the match requests
+    bucket_years -- number of years in each birth year bucket
+    use_place -- flag indicating whether the birth place is part of the
+                 blocking keys
+    max_block_size -- maximum number of persons in a block that is scored
+    max_concurrency -- maximum number of match requests in flight at once
+    blocks -- dict mapping each blocking key to the set of IDs of the
+              persons in its block
+    persons -- number of distinct persons added
+    requests -- number of match requests made by the last run
+    errors -- MatchResults of the requests that failed in the last run
+    """
+
+    def __init__(self, fs, bucket_years=10, use_place=True, max_block_size=100, max_concurrency=None):
+        """
+        Instantiate a DedupPipeline.
+
+        Keyword arguments:
+        fs -- FamilySearch instance making the match requests
+        bucket_years (optional) -- number of years in each birth year bucket
+                                   (defaults to 10)
+        use_place (optional) -- whether to block by birth place as well as
+                                name and birth year (defaults to True)
+        max_block_size (optional) -- maximum number of persons in a block
+                                     that is scored (defaults to 100)
+        max_concurrency (optional) -- maximum number of match requests in
+                                      flight at once (defaults to the number
+                                      of fs.workers)
+        """
+        self.fs = fs
+        self.bucket_years = bucket_years
+        self.use_place = use_place
+        self.max_block_size = max_block_size
+        self.max_concurrency = max_concurrency
+        self.blocks = {}
+        self.persons = 0
+        self.requests = 0
+        self.errors = []
+        self._ids = set()
+
+    def add(self, persons):
+        """
+        Add a person or an iterable of persons to the blocks.
+
+        Persons may be dicts or model.Person objects (as returned by person,
+        persona, or iter_persons), or crawl.Found objects (as yielded by
+        iter_ancestors and iter_descendants).
+        """
+        if isinstance(persons, (dict, model.Model, crawl.Found)):
+            persons = [persons]
+        for person in persons:
+            if isinstance(person, crawl.Found):
+                person = person.person
+            person_id = crawl._person_id(person)
+            if person_id is None:
+                continue
+            if person_id not in self._ids:
+                self._ids.add(person_id)
+                self.persons += 1
+            for key in blocking_keys(person, self.bucket_years, self.use_place):
+                self.blocks.setdefault(key, set()).add(person_id)
+
+    def oversized_blocks(self):
+        """
+        Return the keys of the blocks that are too large to be scored.
+        """
+        return [key for (key, ids) in self.blocks.items() if len(ids) > self.max_block_size]
+
+    def pairs(self):
+        """
+        Iterate over the (person ID, candidate ID) pairs of persons sharing a block.
+
+        Pairs sharing more than one block are yielded once per block (they
+        are only scored once).
+        """
+        for ids in self.blocks.values():
+            if len(ids) < 2 or len(ids) > self.max_block_size:
+                continue
+            ids = sorted(ids)
+            for i in range(len(ids)):
+                for candidate_id in ids[i + 1:]:
+                    yield (ids[i], candidate_id)
+
+    def run(self, min_score=None, options={}):
+        """
+        Score the pairs of persons sharing a block, returning their MatchResults ranked by score.
+
+        Results with a score below min_score (if given) are left out, as are
+        failed requests, which are kept in errors.
+
+        Keyword arguments:
+        min_score (optional) -- lowest score of the results returned
+        options (optional) -- dict of query parameters sent with each match
+                              request
+        """
+        self.requests = 0
+        self.errors = []
+        results = []
+        for result in match_pairs(self.fs, self.pairs(), self.max_concurrency, options):
+            self.requests += 1
+            if result.error is not None:
+                self.errors.append(result)
+            elif result.score is not None and (min_score is None or result.score >= min_score):
+                results.append(result)
+        results.sort(key=lambda result: (-result.score, result.person_id, result.candidate_id))
+        return results
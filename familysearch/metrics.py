@@ -0,0 +1,368 @@
+"""
+Instrumentation hooks and an in-process metrics registry
+
+Main classes: RequestInfo, MetricsRegistry, Histogram
+
+Every request made by a FamilySearch object runs the hooks registered for
+each stage it reaches, in order:
+
+before_send -- just before the request is sent
+after_headers -- once the response status and headers have been received
+after_body -- once the whole response body has been read
+after_decode -- once the JSON response has been decoded
+after_clean -- once null values have been removed from the decoded response
+on_error -- if sending the request failed (instead of after_headers)
+
+Hooks are called with the name of the event and a RequestInfo holding the
+time each stage was reached, so a hook can tell network time (before_send to
+after_body) apart from parse time (after_body to after_decode and
+after_clean). A MetricsRegistry uses these hooks to keep per-endpoint latency
+histograms, byte counts, and status and error counts, which it can export as
+a dict or in the Prometheus text exposition format.
+
+Example usage:
+
+from familysearch import FamilySearch
+from familysearch.metrics import MetricsRegistry
+
+fs = FamilySearch('ClientApp/1.0', 'developer_key', metrics=MetricsRegistry())
+# [make requests]
+print fs.metrics.prometheus()
+
+def log_slow_requests(event, info):
+    if info.elapsed('before_send', 'after_body') > 1:
+        print 'slow request:', info.url
+fs.add_hook('after_body', log_slow_requests)
+"""
+
+import bisect
+import threading
+import time
+
+EVENTS = ('before_send', 'after_headers', 'after_body', 'after_decode',
+          'after_clean', 'on_error')
+
+# The phases timed by a MetricsRegistry, with the events starting and ending them
+PHASES = (('network', 'before_send', 'after_body'),
+          ('decode', 'after_body', 'after_decode'),
+          ('clean', 'after_decode', 'after_clean'))
+
+# Default histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+timer = time.time
+
+
+class RequestInfo(object):
+
+    """
+    Information about a single request, passed to hooks
+
+    Public attributes:
+
+    endpoint -- label identifying the endpoint requested (the path of its
+                URL, without any IDs)
+    method -- HTTP method ('GET' or 'POST')
+    url -- complete URL requested
+    status -- HTTP status code of the response (None until it is received)
+    bytes -- number of bytes of the response body read so far
+    error -- exception raised when sending the request, or None
+    times -- dict mapping each event reached so far to the time it happened
+    """
+
+    def __init__(self, endpoint, hooks, method=None, url=None):
+        """
+        Instantiate a RequestInfo.
+
+        Keyword arguments:
+        endpoint -- endpoint label
+        hooks -- dict mapping event names to lists of hooks to run
+        method (optional) -- HTTP method, if already known
+        url (optional) -- complete URL, if already known
+        """
+        self.endpoint = endpoint
+        self.hooks = hooks
+        self.method = method
+        self.url = url
+        self.status = None
+        self.bytes = 0
+        self.error = None
+        self.times = {}
+
+    def event(self, name):
+        """
+        Record that the request reached the named stage, and run its hooks.
+        """
+        self.times[name] = timer()
+        for hook in self.hooks.get(name, ()):
+            hook(name, self)
+
+    def elapsed(self, start, end):
+        """
+        Return the seconds between two events, or None if either hasn't happened.
+        """
+        if start in self.times and end in self.times:
+            return self.times[end] - self.times[start]
+        return None
+
+
+class InstrumentedResponse(object):
+
+    """
+    A file-like response counting the bytes read from it
+
+    Runs the after_body hooks once the body has been read to the end.
+    Other attributes are looked up on the wrapped response.
+    """
+
+    def __init__(self, response, info):
+        self.response = response
+        self.request_info = info
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self.response.read()
+            self._count(data, True)
+        else:
+            data = self.response.read(size)
+            self._count(data, not data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            data = self.response.readline()
+        else:
+            data = self.response.readline(size)
+        self._count(data, not data)
+        return data
+
+    def _count(self, data, done):
+        self.request_info.bytes += len(data)
+        if done and not self._done:
+            self._done = True
+            self.request_info.event('after_body')
+
+
+class Histogram(object):
+
+    """
+    A histogram counting observed values in buckets with fixed upper bounds
+
+    Public attributes:
+
+    buckets -- sorted tuple of bucket upper bounds
+    counts -- list of the number of values in each bucket (not cumulative),
+              with one more entry for values above the last bound
+    count -- number of values observed
+    sum -- sum of the values observed
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Add a value to the histogram.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        Return a list of (upper bound, count of values <= bound) pairs.
+
+        The last upper bound is float('inf').
+        """
+        result = []
+        total = 0
+        for (bound, count) in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        """
+        Return a dict representing the histogram.
+        """
+        return {'count': self.count,
+                'sum': self.sum,
+                'buckets': self.cumulative()}
+
+
+def _escape(value):
+    """
+    Escape a Prometheus label value.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    """
+    Format a list of (name, value) pairs as a Prometheus label set.
+    """
+    return '{%s}' % ','.join(['%s="%s"' % (name, _escape(value)) for (name, value) in pairs])
+
+
+def _bound(value):
+    """
+    Format a histogram bucket upper bound as Prometheus does.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class MetricsRegistry(object):
+
+    """
+    Per-endpoint request metrics collected through FamilySearch hooks
+
+    Pass an instance to the FamilySearch constructor (or call install) to
+    collect metrics from its requests. A registry may be shared by several
+    FamilySearch objects and threads.
+
+    Public attributes:
+
+    latency -- dict mapping (endpoint, phase) to a Histogram of the seconds
+               spent in that phase ('network', 'decode', or 'clean')
+    bytes_received -- dict mapping endpoints to the number of body bytes read
+    statuses -- dict mapping (endpoint, status) to the number of responses
+    errors -- dict mapping (endpoint, error class name) to the number of
+              failed requests
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Instantiate a MetricsRegistry.
+
+        Keyword arguments:
+        buckets (optional) -- latency histogram bucket upper bounds, in
+                              seconds (defaults to DEFAULT_BUCKETS)
+        """
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Discard all the metrics collected so far.
+        """
+        self._lock.acquire()
+        try:
+            self.latency = {}
+            self.bytes_received = {}
+            self.statuses = {}
+            self.errors = {}
+        finally:
+            self._lock.release()
+
+    def install(self, fs):
+        """
+        Add the hooks collecting metrics to a FamilySearch object.
+        """
+        fs.add_hook('after_headers', self.hook)
+        fs.add_hook('after_body', self.hook)
+        fs.add_hook('after_decode', self.hook)
+        fs.add_hook('after_clean', self.hook)
+        fs.add_hook('on_error', self.hook)
+
+    def hook(self, event, info):
+        """
+        Update the metrics for a request that reached the given event.
+        """
+        self._lock.acquire()
+        try:
+            if event == 'after_headers':
+                self._increment(self.statuses, (info.endpoint, info.status))
+            elif event == 'on_error':
+                if info.status is not None:
+                    self._increment(self.statuses, (info.endpoint, info.status))
+                self._increment(self.errors, (info.endpoint, info.error.__class__.__name__))
+            else:
+                if event == 'after_body':
+                    self._increment(self.bytes_received, info.endpoint, info.bytes)
+                for (phase, start, end) in PHASES:
+                    if end == event:
+                        elapsed = info.elapsed(start, end)
+                        if elapsed is not None:
+                            self._histogram(info.endpoint, phase).observe(elapsed)
+        finally:
+            self._lock.release()
+
+    def _increment(self, counts, key, amount=1):
+        counts[key] = counts.get(key, 0) + amount
+
+    def _histogram(self, endpoint, phase):
+        key = (endpoint, phase)
+        if key not in self.latency:
+            self.latency[key] = Histogram(self.buckets)
+        return self.latency[key]
+
+    def as_dict(self):
+        """
+        Return a dict of all the metrics, nested by endpoint.
+
+        For example: {'/familytree/v2/person': {'latency': {'network': {...}},
+        'bytes_received': 1234, 'statuses': {200: 2}, 'errors': {}}}
+        """
+        self._lock.acquire()
+        try:
+            result = {}
+            def endpoint(name):
+                return result.setdefault(name, {'latency': {}, 'bytes_received': 0,
+                                                'statuses': {}, 'errors': {}})
+            for ((name, phase), histogram) in self.latency.iteritems():
+                endpoint(name)['latency'][phase] = histogram.as_dict()
+            for (name, count) in self.bytes_received.iteritems():
+                endpoint(name)['bytes_received'] = count
+            for ((name, status), count) in self.statuses.iteritems():
+                endpoint(name)['statuses'][status] = count
+            for ((name, error), count) in self.errors.iteritems():
+                endpoint(name)['errors'][error] = count
+            return result
+        finally:
+            self._lock.release()
+
+    def prometheus(self, prefix='familysearch'):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        self._lock.acquire()
+        try:
+            lines = ['# HELP %s_request_seconds Time spent in each phase of a request' % prefix,
+                     '# TYPE %s_request_seconds histogram' % prefix]
+            for ((name, phase), histogram) in sorted(self.latency.items()):
+                labels = [('endpoint', name), ('phase', phase)]
+                for (bound, count) in histogram.cumulative():
+                    lines.append('%s_request_seconds_bucket%s %d'
+                                 % (prefix, _labels(labels + [('le', _bound(bound))]), count))
+                lines.append('%s_request_seconds_sum%s %r' % (prefix, _labels(labels), histogram.sum))
+                lines.append('%s_request_seconds_count%s %d' % (prefix, _labels(labels), histogram.count))
+            lines.extend(['# HELP %s_received_bytes_total Response body bytes received' % prefix,
+                          '# TYPE %s_received_bytes_total counter' % prefix])
+            for (name, count) in sorted(self.bytes_received.items()):
+                lines.append('%s_received_bytes_total%s %d' % (prefix, _labels([('endpoint', name)]), count))
+            lines.extend(['# HELP %s_responses_total Responses received, by status' % prefix,
+                          '# TYPE %s_responses_total counter' % prefix])
+            for ((name, status), count) in sorted(self.statuses.items()):
+                lines.append('%s_responses_total%s %d'
+                             % (prefix, _labels([('endpoint', name), ('status', status)]), count))
+            lines.extend(['# HELP %s_errors_total Failed requests, by error' % prefix,
+                          '# TYPE %s_errors_total counter' % prefix])
+            for ((name, error), count) in sorted(self.errors.items()):
+                lines.append('%s_errors_total%s %d'
+                             % (prefix, _labels([('endpoint', name), ('error', error)]), count))
+            return '\n'.join(lines) + '\n'
+        finally:
+            self._lock.release()
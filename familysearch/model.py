@@ -0,0 +1,610 @@
+"""
+A compact typed model of Family Tree results
+
+Main classes: Person, Persona, Pedigree
+
+The Family Tree endpoints return each person as deeply nested dicts
+(assertions -> names -> value -> forms -> pieces), which take a lot of memory
+when many persons are kept around. These classes hold the same data in
+objects with __slots__, share one copy of enum-like strings (such as event
+types and genders), and keep each person's assertions in compact JSON form
+until they are first accessed. A crawler that only looks at IDs, genders,
+and relationships never decodes them at all.
+
+Each object keeps any attributes it doesn't know about in its extra
+attribute, so to_json_dict always returns the dict it was built from.
+
+Example usage:
+
+fs = FamilySearch('ClientApp/1.0', 'developer_key', typed=True)
+person = fs.person('ABCD-123', parents='summary')
+print person.id, person.gender, person.name
+for event in person.events:
+    print event.type, event.date and event.date.normalized
+for family in person.parents:
+    print [parent.id for parent in family.parents]
+"""
+
+import jsoncodec
+
+# Shared copies of enum-like strings (see _intern)
+_interned = {}
+
+
+def _intern(value):
+    """
+    Return a shared copy of an enum-like string (or the value itself if it is None).
+
+    Unlike the intern builtin, this also works for unicode strings.
+    """
+    if value is None:
+        return None
+    return _interned.setdefault(value, value)
+
+
+def _extra(data, known):
+    """
+    Return a dict of the items of data whose keys are not known, or None if there are none.
+    """
+    extra = None
+    for key in data:
+        if key not in known:
+            if extra is None:
+                extra = {}
+            extra[key] = data[key]
+    return extra
+
+
+def _compact(items):
+    """
+    Build a dict from (key, value) pairs, leaving out None values.
+    """
+    return dict([(key, value) for (key, value) in items if value is not None])
+
+
+def _model(model_class, data):
+    """
+    Build a model object from a dict (or return None if data is None).
+    """
+    if data is None:
+        return None
+    return model_class.from_json(data)
+
+
+def _models(model_class, items):
+    """
+    Build a list of model objects from a list of dicts (or return None if items is None).
+    """
+    if items is None:
+        return None
+    return [model_class.from_json(item) for item in items]
+
+
+def _dict(model):
+    """
+    Convert a model object back to a dict (or return None if model is None).
+    """
+    if model is None:
+        return None
+    return model.to_json_dict()
+
+
+def _dicts(models):
+    """
+    Convert a list of model objects back to a list of dicts (or return None if models is None).
+    """
+    if models is None:
+        return None
+    return [model.to_json_dict() for model in models]
+
+
+def _from_json(model_class, data):
+    """
+    Build a model object from a dict (used to unpickle model objects).
+    """
+    return model_class.from_json(data)
+
+
+# Names of the slots of each model class, including inherited ones
+_slots = {}
+
+
+class Model(object):
+
+    """
+    Base class for all model objects
+
+    Subclasses list their fields in __slots__ and implement from_json and
+    to_json_dict. Fields missing from the JSON data are None.
+
+    Public attributes:
+
+    extra -- dict of JSON attributes this class doesn't know about, or None
+    """
+
+    __slots__ = ('extra',)
+
+    def __init__(self, **kw):
+        names = _slots.get(self.__class__)
+        if names is None:
+            names = []
+            for cls in self.__class__.__mro__:
+                names.extend(getattr(cls, '__slots__', ()))
+            _slots[self.__class__] = names
+        for name in names:
+            setattr(self, name, kw.get(name))
+
+    def from_json(cls, data):
+        """
+        Build an object from a decoded JSON dict.
+        """
+        raise NotImplementedError
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        """
+        Return the JSON dict this object represents.
+        """
+        raise NotImplementedError
+
+    def _json_dict(self, items):
+        """
+        Build a JSON dict from (key, value) pairs and extra, leaving out None values.
+        """
+        d = _compact(items)
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and self.to_json_dict() == other.to_json_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        return (_from_json, (self.__class__, self.to_json_dict()))
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.to_json_dict())
+
+
+class PersonReference(Model):
+
+    """
+    A reference to a related person (a parent, child, or spouse)
+
+    Public attributes:
+
+    id -- person ID
+    gender -- 'Male', 'Female', or None
+    """
+
+    __slots__ = ('id', 'gender')
+
+    def from_json(cls, data):
+        return cls(id=data.get('id'), gender=_intern(data.get('gender')),
+                   extra=_extra(data, ('id', 'gender')))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        return self._json_dict([('id', self.id), ('gender', self.gender)])
+
+
+class Family(Model):
+
+    """
+    A set of parents and their children
+
+    Public attributes:
+
+    parents -- list of PersonReference objects (or None)
+    children -- list of PersonReference objects (or None)
+    """
+
+    __slots__ = ('parents', 'children')
+
+    def from_json(cls, data):
+        return cls(parents=_models(PersonReference, data.get('parent')),
+                   children=_models(PersonReference, data.get('child')),
+                   extra=_extra(data, ('parent', 'child')))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        return self._json_dict([('parent', _dicts(self.parents)),
+                                ('child', _dicts(self.children))])
+
+
+class NamePiece(Model):
+
+    """
+    A piece of a name form (such as a given name or surname)
+
+    Public attributes:
+
+    type -- 'Given', 'Family', and so on
+    value -- text of the piece
+    predelimiters -- text preceding the piece in the full name
+    postdelimiters -- text following the piece in the full name
+    """
+
+    __slots__ = ('type', 'value', 'predelimiters', 'postdelimiters')
+
+    def from_json(cls, data):
+        return cls(type=_intern(data.get('type')), value=data.get('value'),
+                   predelimiters=_intern(data.get('predelimiters')),
+                   postdelimiters=_intern(data.get('postdelimiters')),
+                   extra=_extra(data, cls.__slots__))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        return self._json_dict([('type', self.type), ('value', self.value),
+                                ('predelimiters', self.predelimiters),
+                                ('postdelimiters', self.postdelimiters)])
+
+
+class NameForm(Model):
+
+    """
+    A form of a name (such as in one script)
+
+    Public attributes:
+
+    full_text -- the full name
+    pieces -- list of NamePiece objects (or None)
+    """
+
+    __slots__ = ('full_text', 'pieces')
+
+    def from_json(cls, data):
+        return cls(full_text=data.get('fullText'), pieces=_models(NamePiece, data.get('pieces')),
+                   extra=_extra(data, ('fullText', 'pieces')))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        return self._json_dict([('fullText', self.full_text),
+                                ('pieces', _dicts(self.pieces))])
+
+
+class Name(Model):
+
+    """
+    The value of a name assertion
+
+    Public attributes:
+
+    type -- 'Name', 'Also Known As', and so on
+    forms -- list of NameForm objects (or None)
+    full_text -- full text of the first form (or None)
+    """
+
+    __slots__ = ('type', 'forms')
+
+    def from_json(cls, data):
+        return cls(type=_intern(data.get('type')), forms=_models(NameForm, data.get('forms')),
+                   extra=_extra(data, ('type', 'forms')))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        return self._json_dict([('type', self.type),
+                                ('forms', _dicts(self.forms))])
+
+    def _get_full_text(self):
+        if self.forms:
+            return self.forms[0].full_text
+    full_text = property(_get_full_text)
+
+
+class Gender(Model):
+
+    """
+    The value of a gender assertion
+
+    Public attributes:
+
+    type -- 'Male', 'Female', or 'Unknown'
+    """
+
+    __slots__ = ('type',)
+
+    def from_json(cls, data):
+        return cls(type=_intern(data.get('type')), extra=_extra(data, ('type',)))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        return self._json_dict([('type', self.type)])
+
+
+class Date(Model):
+
+    """
+    The date of an event
+
+    Public attributes:
+
+    original -- the date as it was entered
+    normalized -- the standardized date
+    numeric -- the date in YYYY-MM-DD form
+    gedcom -- the date in GEDCOM form
+    earliest -- earliest astronomical day number of the date
+    latest -- latest astronomical day number of the date
+    selected -- whether the date was selected by the user
+    """
+
+    __slots__ = ('original', 'normalized', 'numeric', 'gedcom', 'earliest', 'latest', 'selected')
+
+    def from_json(cls, data):
+        extra = _extra(data, ('original', 'normalized', 'numeric', 'gedcom', 'astro', 'selected'))
+        astro = data.get('astro') or {}
+        if _extra(astro, ('earliest', 'latest')):
+            # Keep an unfamiliar astro object as it is
+            extra = dict(extra or {})
+            extra['astro'] = astro
+            astro = {}
+        return cls(original=data.get('original'), normalized=data.get('normalized'),
+                   numeric=data.get('numeric'), gedcom=data.get('gedcom'),
+                   earliest=astro.get('earliest'), latest=astro.get('latest'),
+                   selected=data.get('selected'), extra=extra)
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        astro = _compact([('earliest', self.earliest), ('latest', self.latest)]) or None
+        return self._json_dict([('original', self.original), ('normalized', self.normalized),
+                                ('numeric', self.numeric), ('gedcom', self.gedcom),
+                                ('astro', astro), ('selected', self.selected)])
+
+
+class Place(Model):
+
+    """
+    The place of an event
+
+    Public attributes:
+
+    original -- the place as it was entered
+    id -- ID of the standardized place (see FamilySearch.place)
+    normalized -- name of the standardized place
+    version -- version of the place authority that standardized it
+    selected -- whether the place was selected by the user
+    """
+
+    __slots__ = ('original', 'id', 'normalized', 'version', 'selected')
+
+    def from_json(cls, data):
+        extra = _extra(data, ('original', 'normalized', 'selected'))
+        normalized = data.get('normalized') or {}
+        if _extra(normalized, ('id', 'value', 'version')):
+            extra = dict(extra or {})
+            extra['normalized'] = normalized
+            normalized = {}
+        return cls(original=data.get('original'), id=normalized.get('id'),
+                   normalized=normalized.get('value'), version=_intern(normalized.get('version')),
+                   selected=data.get('selected'), extra=extra)
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        normalized = _compact([('id', self.id), ('value', self.normalized), ('version', self.version)]) or None
+        return self._json_dict([('original', self.original), ('normalized', normalized),
+                                ('selected', self.selected)])
+
+
+class Event(Model):
+
+    """
+    The value of an event assertion
+
+    Public attributes:
+
+    type -- 'Birth', 'Death', 'Christening', and so on
+    date -- Date object (or None)
+    place -- Place object (or None)
+    """
+
+    __slots__ = ('type', 'date', 'place')
+
+    def from_json(cls, data):
+        return cls(type=_intern(data.get('type')),
+                   date=_model(Date, data.get('date')), place=_model(Place, data.get('place')),
+                   extra=_extra(data, ('type', 'date', 'place')))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        return self._json_dict([('type', self.type),
+                                ('date', _dict(self.date)), ('place', _dict(self.place))])
+
+
+class Assertion(Model):
+
+    """
+    An assertion about a person
+
+    Public attributes:
+
+    value -- Name, Gender, or Event object for assertions of those kinds,
+             or a dict for other kinds
+    """
+
+    __slots__ = ('value',)
+
+    # Model classes of the values of each kind of assertion
+    value_classes = {'names': Name, 'genders': Gender, 'events': Event}
+
+    def from_json(cls, data, kind=None):
+        value = data.get('value')
+        value_class = cls.value_classes.get(kind)
+        if value is not None and value_class is not None:
+            value = value_class.from_json(value)
+        return cls(value=value, extra=_extra(data, ('value',)))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        value = self.value
+        if isinstance(value, Model):
+            value = value.to_json_dict()
+        return self._json_dict([('value', value)])
+
+
+class Person(Model):
+
+    """
+    A person in the family tree
+
+    The assertions are only decoded when first accessed (through the
+    assertions, names, events, name, birth, or death attributes).
+
+    Public attributes:
+
+    id -- person ID
+    version -- version of the person
+    gender -- gender type of the first gender assertion (or None)
+    parents -- list of Family objects for each set of parents (or None)
+    families -- list of Family objects for each spouse (or None)
+    assertions -- dict mapping each kind of assertion (such as 'names') to
+                  a list of Assertion objects (or None)
+    names -- list of Name objects
+    events -- list of Event objects
+    name -- full text of the first name (or None)
+    birth -- first Birth Event (or None)
+    death -- first Death Event (or None)
+    father -- PersonReference of the father in the first set of parents (or None)
+    mother -- PersonReference of the mother in the first set of parents (or None)
+    """
+
+    __slots__ = ('id', 'version', 'gender', 'parents', 'families', '_assertions', '_raw_assertions')
+
+    def from_json(cls, data):
+        person = cls(id=data.get('id'), version=data.get('version'),
+                     parents=_models(Family, data.get('parents')),
+                     families=_models(Family, data.get('families')),
+                     extra=_extra(data, ('id', 'version', 'parents', 'families', 'assertions')))
+        assertions = data.get('assertions')
+        if assertions is not None:
+            try:
+                person.gender = _intern(assertions['genders'][0]['value']['type'])
+            except (KeyError, IndexError, TypeError):
+                pass
+            person._raw_assertions = jsoncodec.dumps(assertions, separators=(',', ':'))
+        return person
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        assertions = None
+        if self._raw_assertions is not None:
+            assertions = jsoncodec.loads(self._raw_assertions)
+        elif self._assertions is not None:
+            assertions = dict([(kind, _dicts(items)) for (kind, items) in self._assertions.iteritems()])
+        return self._json_dict([('id', self.id), ('version', self.version),
+                                ('parents', _dicts(self.parents)),
+                                ('families', _dicts(self.families)),
+                                ('assertions', assertions)])
+
+    def _get_assertions(self):
+        if self._raw_assertions is not None:
+            raw = jsoncodec.loads(self._raw_assertions)
+            self._assertions = dict([(_intern(kind), [Assertion.from_json(item, kind) for item in items])
+                                     for (kind, items) in raw.iteritems()])
+            self._raw_assertions = None
+        return self._assertions
+    assertions = property(_get_assertions)
+
+    def _values(self, kind):
+        """
+        Return the values of the assertions of a kind.
+        """
+        assertions = self.assertions or {}
+        return [assertion.value for assertion in assertions.get(kind, [])]
+
+    def _get_names(self):
+        return self._values('names')
+    names = property(_get_names)
+
+    def _get_events(self):
+        return self._values('events')
+    events = property(_get_events)
+
+    def _get_name(self):
+        for name in self.names:
+            if name.full_text is not None:
+                return name.full_text
+    name = property(_get_name)
+
+    def _event(self, type):
+        """
+        Return the first event of a type, or None.
+        """
+        for event in self.events:
+            if event.type == type:
+                return event
+
+    def _get_birth(self):
+        return self._event('Birth')
+    birth = property(_get_birth)
+
+    def _get_death(self):
+        return self._event('Death')
+    death = property(_get_death)
+
+    def _get_father(self):
+        return self._parent('Male')
+    father = property(_get_father)
+
+    def _get_mother(self):
+        return self._parent('Female')
+    mother = property(_get_mother)
+
+    def _parent(self, gender):
+        """
+        Return the parent of a gender in the first set of parents, or None.
+        """
+        for parent in (self.parents and self.parents[0].parents) or []:
+            if parent.gender == gender:
+                return parent
+
+
+class Persona(Person):
+
+    """
+    A persona (a person as it was submitted to the family tree)
+    """
+
+    __slots__ = ()
+
+
+class Pedigree(Model):
+
+    """
+    The pedigree of a person
+
+    Public attributes:
+
+    id -- ID of the person whose pedigree this is
+    requested_id -- person ID that was requested (if it has been merged
+                    into another person, it differs from id)
+    persons -- list of Person objects in the pedigree
+    """
+
+    __slots__ = ('id', 'requested_id', 'persons')
+
+    def from_json(cls, data):
+        return cls(id=data.get('id'), requested_id=data.get('requestedId'),
+                   persons=_models(Person, data.get('persons')),
+                   extra=_extra(data, ('id', 'requestedId', 'persons')))
+    from_json = classmethod(from_json)
+
+    def to_json_dict(self):
+        return self._json_dict([('id', self.id), ('requestedId', self.requested_id),
+                                ('persons', _dicts(self.persons))])
+
+    def person(self, person_id=None):
+        """
+        Return the person in the pedigree with the given ID (or the root person), or None.
+        """
+        if person_id is None:
+            person_id = self.id
+        for person in self.persons or []:
+            if person.id == person_id:
+                return person
+
+
+# Model classes of the results of each family tree endpoint
+results = {'persons': Person, 'personas': Persona, 'pedigrees': Pedigree}
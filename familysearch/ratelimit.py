@@ -0,0 +1,251 @@
+"""
+Client-side rate limiting of FamilySearch requests
+
+Main classes: RateLimiter, TokenBucket, SharedTokenBucket
+
+FamilySearch throttles requests per developer key. A RateLimiter keeps a
+token bucket for each key and makes every request wait for a token, so that
+all requests made with a key stay within its budget. Buckets are shared by
+all threads using the same RateLimiter and, if a directory is given, by all
+processes on the same host using that directory.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
+try:
+    from hashlib import sha1
+except ImportError:
+    # Python < 2.5
+    from sha import new as sha1
+
+
+class TokenBucket(object):
+
+    """
+    A thread-safe token bucket
+
+    The bucket holds at most burst tokens and is refilled at rate tokens per
+    second. Each request takes one token, waiting for it if necessary.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Instantiate a TokenBucket.
+
+        Keyword arguments:
+        rate -- number of tokens added per second
+        burst (optional) -- maximum number of tokens (defaults to rate, or 1
+                            if rate is less than 1); must be at least 1
+        """
+        if burst is None:
+            burst = max(rate, 1)
+        if burst < 1:
+            raise ValueError('burst must be at least 1: %r' % burst)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = time.time
+        self.sleep = time.sleep
+        self._lock = threading.Lock()
+        self._state = (self.burst, self.clock())
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens from the bucket, waiting until enough are available.
+
+        Returns the number of seconds spent waiting. Raises ValueError if
+        more tokens are asked for than the bucket can hold.
+        """
+        self._check(tokens)
+        waited = 0.0
+        while True:
+            delay = self._take(tokens)
+            if not delay:
+                return waited
+            self.sleep(delay)
+            waited += delay
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens from the bucket if enough are available right now.
+
+        Returns True if the tokens were taken, or False otherwise. Raises
+        ValueError if more tokens are asked for than the bucket can hold.
+        """
+        self._check(tokens)
+        return not self._take(tokens)
+
+    def _check(self, tokens):
+        if tokens > self.burst:
+            raise ValueError('cannot take %r tokens from a bucket of %r' % (tokens, self.burst))
+
+    def _take(self, tokens):
+        """
+        Take tokens if available, returning 0; otherwise return the delay in
+        seconds until they will be.
+        """
+        self._acquire_lock()
+        try:
+            (available, updated) = self._load()
+            now = self.clock()
+            available = min(self.burst, available + max(0, now - updated) * self.rate)
+            if available >= tokens:
+                self._store(available - tokens, now)
+                return 0
+            self._store(available, now)
+            return (tokens - available) / self.rate
+        finally:
+            self._release_lock()
+
+    def _acquire_lock(self):
+        self._lock.acquire()
+
+    def _release_lock(self):
+        self._lock.release()
+
+    def _load(self):
+        return self._state
+
+    def _store(self, available, updated):
+        self._state = (available, updated)
+
+
+class SharedTokenBucket(TokenBucket):
+
+    """
+    A token bucket whose state is shared between processes through a file
+
+    The state is kept in a small memory-mapped file, updated under an
+    exclusive lock. Requires fcntl (i.e., a Unix-like system).
+    """
+
+    _format = '!dd'
+
+    def __init__(self, path, rate, burst=None):
+        """
+        Instantiate a SharedTokenBucket.
+
+        Keyword arguments:
+        path -- path of the file holding the shared state (created if needed)
+        rate -- number of tokens added per second
+        burst (optional) -- maximum number of tokens (defaults to rate, or 1
+                            if rate is less than 1)
+        """
+        if fcntl is None:
+            raise NotImplementedError('shared token buckets require fcntl')
+        TokenBucket.__init__(self, rate, burst)
+        self.path = path
+        size = struct.calcsize(self._format)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.write(self._fd, struct.pack(self._format, self.burst, self.clock()))
+            self._map = mmap.mmap(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        """
+        Release the shared state file.
+        """
+        self._map.close()
+        os.close(self._fd)
+
+    def _acquire_lock(self):
+        # flock doesn't exclude other threads using the same descriptor, so
+        # also take the thread lock
+        self._lock.acquire()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def _release_lock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def _load(self):
+        return struct.unpack(self._format, self._map[:])
+
+    def _store(self, available, updated):
+        self._map[:] = struct.pack(self._format, available, updated)
+
+
+class RateLimiter(object):
+
+    """
+    A per-developer-key rate limiter for FamilySearch requests
+
+    Each developer key gets its own token bucket with the given rate and
+    burst size. If directory is given, each bucket's state is kept in a file
+    in that directory, so that all processes using the same directory share
+    the budget for a key.
+    """
+
+    def __init__(self, rate, burst=None, directory=None):
+        """
+        Instantiate a RateLimiter.
+
+        Keyword arguments:
+        rate -- number of requests allowed per second for each key
+        burst (optional) -- number of requests that may be made at once
+                            (defaults to rate)
+        directory (optional) -- directory holding shared bucket state, to
+                                share budgets between processes; use
+                                shared_directory() for a default location
+        """
+        if burst is not None and burst < 1:
+            raise ValueError('burst must be at least 1: %r' % burst)
+        self.rate = rate
+        self.burst = burst
+        self.directory = directory
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        """
+        Return the token bucket for the given developer key.
+        """
+        self._lock.acquire()
+        try:
+            if key not in self._buckets:
+                if self.directory:
+                    name = 'familysearch-%s.bucket' % sha1(str(key)).hexdigest()[:16]
+                    path = os.path.join(self.directory, name)
+                    self._buckets[key] = SharedTokenBucket(path, self.rate, self.burst)
+                else:
+                    self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return self._buckets[key]
+        finally:
+            self._lock.release()
+
+    def acquire(self, key):
+        """
+        Wait until a request may be made with the given developer key.
+
+        Returns the number of seconds spent waiting.
+        """
+        return self.bucket(key).acquire()
+
+
+def shared_directory():
+    """
+    Return a per-user directory for sharing rate limiter state between processes.
+    """
+    directory = os.path.join(tempfile.gettempdir(), 'familysearch-%s' % os.getuid())
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory, 0700)
+        except OSError:
+            # Another process may have created it first
+            if not os.path.isdir(directory):
+                raise
+    return directory
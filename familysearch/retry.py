@@ -0,0 +1,165 @@
+"""
+Retrying idempotent requests that fail transiently
+
+Main class: RetryPolicy
+"""
+
+import httplib
+import random
+import socket
+import threading
+import time
+import urllib2
+
+try:
+    from email.utils import parsedate_tz, mktime_tz
+except ImportError:
+    # Python < 2.5
+    from email.Utils import parsedate_tz, mktime_tz
+
+
+class RetryPolicy(object):
+
+    """
+    A policy for retrying failed GET requests with exponential backoff
+
+    A request is retried if it fails with one of the listed HTTP status codes
+    or (optionally) with a connection error, until max_attempts have been made.
+    Before attempt n + 1, the policy waits backoff * 2 ** (n - 1) seconds (at
+    most max_backoff), reduced by a random fraction of up to jitter so that
+    many clients don't retry in lockstep. A Retry-After header sent with the
+    error takes precedence over the computed delay.
+
+    Public attributes (counters, updated as requests are made):
+
+    attempts -- total number of attempts made
+    retries -- number of attempts that were retries
+    retries_by_status -- dict mapping each HTTP status code (or 'error' for
+                         connection errors) to the number of retries it caused
+    failures -- number of requests that failed after the last attempt
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=30.0,
+                 jitter=0.5, statuses=(500, 502, 503, 504),
+                 retry_errors=True, retry_after=True):
+        """
+        Instantiate a RetryPolicy.
+
+        Keyword arguments:
+        max_attempts (optional) -- maximum number of attempts per request,
+                                   including the first (defaults to 3;
+                                   1 disables retries)
+        backoff (optional) -- delay in seconds before the first retry
+                              (defaults to 0.5)
+        max_backoff (optional) -- maximum delay in seconds (defaults to 30)
+        jitter (optional) -- maximum fraction by which each delay is randomly
+                             reduced (defaults to 0.5)
+        statuses (optional) -- HTTP status codes to retry
+                               (defaults to 500, 502, 503, and 504)
+        retry_errors (optional) -- whether to retry connection errors
+                                   (defaults to True)
+        retry_after (optional) -- whether to honor Retry-After headers
+                                  (defaults to True)
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.retry_errors = retry_errors
+        self.retry_after = retry_after
+        self.sleep = time.sleep
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters to zero.
+        """
+        self._lock.acquire()
+        try:
+            self.attempts = 0
+            self.retries = 0
+            self.retries_by_status = {}
+            self.failures = 0
+        finally:
+            self._lock.release()
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call fn(*args, **kwargs), retrying it according to this policy.
+
+        Returns the result of the first successful call. If the last attempt
+        fails, or an error is not retryable, the error is re-raised.
+
+        """
+        attempt = 1
+        while True:
+            self._count('attempts')
+            try:
+                return fn(*args, **kwargs)
+            except (urllib2.URLError, socket.error, httplib.HTTPException), error:
+                reason = self._reason(error)
+                if reason is None or attempt >= self.max_attempts:
+                    if reason is not None:
+                        self._count('failures')
+                    raise
+                delay = self.delay(attempt, error)
+                if isinstance(error, urllib2.HTTPError) and error.fp is not None:
+                    error.close()
+            self._lock.acquire()
+            try:
+                self.retries += 1
+                self.retries_by_status[reason] = self.retries_by_status.get(reason, 0) + 1
+            finally:
+                self._lock.release()
+            self.sleep(delay)
+            attempt += 1
+
+    def delay(self, attempt, error=None):
+        """
+        Return the number of seconds to wait after the given failed attempt.
+        """
+        if self.retry_after and isinstance(error, urllib2.HTTPError):
+            retry_after = parse_retry_after(error.info())
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay * (1 - self.jitter * random.random())
+
+    def _reason(self, error):
+        """
+        Return the counter key for a retryable error, or None if it isn't retryable.
+        """
+        if isinstance(error, urllib2.HTTPError):
+            if error.code in self.statuses:
+                return error.code
+            return None
+        if self.retry_errors:
+            return 'error'
+        return None
+
+    def _count(self, counter):
+        self._lock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self._lock.release()
+
+
+def parse_retry_after(headers):
+    """
+    Return the delay in seconds requested by a Retry-After header, or None.
+
+    The header may contain either a number of seconds or an HTTP date.
+    """
+    value = headers and headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, mktime_tz(date) - time.time())
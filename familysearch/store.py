@@ -0,0 +1,433 @@
+"""
+A persistent store of FamilySearch results, backed by SQLite
+
+Main classes: SQLiteStore
+
+An SQLiteStore keeps the decoded (and cleaned) results of the person,
+persona, and pedigree endpoints and of the Authorities endpoints, one row
+per endpoint, ID, and set of query parameters, along with the version of
+each result. FamilySearch methods read through the store when it is passed
+as the store argument, so only the IDs that aren't stored (or whose entries
+have expired) are requested. Versions are always requested from the server,
+and stored persons older than the versions read are discarded, so that
+changed persons are read again. The database uses write-ahead logging, so
+that many threads and processes can read and write it at once.
+
+Entries expire after a time to live (which may differ by endpoint), and the
+least recently used entries are evicted when the store grows beyond a number
+of entries or bytes. The time an entry was last used is only updated when
+it is older than access_interval, and never makes a reader wait for a
+writer, so readers don't take turns writing to the database. The store also implements the storage interface of
+cache.MemoryStorage (get, set, delete, clear), so it can back a
+cache.ResponseCache or cache.PersonCache that outlives the process.
+
+Example usage:
+
+from familysearch import FamilySearch
+from familysearch.store import SQLiteStore
+
+store = SQLiteStore('/var/cache/familysearch/store.db', ttl=24 * 60 * 60, ttls={'place': 30 * 24 * 60 * 60},
+                    max_bytes=512 * 1024 * 1024)
+fs = FamilySearch('ClientApp/1.0', 'developer_key', store=store)
+"""
+
+import os
+import threading
+import time
+import urllib
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import sqlite3
+except ImportError:
+    # Python < 2.5
+    try:
+        from pysqlite2 import dbapi2 as sqlite3
+    except ImportError:
+        sqlite3 = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    endpoint TEXT NOT NULL,
+    id TEXT NOT NULL,
+    params TEXT NOT NULL,
+    version TEXT,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (endpoint, id, params)
+);
+CREATE INDEX IF NOT EXISTS entries_version ON entries (endpoint, id, version);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+"""
+
+# Endpoint name under which items of the storage interface are kept
+STORAGE_ENDPOINT = ''
+
+# Maximum number of parameters in one SQL statement (SQLite's default limit
+# is 999)
+_MAX_VARIABLES = 500
+
+
+def params_key(params):
+    """
+    Return a canonical string for a dict of query parameters.
+    """
+    items = params.items()
+    items.sort()
+    return urllib.urlencode(items, True)
+
+
+def _result_id(result):
+    """
+    Return the ID a result was requested with, or None.
+    """
+    if not isinstance(result, dict):
+        return None
+    return result.get('requestedId') or result.get('id')
+
+
+class SQLiteStore(object):
+
+    """
+    A store of results in an SQLite database, shared by threads and processes
+
+    Each thread (and each process, after a fork) opens its own connection.
+
+    Public attributes:
+
+    path -- path of the database file
+    ttl -- number of seconds entries are kept (None for no expiry)
+    ttls -- dict mapping endpoint names to their own number of seconds
+    max_entries -- maximum number of entries kept (None for no limit)
+    max_bytes -- maximum total size of the entries kept (None for no limit)
+    evict_interval -- number of writes between evictions
+    access_interval -- number of seconds before an entry that is read again
+                       is marked as recently used
+
+    Public attributes (counters for this instance, updated as results are read):
+
+    hits -- results read from the store
+    misses -- results that were missing or expired
+    stores -- results written to the store
+    evictions -- entries removed to stay within the limits (not counting
+                 expired entries)
+    """
+
+    def __init__(self, path, ttl=None, ttls={}, max_entries=None, max_bytes=None, evict_interval=100,
+                 timeout=30, access_interval=60):
+        """
+        Instantiate an SQLiteStore, creating the database if needed.
+
+        Keyword arguments:
+        path -- path of the database file
+        ttl (optional) -- number of seconds entries are kept (defaults to no
+                          expiry)
+        ttls (optional) -- dict mapping endpoint names (such as 'person' or
+                           'place') to their own number of seconds
+        max_entries (optional) -- maximum number of entries kept (defaults
+                                  to no limit)
+        max_bytes (optional) -- maximum total size of the entries kept
+                                (defaults to no limit)
+        evict_interval (optional) -- number of writes between evictions
+                                     (defaults to 100)
+        timeout (optional) -- number of seconds to wait for another writer
+                              to finish (defaults to 30)
+        access_interval (optional) -- number of seconds before an entry
+                                      that is read again is marked as
+                                      recently used (defaults to 60)
+        """
+        if sqlite3 is None:
+            raise ImportError('SQLiteStore requires the sqlite3 module (or pysqlite2)')
+        self.path = path
+        self.ttl = ttl
+        self.ttls = dict(ttls)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.timeout = timeout
+        self.access_interval = access_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.reset()
+        self._connection()
+
+    def __getstate__(self):
+        """
+        Return the settings of this store (connections aren't pickled).
+        """
+        return {'path': self.path, 'ttl': self.ttl, 'ttls': self.ttls, 'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes, 'evict_interval': self.evict_interval, 'timeout': self.timeout,
+                'access_interval': self.access_interval}
+
+    def __setstate__(self, state):
+        """
+        Restore a store from its pickled settings.
+        """
+        self.__init__(**state)
+
+    def reset(self):
+        """
+        Reset all counters to zero.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        Return a dict of the counters, the hit ratio (the fraction of results
+        read from the store), and the number and total size of the entries.
+        """
+        lookups = self.hits + self.misses
+        ratio = 0.0
+        if lookups:
+            ratio = float(self.hits) / lookups
+        (entries, size) = self._connection().execute('SELECT COUNT(*), SUM(size) FROM entries').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions,
+                'hit_ratio': ratio, 'entries': entries, 'bytes': size or 0}
+
+    def get_many(self, endpoint, ids, params={}):
+        """
+        Return a dict mapping the IDs of a list that are stored (and not expired) to their results.
+        """
+        connection = self._connection()
+        key = params_key(params)
+        now = time.time()
+        rows = []
+        unique_ids = list(set(ids))
+        for i in range(0, len(unique_ids), _MAX_VARIABLES):
+            chunk = unique_ids[i:i + _MAX_VARIABLES]
+            rows.extend(connection.execute(
+                'SELECT id, value, accessed FROM entries WHERE endpoint = ? AND params = ? AND id IN (%s) '
+                'AND (expires IS NULL OR expires > ?)' % ','.join(['?'] * len(chunk)),
+                [endpoint, key] + chunk + [now]).fetchall())
+        results = dict([(id, pickle.loads(str(value))) for (id, value, accessed) in rows])
+        touched = [(now, endpoint, key, id) for (id, value, accessed) in rows
+                   if accessed <= now - self.access_interval]
+        if touched:
+            self._touch(connection, touched)
+        self._count('hits', len([id for id in ids if id in results]))
+        self._count('misses', len([id for id in ids if id not in results]))
+        return results
+
+    def set_many(self, endpoint, items, params={}):
+        """
+        Store a list of (ID, result) pairs.
+        """
+        if not items:
+            return
+        key = params_key(params)
+        now = time.time()
+        ttl = self.ttls.get(endpoint, self.ttl)
+        expires = None
+        if ttl is not None:
+            expires = now + ttl
+        rows = []
+        for (id, result) in items:
+            value = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+            version = None
+            if isinstance(result, dict) and result.get('version') is not None:
+                version = str(result['version'])
+            rows.append((endpoint, id, key, version, sqlite3.Binary(value), len(value), expires, now))
+        connection = self._connection()
+        self._write(connection, 'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self._count('stores', len(rows))
+        self._lock.acquire()
+        try:
+            self._writes += len(rows)
+            evict = self._writes >= self.evict_interval
+            if evict:
+                self._writes = 0
+        finally:
+            self._lock.release()
+        if evict:
+            self.evict()
+
+    def version(self, endpoint, id, params={}):
+        """
+        Return the version of a stored (and not expired) result, or None.
+        """
+        row = self._connection().execute(
+            'SELECT version FROM entries WHERE endpoint = ? AND id = ? AND params = ? '
+            'AND (expires IS NULL OR expires > ?)', (endpoint, id, params_key(params), time.time())).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def discard_stale(self, endpoint, versions):
+        """
+        Remove the entries of an endpoint stored at other versions than the latest ones.
+
+        versions is a list of (ID, latest version) pairs; entries stored
+        without a version are kept.
+        """
+        connection = self._connection()
+        victims = []
+        for i in range(0, len(versions), _MAX_VARIABLES // 2):
+            chunk = versions[i:i + _MAX_VARIABLES // 2]
+            conditions = ' OR '.join(['(id = ? AND version != ?)'] * len(chunk))
+            values = []
+            for (id, version) in chunk:
+                values.extend([id, str(version)])
+            victims.extend(connection.execute(
+                'SELECT rowid FROM entries WHERE endpoint = ? AND (%s)' % conditions, [endpoint] + values).fetchall())
+        if victims:
+            self._write(connection, 'DELETE FROM entries WHERE rowid = ?', victims)
+
+    def read(self, endpoint, ids, params, fetch):
+        """
+        Return the results for a list of IDs, reading the missing ones with fetch and storing them.
+
+        fetch is called with the list of IDs that aren't stored and must
+        return their results, identified by their requestedId or id.
+        Results without an ID (such as lists) are matched by position,
+        provided there are as many results as IDs. Returns the results in
+        the order of ids, leaving out IDs that fetch returned no result for.
+        """
+        results = self.get_many(endpoint, ids, params)
+        missing = []
+        missing_ids = set()
+        for id in ids:
+            if id not in results and id not in missing_ids:
+                missing_ids.add(id)
+                missing.append(id)
+        if missing:
+            fetched = fetch(missing)
+            items = []
+            for (index, result) in enumerate(fetched):
+                id = _result_id(result)
+                if id is None and len(fetched) == len(missing):
+                    id = missing[index]
+                if id in missing_ids:
+                    items.append((id, result))
+            self.set_many(endpoint, items, params)
+            results.update(dict(items))
+        return [results[id] for id in ids if id in results]
+
+    def get(self, key, default=None):
+        """
+        Return the item stored for key, or default (see cache.MemoryStorage).
+        """
+        return self.get_many(STORAGE_ENDPOINT, [key]).get(key, default)
+
+    def set(self, key, value, size=0):
+        """
+        Store an item (size is ignored) (see cache.MemoryStorage).
+        """
+        self.set_many(STORAGE_ENDPOINT, [(key, value)])
+
+    def delete(self, key):
+        """
+        Remove the item stored for key, if any.
+        """
+        self._write(self._connection(), 'DELETE FROM entries WHERE endpoint = ? AND id = ?',
+                    [(STORAGE_ENDPOINT, key)])
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        self._write(self._connection(), 'DELETE FROM entries', [()])
+
+    def evict(self):
+        """
+        Remove expired entries, then the least recently used ones beyond max_entries and max_bytes.
+        """
+        connection = self._connection()
+        self._write(connection, 'DELETE FROM entries WHERE expires <= ?', [(time.time(),)])
+        (entries, size) = connection.execute('SELECT COUNT(*), SUM(size) FROM entries').fetchone()
+        size = size or 0
+        excess_entries = 0
+        if self.max_entries is not None:
+            excess_entries = max(0, entries - self.max_entries)
+        excess_bytes = 0
+        if self.max_bytes is not None:
+            excess_bytes = max(0, size - self.max_bytes)
+        if not excess_entries and not excess_bytes:
+            return
+        victims = []
+        cursor = connection.execute('SELECT rowid, size FROM entries ORDER BY accessed')
+        try:
+            while excess_entries > 0 or excess_bytes > 0:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for (rowid, row_size) in rows:
+                    if excess_entries <= 0 and excess_bytes <= 0:
+                        break
+                    victims.append((rowid,))
+                    excess_entries -= 1
+                    excess_bytes -= row_size
+        finally:
+            cursor.close()
+        self._write(connection, 'DELETE FROM entries WHERE rowid = ?', victims)
+        self._count('evictions', len(victims))
+
+    def close(self):
+        """
+        Close the calling thread's connection to the database.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _connection(self):
+        """
+        Return the calling thread's connection, opening it if needed.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _write(self, connection, statement, rows):
+        """
+        Execute a statement for each of a list of rows in one transaction.
+        """
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(statement, rows)
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _touch(self, connection, rows):
+        """
+        Mark entries as recently used, unless another connection is writing.
+
+        The order of eviction is only approximate, so readers don't wait for
+        writers (or each other) to update it.
+        """
+        connection.execute('PRAGMA busy_timeout = 0')
+        try:
+            try:
+                self._write(connection, 'UPDATE entries SET accessed = ? WHERE endpoint = ? AND params = ? AND id = ?',
+                            rows)
+            except sqlite3.OperationalError:
+                pass
+        finally:
+            connection.execute('PRAGMA busy_timeout = %d' % int(self.timeout * 1000))
+
+    def _count(self, counter, n):
+        self._lock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + n)
+        finally:
+            self._lock.release()
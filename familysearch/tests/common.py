@@ -28,6 +28,31 @@ def add_request_intercept(response, out_environ=None, status='200 OK',
     wsgi_intercept.add_wsgi_intercept(host, port, lambda: mock_app)
     return out_environ
 
+def make_app(response, out_environ=None, status='200 OK', headers=default_headers, paths=None):
+    """Return a WSGI application returning the provided response, recording the request (and each path, if paths is given)."""
+    if out_environ is None:
+        out_environ = {}
+    def app(environ, start_response):
+        out_environ.update(environ)
+        out_environ['BODY'] = environ['wsgi.input'].read()
+        if paths is not None:
+            paths.append(environ['PATH_INFO'])
+        start_response(status, dict(headers).items())
+        return [response]
+    return app
+
+def add_sequence_intercept(responses, host='www.dev.usys.org', port=80):
+    """Globally install a request intercept returning each (status, headers, body) response in turn."""
+    responses = list(responses)
+    out_environs = []
+    def sequence_app(environ, start_response):
+        out_environs.append(environ)
+        status, headers, body = responses.pop(0)
+        start_response(status, dict(headers).items())
+        return [body]
+    wsgi_intercept.add_wsgi_intercept(host, port, lambda: sequence_app)
+    return out_environs
+
 def clear_request_intercpets():
     """Remove all installed request intercepts."""
     wsgi_intercept.remove_wsgi_intercept()
@@ -0,0 +1,104 @@
+import familysearch
+import unittest
+import urllib2
+import wsgi_intercept.httplib_intercept
+from familysearch import model
+from familysearch.fakeserver import FakeServer
+from familysearch.transport import WSGITransport
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from common import *
+
+sample_person1 = load_sample('person1.json')
+sample_place = load_sample('place.json')
+sample_login = load_sample('login.json')
+
+
+class TestAsyncFamilySearch(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.username = 'FAKE_USERNAME'
+        self.password = 'FAKE_PASSWORD'
+        self.id = 'FAKE_PERSON_ID'
+        wsgi_intercept.httplib_intercept.install()
+        self.fs = familysearch.AsyncFamilySearch(self.agent, self.key, session=self.session)
+
+    def tearDown(self):
+        clear_request_intercpets()
+        wsgi_intercept.httplib_intercept.uninstall()
+
+    def test_returns_future(self):
+        add_request_intercept(sample_person1)
+        future = self.fs.person(self.id)
+        self.assertTrue(hasattr(future, 'result'), 'method did not return a future')
+        future.result()
+        self.assertTrue(future.done(), 'future not done after result')
+
+    def test_result_matches_sync_method(self):
+        add_request_intercept(sample_person1)
+        person = self.fs.person(self.id).result()
+        self.assertEqual(person, self.fs.fs.person(self.id), 'async result differs from sync result')
+
+    def test_authorities_result(self):
+        add_request_intercept(sample_place)
+        place = self.fs.place(place='paris').result()
+        self.assertEqual(place['id'], json.loads(sample_place)['places']['place'][0]['id'], 'wrong place returned')
+
+    def test_many_requests_in_flight(self):
+        request_environ = add_request_intercept(sample_person1)
+        futures = [self.fs.person(self.id) for i in range(20)]
+        persons = [future.result() for future in futures]
+        self.assertEqual(len(persons), 20, 'wrong number of results')
+        self.assertTrue(request_environ['PATH_INFO'].endswith('person/' + self.id), 'incorrect person request')
+
+    def test_login_sets_logged_in(self):
+        add_request_intercept(sample_login)
+        fs = familysearch.AsyncFamilySearch(self.agent, self.key)
+        self.assertFalse(fs.logged_in, 'should not be logged in by default')
+        fs.login(self.username, self.password).result()
+        self.assertTrue(fs.logged_in, 'should be logged in after login completes')
+        self.assertEqual(fs.session_id, json.loads(sample_login)['session']['id'], 'session ID not set by login')
+
+    def test_passes_options_on(self):
+        server = FakeServer(size=1000, founders=10, seed=3)
+        fs = familysearch.AsyncFamilySearch(self.agent, self.key, session=self.session, max_workers=4,
+                                            transport=WSGITransport(server), typed=True)
+        self.assertEqual(fs.fs.pool_size, 4, 'pool_size not defaulted to max_workers')
+        person = fs.person(server.tree.id(500)).result()
+        self.assertTrue(isinstance(person, model.Person), 'typed not passed on')
+        self.assertEqual(person.id, server.tree.id(500), 'wrong person returned')
+
+    def test_close_stops_threads(self):
+        add_request_intercept(sample_person1)
+        fs = familysearch.AsyncFamilySearch(self.agent, self.key, session=self.session, max_workers=4)
+        futures = [fs.person([self.id] * 15) for i in range(8)]
+        threads = fs.workers._threads + fs.fs.workers._threads
+        self.assertTrue(len(threads) > 4, 'threads not started')
+        fs.close()
+        self.assertTrue([future.done() for future in futures] == [True] * 8, 'scheduled requests not completed')
+        self.assertEqual([thread for thread in threads if thread.isAlive()], [], 'threads still running')
+        self.assertRaises(RuntimeError, fs.person, self.id)
+
+    def test_result_raises_error(self):
+        add_request_intercept('', status='401 Unauthorized')
+        future = self.fs.person()
+        self.assertRaises(urllib2.HTTPError, future.result)
+        self.assertFalse(self.fs.logged_in, 'should not be logged in after receiving error 401')
+
+    def test_done_callback_called_when_done(self):
+        add_request_intercept(sample_person1)
+        done = []
+        future = self.fs.person(self.id)
+        future.result()
+        future.add_done_callback(done.append)
+        self.assertEqual(done, [future], 'done callback not called with future')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,330 @@
+import familysearch
+import shutil
+import tempfile
+import unittest
+import wsgi_intercept.httplib_intercept
+from familysearch import model
+from familysearch.cache import AuthoritiesCache, DiskStorage, MemoryStorage, PersonCache, ResponseCache
+from familysearch.cache import authorities_key, cache_key, normalize_query
+from familysearch.fakeserver import FakeServer
+from familysearch.transport import WSGITransport
+from common import *
+
+sample_person1 = load_sample('person1.json')
+sample_person2 = load_sample('person2.json')
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.id = 'FAKE_PERSON_ID'
+        self.etag = '"FAKE_ETAG"'
+        self.last_modified = 'Sat, 01 Jan 2011 00:00:00 GMT'
+        self.cached_headers = default_headers.copy()
+        self.cached_headers['ETag'] = self.etag
+        wsgi_intercept.httplib_intercept.install()
+        self.cache = ResponseCache()
+        self.fs = familysearch.FamilySearch(self.agent, self.key, session=self.session,
+                                            response_cache=self.cache)
+
+    def tearDown(self):
+        clear_request_intercpets()
+        wsgi_intercept.httplib_intercept.uninstall()
+
+    def test_revalidates_with_etag(self):
+        requests = add_sequence_intercept([('200 OK', self.cached_headers, sample_person1),
+                                           ('304 Not Modified', {}, '')])
+        self.fs.person(self.id)
+        self.fs.person(self.id)
+        self.assertNotIn('HTTP_IF_NONE_MATCH', requests[0], 'first request should not be conditional')
+        self.assertEqual(requests[1].get('HTTP_IF_NONE_MATCH'), self.etag, 'ETag not sent with second request')
+
+    def test_revalidates_with_last_modified(self):
+        headers = default_headers.copy()
+        headers['Last-Modified'] = self.last_modified
+        requests = add_sequence_intercept([('200 OK', headers, sample_person1),
+                                           ('304 Not Modified', {}, '')])
+        self.fs.person(self.id)
+        self.fs.person(self.id)
+        self.assertEqual(requests[1].get('HTTP_IF_MODIFIED_SINCE'), self.last_modified, 'Last-Modified not sent with second request')
+
+    def test_not_modified_returns_cached_body(self):
+        add_sequence_intercept([('200 OK', self.cached_headers, sample_person1),
+                                ('304 Not Modified', {}, '')])
+        person = self.fs.person(self.id)
+        self.assertEqual(self.fs.person(self.id), person, 'cached response differs from original')
+        self.assertEqual(self.cache.hits, 1, 'cache hit not counted')
+        self.assertEqual(self.cache.misses, 1, 'cache miss not counted')
+        self.assertEqual(self.cache.revalidations, 1, 'revalidation not counted')
+
+    def test_modified_replaces_cached_body(self):
+        add_sequence_intercept([('200 OK', self.cached_headers, sample_person1),
+                                ('200 OK', self.cached_headers, sample_person2),
+                                ('304 Not Modified', {}, '')])
+        self.fs.person(self.id)
+        person2 = self.fs.person(self.id)
+        self.assertEqual(self.fs.person(self.id), person2, 'modified response not cached')
+        self.assertEqual(self.cache.stores, 2, 'modified response not stored')
+
+    def test_does_not_cache_without_validators(self):
+        requests = add_sequence_intercept([('200 OK', default_headers, sample_person1),
+                                           ('200 OK', default_headers, sample_person1)])
+        self.fs.person(self.id)
+        self.fs.person(self.id)
+        self.assertNotIn('HTTP_IF_NONE_MATCH', requests[1], 'response without validators cached')
+        self.assertEqual(self.cache.stores, 0, 'response without validators stored')
+
+    def test_ignores_session_id(self):
+        self.assertEqual(cache_key('http://example.com/person?b=2&sessionId=ONE&a=1'),
+                         cache_key('http://example.com/person?a=1&sessionId=TWO&b=2'),
+                         'cache key depends on session ID or parameter order')
+        self.assertNotEqual(cache_key('http://example.com/person?a=1'),
+                            cache_key('http://example.com/person?a=2'),
+                            'cache key ignores query parameters')
+
+
+class TestMemoryStorage(unittest.TestCase):
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        storage = MemoryStorage(max_bytes=10)
+        storage.set('a', 'A', 4)
+        storage.set('b', 'B', 4)
+        storage.get('a')
+        storage.set('c', 'C', 4)
+        self.assertEqual(storage.get('a'), 'A', 'recently used item evicted')
+        self.assertEqual(storage.get('b'), None, 'least recently used item not evicted')
+        self.assertEqual(storage.bytes, 8, 'wrong total size')
+
+    def test_evicts_least_recently_used_by_entries(self):
+        storage = MemoryStorage(max_bytes=None, max_entries=2)
+        storage.set('a', 'A')
+        storage.set('b', 'B')
+        storage.set('c', 'C')
+        self.assertEqual(len(storage), 2, 'entry limit exceeded')
+        self.assertEqual(storage.get('a'), None, 'least recently used item not evicted')
+
+    def test_does_not_store_oversized_item(self):
+        storage = MemoryStorage(max_bytes=10)
+        storage.set('a', 'A', 11)
+        self.assertEqual(len(storage), 0, 'oversized item stored')
+
+
+class TestDiskStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stores_items(self):
+        DiskStorage(self.directory).set('key', {'body': 'BODY'})
+        self.assertEqual(DiskStorage(self.directory).get('key'), {'body': 'BODY'}, 'item not stored on disk')
+
+    def test_deletes_items(self):
+        storage = DiskStorage(self.directory)
+        storage.set('key', 'value')
+        storage.delete('key')
+        self.assertEqual(storage.get('key'), None, 'item not deleted')
+
+
+class TestPersonCache(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.server = FakeServer(size=10000, founders=100, seed=3)
+        self.tree = self.server.tree
+        self.fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY',
+                                            transport=WSGITransport(self.server))
+        self.numbers = range(5000, 5250)
+        self.ids = [self.tree.id(number) for number in self.numbers]
+        self.requests = {'person': [], 'version': []}
+        for endpoint in self.requests.keys():
+            self.record(endpoint)
+
+    def record(self, endpoint):
+        method = getattr(self.fs, endpoint)
+        def recording_method(ids, *args, **kwargs):
+            self.requests[endpoint].append(ids)
+            return method(ids, *args, **kwargs)
+        setattr(self.fs, endpoint, recording_method)
+
+    def test_returns_persons_in_order(self):
+        cache = PersonCache(self.fs)
+        persons = cache.get(self.ids)
+        self.assertEqual([person['id'] for person in persons], self.ids, 'wrong persons returned')
+        self.assertEqual(persons, self.fs.person(self.ids), 'cached persons differ')
+        self.assertEqual(cache.get(self.ids[3])['id'], self.ids[3], 'single person not returned')
+
+    def test_matches_persons_by_id(self):
+        person = self.fs.person
+        def reversed_person(ids, options={}, **kw_options):
+            persons = person(ids, options, **kw_options)
+            persons.reverse()
+            return persons
+        self.fs.person = reversed_person
+        cache = PersonCache(self.fs)
+        persons = cache.get(self.ids[:5])
+        self.assertEqual([person['id'] for person in persons], self.ids[:5], 'persons returned under wrong IDs')
+        self.assertEqual([person['id'] for person in cache.get(self.ids[:5])], self.ids[:5],
+                         'persons cached under wrong IDs')
+        self.assertEqual(cache.hits, 5, 'cached persons not returned')
+
+    def test_returns_none_for_missing_persons(self):
+        missing = self.ids[1]
+        person = self.fs.person
+        def deleting_person(ids, options={}, **kw_options):
+            return person([id for id in ids if id != missing], options, **kw_options)
+        self.fs.person = deleting_person
+        cache = PersonCache(self.fs)
+        persons = cache.get(self.ids[:3])
+        self.assertEqual(persons[1], None, 'result returned for missing person')
+        self.assertEqual([persons[0]['id'], persons[2]['id']], [self.ids[0], self.ids[2]], 'wrong persons returned')
+        self.assertEqual(cache.get(self.ids[2])['id'], self.ids[2], 'person cached under wrong ID')
+        self.assertEqual(cache.hits, 1, 'person not cached')
+
+    def test_reads_only_changed_persons(self):
+        cache = PersonCache(self.fs)
+        cache.get(self.ids)
+        self.requests['person'] = []
+        self.tree.touch(self.numbers[5])
+        self.tree.touch(self.numbers[100])
+        persons = cache.get(self.ids)
+        self.assertEqual(self.requests['person'], [[self.ids[5], self.ids[100]]], 'wrong persons read')
+        self.assertEqual(len(self.requests['version']), 2, 'versions not validated once per call')
+        self.assertEqual(persons[5]['version'], self.tree.version(self.numbers[5]), 'stale person returned')
+        self.assertEqual(cache.stats()['hits'], len(self.ids) - 2, 'wrong number of hits')
+        self.assertEqual(cache.misses, len(self.ids) + 2, 'wrong number of misses')
+
+    def test_repeated_reads_make_no_person_requests(self):
+        cache = PersonCache(self.fs)
+        cache.get(self.ids[:10])
+        self.requests['person'] = []
+        cache.get(self.ids[:10] + self.ids[:10])
+        self.assertEqual(self.requests['person'], [], 'cached persons read again')
+        self.assertEqual(cache.stats()['hit_ratio'], 2.0 / 3, 'wrong hit ratio')
+
+    def test_sends_options(self):
+        cache = PersonCache(self.fs, names='all')
+        options = []
+        person = self.fs.person
+        def recording_person(ids, options_arg={}, **kwargs):
+            options.append(options_arg)
+            return person(ids, options_arg, **kwargs)
+        self.fs.person = recording_person
+        cache.get(self.ids[0])
+        self.assertEqual(options, [{'names': 'all'}], 'options not sent')
+
+    def test_stores_typed_persons_on_disk(self):
+        directory = tempfile.mkdtemp()
+        try:
+            fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=WSGITransport(self.server),
+                                           typed=True)
+            PersonCache(fs, DiskStorage(directory)).get(self.ids[:3])
+            cache = PersonCache(fs, DiskStorage(directory))
+            persons = cache.get(self.ids[:3])
+            self.assertEqual(cache.hits, 3, 'persons not read from disk')
+            self.assertTrue(isinstance(persons[0], model.Person), 'persons not returned as models')
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestAuthoritiesCache(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.server = FakeServer(size=1000, founders=100)
+        self.fs = self.familysearch(AuthoritiesCache())
+
+    def familysearch(self, cache):
+        fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=WSGITransport(self.server),
+                                       authorities_cache=cache)
+        self.urls = []
+        fs.add_hook('before_send', lambda event, info: self.urls.append(info.url))
+        return fs
+
+    def test_memoizes_each_endpoint(self):
+        for (method, args, kwargs) in [(self.fs.place, (), {'place': 'Paris'}), (self.fs.place, ('5061509',), {}),
+                                       (self.fs.name, ('John Smith',), {}), (self.fs.date, ('1 Jan 1900',), {}),
+                                       (self.fs.culture, (), {})]:
+            expected = method(*args, **kwargs)
+            self.urls = []
+            for i in range(3):
+                self.assertEqual(method(*args, **kwargs), expected, 'memoized result of %s differs' % method.__name__)
+            self.assertEqual(self.urls, [], 'memoized result of %s requested' % method.__name__)
+        stats = self.fs.authorities_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (15, 5, 0.75), 'wrong counters')
+
+    def test_normalizes_input(self):
+        self.fs.place(place='Paris, France')
+        self.fs.place(place='  Paris,   France ')
+        self.fs.date(u'1 Jan 1900')
+        self.fs.date('1  Jan 1900')
+        self.assertEqual(len(self.urls), 2, 'normalized inputs requested again')
+        self.fs.place(place='PARIS, FRANCE')
+        self.assertEqual(len(self.urls), 3, 'inputs differing in case shared')
+        self.assertEqual(authorities_key('place', None, {'place': 'A  b', 'locale': 'fr'}),
+                         authorities_key('place', None, {'locale': 'fr', 'place': [' A b']}), 'keys differ')
+
+    def test_keeps_other_values(self):
+        self.assertEqual(normalize_query(5061509), 5061509, 'number changed')
+        self.assertEqual(normalize_query(None), None, 'None changed')
+        self.assertNotEqual(authorities_key('place', None, {'place': 1}),
+                            authorities_key('place', None, {'place': 2}), 'keys of numbers equal')
+        expected = self.fs.date(1900)
+        self.urls = []
+        self.assertEqual(self.fs.date(1900), expected, 'memoized result differs')
+        self.assertEqual(self.urls, [], 'memoized result requested')
+
+    def test_separates_options(self):
+        self.fs.place(place='Paris')
+        self.fs.place(place='Paris', locale='fr')
+        self.fs.place(place='Paris', locale='fr', filter='true')
+        self.fs.place(place='London')
+        self.assertEqual(len(self.urls), 4, 'results shared between options')
+
+    def test_evicts_least_recently_used(self):
+        fs = self.familysearch(AuthoritiesCache(max_entries=2))
+        fs.place(place='Paris')
+        fs.place(place='London')
+        fs.place(place='Paris')
+        fs.place(place='Berlin')
+        self.urls = []
+        fs.place(place='Paris')
+        fs.place(place='London')
+        self.assertEqual(len(self.urls), 1, 'wrong result evicted')
+
+    def test_bounds_bytes(self):
+        cache = AuthoritiesCache(max_entries=None, max_bytes=1000)
+        fs = self.familysearch(cache)
+        for name in ['John Smith', 'Jane Doe', 'Hans Schmidt', 'Jean Dupont', 'Juan Garcia']:
+            fs.name(name)
+        self.assertTrue(0 < cache.memory.bytes <= 1000, 'memory not bounded by bytes')
+        self.assertTrue(len(cache.memory) < 5, 'no results evicted')
+
+    def test_expires_results(self):
+        fs = self.familysearch(AuthoritiesCache(ttl=0))
+        fs.place(place='Paris')
+        fs.place(place='Paris')
+        self.assertEqual(len(self.urls), 2, 'expired result returned')
+
+    def test_persists_to_disk(self):
+        directory = tempfile.mkdtemp()
+        try:
+            expected = self.familysearch(AuthoritiesCache(storage=DiskStorage(directory))).place(place='Paris')
+            cache = AuthoritiesCache(storage=DiskStorage(directory))
+            fs = self.familysearch(cache)
+            self.assertEqual(fs.place(place='Paris'), expected, 'persisted result differs')
+            self.assertEqual(fs.place(place='Paris'), expected, 'persisted result not kept in memory')
+            self.assertEqual(self.urls, [], 'persisted result requested')
+            self.assertEqual((cache.storage_hits, cache.hits), (1, 1), 'wrong counters')
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import familysearch
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import urllib2
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from familysearch.cassette import Cassette, CassetteMiss, RecordingTransport, ReplayTransport
+from familysearch.retry import RetryPolicy
+from familysearch.transport import WSGITransport
+from common import *
+
+sample_person1 = load_sample('person1.json')
+
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.id = 'FAKE_PERSON_ID'
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.cassette')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, app, calls):
+        """Record the results of calling each (method, args, kwargs) of a FamilySearch object."""
+        recorder = RecordingTransport(self.path, WSGITransport(app))
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, transport=recorder)
+        results = [getattr(fs, method)(*args, **kwargs) for (method, args, kwargs) in calls]
+        recorder.close()
+        return results
+
+    def test_replays_recorded_responses(self):
+        paths = []
+        calls = [('person', (self.id,), {'names': 'all'}), ('person', (), {})]
+        recorded = self.record(make_app(sample_person1, paths=paths), calls)
+        self.assertEqual(len(paths), 2, 'requests not passed through while recording')
+        fs = familysearch.FamilySearch(self.agent, self.key, session='OTHER_SESSION_ID',
+                                       transport=ReplayTransport(self.path))
+        replayed = [getattr(fs, method)(*args, **kwargs) for (method, args, kwargs) in calls]
+        self.assertEqual(replayed, recorded, 'replayed results differ from recorded results')
+        self.assertEqual(len(paths), 2, 'requests passed through while replaying')
+
+    def test_does_not_record_session_id(self):
+        self.record(make_app(sample_person1), [('person', (self.id,), {'names': 'all'})])
+        f = gzip.open(self.path, 'rb')
+        contents = f.read()
+        f.close()
+        self.assertNotIn('sessionId', contents, 'session ID parameter recorded')
+        self.assertNotIn(self.session, contents, 'session ID recorded')
+        self.assertIn('names=all', json.loads(contents)['url'], 'query parameters not recorded')
+
+    def test_writes_gzipped_json_lines(self):
+        self.record(make_app(sample_person1), [('person', (self.id,), {})])
+        f = gzip.open(self.path, 'rb')
+        lines = f.readlines()
+        f.close()
+        self.assertEqual(len(lines), 1, 'wrong number of interactions recorded')
+        interaction = json.loads(lines[0])
+        self.assertEqual(interaction['method'], 'GET', 'wrong method recorded')
+        self.assertEqual(interaction['status'], 200, 'wrong status recorded')
+        self.assertEqual(json.loads(interaction['body']), json.loads(sample_person1), 'wrong body recorded')
+        self.assertNotIn(self.session, interaction['key'], 'session ID included in interaction key')
+
+    def test_appends_to_existing_cassette(self):
+        self.record(make_app(sample_person1), [('person', (self.id,), {})])
+        self.record(make_app(sample_person1), [('person', ('FAKE_PERSON_ID_2',), {})])
+        self.assertEqual(len(Cassette(self.path)), 2, 'interactions not appended to existing cassette')
+
+    def test_replays_responses_in_order(self):
+        recorder = RecordingTransport(self.path, WSGITransport(make_app(sample_person1, status='503 Service Unavailable')))
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, transport=recorder,
+                                       retry_policy=RetryPolicy(max_attempts=1))
+        self.assertRaises(urllib2.HTTPError, fs.person, self.id)
+        recorder.transport.app = make_app(sample_person1)
+        fs.person(self.id)
+        recorder.close()
+
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session,
+                                       transport=ReplayTransport(self.path),
+                                       retry_policy=RetryPolicy(max_attempts=1))
+        self.assertRaises(urllib2.HTTPError, fs.person, self.id)
+        person = fs.person(self.id)
+        self.assertEqual(person['id'], json.loads(sample_person1)['persons'][0]['id'], 'responses not replayed in order')
+        self.assertEqual(fs.person(self.id), person, 'last response not repeated')
+
+    def test_raises_on_unrecorded_request(self):
+        self.record(make_app(sample_person1), [('person', (self.id,), {})])
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session,
+                                       transport=ReplayTransport(self.path))
+        self.assertRaises(CassetteMiss, fs.person, 'FAKE_PERSON_ID_2')
+
+    def test_simulates_latency(self):
+        self.record(make_app(sample_person1), [('person', (self.id,), {})])
+        transport = ReplayTransport(self.path, latency=0.25)
+        sleeps = []
+        transport.sleep = sleeps.append
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, transport=transport)
+        fs.person(self.id)
+        self.assertEqual(sleeps, [0.25], 'latency not simulated')
+
+    def test_simulates_latency_function(self):
+        self.record(make_app(sample_person1), [('person', (self.id,), {})])
+        transport = ReplayTransport(self.path, latency=lambda interaction: len(interaction['url']))
+        sleeps = []
+        transport.sleep = sleeps.append
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, transport=transport)
+        fs.person(self.id)
+        self.assertEqual(len(sleeps), 1, 'latency function not called')
+        self.assertTrue(sleeps[0] > 0, 'latency function result not used')
+
+
+if __name__ == '__main__':
+    unittest.main()
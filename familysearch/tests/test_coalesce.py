@@ -0,0 +1,101 @@
+import familysearch
+import threading
+import time
+import unittest
+import urllib2
+import wsgi_intercept
+import wsgi_intercept.httplib_intercept
+from familysearch.coalesce import SingleFlight
+from common import *
+
+sample_person1 = load_sample('person1.json')
+
+
+class TestCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.id = 'FAKE_PERSON_ID'
+        self.id2 = 'FAKE_PERSON_ID_2'
+        wsgi_intercept.httplib_intercept.install()
+
+    def tearDown(self):
+        clear_request_intercpets()
+        wsgi_intercept.httplib_intercept.uninstall()
+
+    def add_slow_intercept(self, status='200 OK', response=sample_person1):
+        """Install an intercept that responds slowly, recording the paths requested."""
+        paths = []
+        def slow_app(environ, start_response):
+            paths.append(environ['PATH_INFO'])
+            time.sleep(0.2)
+            start_response(status, default_headers.items())
+            return [response]
+        wsgi_intercept.add_wsgi_intercept('www.dev.usys.org', 80, lambda: slow_app)
+        return paths
+
+    def run_concurrently(self, fn, args_list):
+        """Call fn concurrently once for each argument tuple, returning results (or errors)."""
+        results = [None] * len(args_list)
+        def run(i):
+            try:
+                results[i] = fn(*args_list[i])
+            except Exception, error:
+                results[i] = error
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(args_list))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalesces_identical_requests(self):
+        paths = self.add_slow_intercept()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session)
+        persons = self.run_concurrently(fs.person, [(self.id,)] * 5)
+        self.assertEqual(len(paths), 1, 'identical concurrent requests not coalesced')
+        for person in persons:
+            self.assertEqual(person, persons[0], 'coalesced requests returned different results')
+        self.assertEqual(fs.coalescer.shared, 4, 'shared results not counted')
+
+    def test_does_not_coalesce_different_requests(self):
+        paths = self.add_slow_intercept()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session)
+        self.run_concurrently(fs.person, [(self.id,), (self.id2,)])
+        self.assertEqual(len(paths), 2, 'different concurrent requests coalesced')
+
+    def test_does_not_share_cleaned_results(self):
+        self.add_slow_intercept()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session)
+        persons = self.run_concurrently(fs.person, [(self.id,)] * 2)
+        self.assertFalse(persons[0] is persons[1], 'coalesced callers share a mutable result')
+
+    def test_shares_errors(self):
+        self.add_slow_intercept('404 Not Found', '')
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session)
+        errors = self.run_concurrently(fs.person, [(self.id,)] * 3)
+        for error in errors:
+            self.assertTrue(isinstance(error, urllib2.HTTPError), 'error not raised for coalesced request')
+
+    def test_can_be_disabled(self):
+        paths = self.add_slow_intercept()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, coalesce_requests=False)
+        self.run_concurrently(fs.person, [(self.id,)] * 3)
+        self.assertEqual(len(paths), 3, 'requests coalesced despite coalesce_requests=False')
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_runs_sequential_calls(self):
+        flight = SingleFlight()
+        calls = []
+        flight.call('key', calls.append, 1)
+        flight.call('key', calls.append, 2)
+        self.assertEqual(calls, [1, 2], 'sequential calls with the same key not run')
+
+
+if __name__ == '__main__':
+    unittest.main()
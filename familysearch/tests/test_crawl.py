@@ -0,0 +1,212 @@
+import familysearch
+import threading
+import time
+import unittest
+from familysearch import model
+from familysearch.crawl import AncestorCrawler, DescendantCrawler, _person_id
+from familysearch.fakeserver import FakeServer
+from familysearch.transport import WSGITransport
+
+
+class TestAncestorCrawler(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.server = FakeServer(size=100000, founders=100, seed=3)
+        self.tree = self.server.tree
+        self.fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY',
+                                            transport=WSGITransport(self.server))
+        self.root = self.tree.size - 1
+
+    def assertValidPath(self, ancestor):
+        numbers = [self.tree.number(id) for id in ancestor.path]
+        self.assertEqual(len(numbers), ancestor.generation + 1, 'path length differs from generation')
+        self.assertEqual(ancestor.path[-1], ancestor.id, 'path does not end at ancestor')
+        for (child, parent) in zip(numbers, numbers[1:]):
+            self.assertTrue(parent in self.tree.parents(child), 'path does not follow parents')
+
+    def test_finds_all_ancestors(self):
+        for generations in [0, 1, 4, 7]:
+            crawler = AncestorCrawler(self.fs, generations)
+            ancestors = list(crawler.crawl(self.tree.id(self.root)))
+            expected = [self.tree.id(number) for number in self.tree.ancestors(self.root, generations)]
+            self.assertEqual(sorted([ancestor.id for ancestor in ancestors]), sorted(expected),
+                             'wrong ancestors found in %d generations' % generations)
+            for ancestor in ancestors:
+                self.assertValidPath(ancestor)
+                self.assertEqual(ancestor.person['id'], ancestor.id, 'wrong person returned')
+                self.assertEqual(ancestor.root, self.tree.id(self.root), 'wrong root')
+            self.assertEqual(crawler.truncated, 0, 'ancestors left out without max_frontier')
+
+    def test_batches_frontier(self):
+        crawler = AncestorCrawler(self.fs, 7, pedigree_generations=3, batch_size=4)
+        list(crawler.crawl(self.tree.id(self.root)))
+        # Generations 0-3 in one pedigree, 16 persons in generation 4 in batches of 4
+        self.assertEqual(crawler.requests, 5, 'frontier not requested in batches')
+
+    def test_deduplicates_shared_ancestors(self):
+        (father, mother) = self.tree.parents(self.root)
+        siblings = self.tree.children(father)
+        crawler = AncestorCrawler(self.fs, 5)
+        ancestors = list(crawler.crawl([self.tree.id(sibling) for sibling in siblings]))
+        ids = [ancestor.id for ancestor in ancestors]
+        self.assertEqual(len(ids), len(set(ids)), 'ancestor reported more than once')
+        expected = set(siblings + self.tree.ancestors(father, 4) + self.tree.ancestors(mother, 4))
+        self.assertEqual(len(ids), len(expected), 'wrong number of ancestors')
+
+    def test_depth_first_finds_same_ancestors(self):
+        root = self.tree.id(self.root)
+        breadth = list(AncestorCrawler(self.fs, 7, pedigree_generations=2).crawl(root))
+        depth = list(AncestorCrawler(self.fs, 7, pedigree_generations=2, depth_first=True).crawl(root))
+        self.assertEqual(sorted([ancestor.id for ancestor in depth]), sorted([ancestor.id for ancestor in breadth]),
+                         'depth-first crawl found different ancestors')
+
+    def test_bounds_frontier(self):
+        crawler = AncestorCrawler(self.fs, 9, pedigree_generations=2, batch_size=2, max_frontier=6)
+        sizes = []
+        schedule = crawler._schedule
+        def recording_schedule(node, generation):
+            schedule(node, generation)
+            sizes.append(len(crawler._frontier))
+        crawler._schedule = recording_schedule
+        ancestors = list(crawler.crawl(self.tree.id(self.root)))
+        self.assertTrue(sizes and max(sizes) <= 6, 'frontier grew beyond max_frontier')
+        self.assertTrue(crawler.truncated > 0, 'left out ancestors not counted')
+        self.assertTrue(len(ancestors) < len(self.tree.ancestors(self.root, 9)), 'no ancestors left out')
+        for ancestor in ancestors:
+            self.assertValidPath(ancestor)
+
+    def test_streams_ancestors(self):
+        crawler = AncestorCrawler(self.fs, 7, pedigree_generations=2, max_concurrency=1)
+        ancestors = crawler.crawl(self.tree.id(self.root))
+        self.assertEqual(ancestors.next().generation, 0, 'root not yielded first')
+        self.assertTrue(crawler.requests <= 2, 'ancestors not yielded before the crawl finished')
+
+    def test_bounds_concurrency(self):
+        lock = threading.Lock()
+        active = [0, 0]
+        pedigree = self.fs.pedigree
+        def slow_pedigree(*args, **kwargs):
+            lock.acquire()
+            active[0] += 1
+            active[1] = max(active)
+            lock.release()
+            time.sleep(0.01)
+            try:
+                return pedigree(*args, **kwargs)
+            finally:
+                lock.acquire()
+                active[0] -= 1
+                lock.release()
+        self.fs.pedigree = slow_pedigree
+        crawler = AncestorCrawler(self.fs, 7, pedigree_generations=2, batch_size=1, max_concurrency=3)
+        list(crawler.crawl(self.tree.id(self.root)))
+        self.assertEqual(active[1], 3, 'wrong number of concurrent requests')
+
+    def test_crawls_typed_results(self):
+        fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=WSGITransport(self.server),
+                                       typed=True)
+        ancestors = list(fs.iter_ancestors(self.tree.id(self.root), 5, pedigree_generations=2))
+        self.assertEqual(len(ancestors), len(self.tree.ancestors(self.root, 5)), 'wrong number of ancestors')
+        self.assertTrue(isinstance(ancestors[0].person, model.Person), 'persons not returned as models')
+
+
+class TestDescendantCrawler(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.server = FakeServer(size=100000, founders=100, seed=3)
+        self.tree = self.server.tree
+        self.fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY',
+                                            transport=WSGITransport(self.server))
+        self.root = self.tree.generation_start(7) + 3
+
+    def descendants(self, roots, generations=None):
+        """Return the generation of each descendant of roots, breadth first."""
+        found = dict([(root, 0) for root in roots])
+        current = list(roots)
+        generation = 0
+        while current and (generations is None or generation < generations):
+            generation += 1
+            children = []
+            for person in current:
+                for child in self.tree.children(person):
+                    if child not in found:
+                        found[child] = generation
+                        children.append(child)
+            current = children
+        return found
+
+    def test_finds_all_descendants(self):
+        crawler = DescendantCrawler(self.fs)
+        descendants = list(crawler.crawl(self.tree.id(self.root)))
+        expected = self.descendants([self.root])
+        self.assertEqual(sorted([self.tree.number(descendant.id) for descendant in descendants]),
+                         sorted(expected.keys()), 'wrong descendants found')
+        self.assertTrue(len(expected) > 20, 'too few descendants to test')
+        for descendant in descendants:
+            numbers = [self.tree.number(id) for id in descendant.path]
+            self.assertEqual(len(numbers), descendant.generation + 1, 'path length differs from generation')
+            for (parent, child) in zip(numbers, numbers[1:]):
+                self.assertTrue(child in self.tree.children(parent), 'path does not follow children')
+        self.assertTrue(crawler.requests <= len(expected) // 5, 'persons not requested in batches')
+
+    def test_limits_generations(self):
+        descendants = list(self.fs.iter_descendants(self.tree.id(self.root), 1))
+        self.assertEqual(len(descendants), 1 + len(self.tree.children(self.root)), 'wrong number of descendants')
+
+    def test_deduplicates_across_marriages(self):
+        spouse = self.tree.spouse(self.root)
+        crawler = DescendantCrawler(self.fs, 2)
+        descendants = list(crawler.crawl([self.tree.id(self.root), self.tree.id(spouse)]))
+        ids = [descendant.id for descendant in descendants]
+        self.assertEqual(len(ids), len(set(ids)), 'descendant reported more than once')
+        self.assertEqual(len(ids), len(self.descendants([self.root, spouse], 2)), 'wrong number of descendants')
+
+    def test_sends_options(self):
+        persons = []
+        person = self.fs.person
+        def recording_person(ids, options={}, **kw_options):
+            persons.append(options)
+            return person(ids, options, **kw_options)
+        self.fs.person = recording_person
+        list(DescendantCrawler(self.fs, 1, options={'names': 'all'}).crawl(self.tree.id(self.root)))
+        self.assertEqual(persons[0], {'names': 'all', 'children': 'all'}, 'wrong options sent')
+
+    def test_matches_persons_by_id(self):
+        children = self.tree.children(self.root)
+        missing = self.tree.id(children[0])
+        person = self.fs.person
+        def shuffled_person(ids, options={}, **kw_options):
+            persons = person([id for id in ids if id != missing], options, **kw_options)
+            if not isinstance(persons, list):
+                persons = [persons]
+            persons.reverse()
+            return persons
+        self.fs.person = shuffled_person
+        crawler = DescendantCrawler(self.fs, 1, batch_size=len(children) + 1)
+        descendants = list(crawler.crawl(self.tree.id(self.root)))
+        self.assertEqual(sorted([descendant.id for descendant in descendants]),
+                         sorted([self.tree.id(number) for number in [self.root] + children[1:]]),
+                         'wrong descendants found')
+        for descendant in descendants:
+            self.assertEqual(_person_id(descendant.person), descendant.id, 'descendant paired with wrong person')
+
+    def test_follows_merged_persons(self):
+        root = self.tree.id(self.root)
+        person = self.fs.person
+        def merged_person(ids, options={}, **kw_options):
+            persons = person(ids, options, **kw_options)
+            if ids == [root]:
+                persons = dict(persons)
+                persons['requestedId'] = root
+                persons['id'] = 'MERGED-1'
+            return persons
+        self.fs.person = merged_person
+        descendants = list(DescendantCrawler(self.fs, 1).crawl(root))
+        self.assertEqual(descendants[0].id, 'MERGED-1', 'merged person not followed')
+        self.assertEqual(len(descendants), 1 + len(self.tree.children(self.root)), 'children not followed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import familysearch
+import unittest
+import urllib2
+from familysearch.fakeserver import FakeServer, SyntheticTree
+from familysearch.retry import RetryPolicy
+from familysearch.transport import WSGITransport
+
+
+def full_name(person):
+    return person['assertions']['names'][0]['value']['forms'][0]['fullText']
+
+
+class TestSyntheticTree(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.tree = SyntheticTree(size=100000, founders=100, seed=1)
+
+    def test_maps_ids_to_numbers(self):
+        for number in [0, 1, 12345, 99999]:
+            self.assertEqual(self.tree.number(self.tree.id(number)), number, 'ID not mapped back to its number')
+        self.assertRaises(KeyError, self.tree.number, 'ABCD-123')
+
+    def test_is_consistent(self):
+        for number in range(0, 100000, 997):
+            spouse = self.tree.spouse(number)
+            if spouse is not None:
+                self.assertEqual(self.tree.spouse(spouse), number, 'spouses not married to each other')
+                self.assertNotEqual(self.tree.gender(spouse), self.tree.gender(number), 'spouses of the same gender')
+            parents = self.tree.parents(number)
+            if parents is not None:
+                self.assertEqual(self.tree.gender(parents[0]), 'Male', 'father not male')
+                self.assertTrue(number in self.tree.children(parents[0]), 'person not a child of their father')
+                self.assertTrue(number in self.tree.children(parents[1]), 'person not a child of their mother')
+                self.assertEqual(self.tree.surname(number), self.tree.surname(parents[0]), 'surname not inherited')
+            for child in self.tree.children(number):
+                self.assertTrue(number in self.tree.parents(child), 'child does not list person as a parent')
+
+    def test_is_deterministic(self):
+        other = SyntheticTree(size=100000, founders=100, seed=1)
+        for number in [0, 500, 50000]:
+            self.assertEqual(other.person(number), self.tree.person(number), 'same seed gave different persons')
+        different = SyntheticTree(size=100000, founders=100, seed=2)
+        self.assertNotEqual(different.id(500), self.tree.id(500), 'different seeds gave the same IDs')
+
+    def test_ancestors_form_full_pedigree(self):
+        generation = self.tree.locate(self.tree.size - 1)[0] - 1
+        me = self.tree.generation_start(generation)
+        self.assertEqual(len(self.tree.ancestors(me, 4)), 31, 'ancestors missing from pedigree')
+
+    def test_searches_by_name(self):
+        numbers = self.tree.search('John', 'Smith', limit=20)
+        self.assertTrue(numbers, 'no persons found')
+        for number in numbers:
+            person = self.tree.person(number)
+            self.assertEqual((person['given'], person['surname']), ('John', 'Smith'), 'wrong person found')
+
+    def test_touch_changes_version(self):
+        version = self.tree.version(10)
+        self.tree.touch(10)
+        self.assertNotEqual(self.tree.version(10), version, 'version not changed')
+
+
+class TestFakeServer(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.server = FakeServer(size=100000, founders=100, seed=1)
+        self.fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY',
+                                            transport=WSGITransport(self.server))
+
+    def test_logs_in(self):
+        self.fs.login('FAKE_USERNAME', 'FAKE_PASSWORD')
+        self.assertTrue(self.fs.logged_in, 'not logged in')
+        self.assertTrue(self.fs.session_id, 'no session ID returned')
+
+    def test_oauth_login(self):
+        self.fs.request_token()
+        self.fs.authorize()
+        self.fs.access_token('FAKE_VERIFIER')
+        self.assertTrue(self.fs.logged_in, 'not logged in')
+
+    def test_reads_persons(self):
+        tree = self.server.tree
+        me = self.fs.person('me', parents='summary', families='summary')
+        self.assertEqual(me['id'], tree.id(self.server.me), 'wrong person returned for current user')
+        father = tree.id(tree.parents(self.server.me)[0])
+        self.assertEqual(me['parents'][0]['parent'][0]['id'], father, 'wrong parents returned')
+        self.assertEqual(len(me['families'][0]['child']), 4, 'wrong children returned')
+        ids = [tree.id(number) for number in range(20, 35)]
+        persons = self.fs.person(ids)
+        self.assertEqual([person['id'] for person in persons], ids, 'wrong persons returned')
+        self.assertEqual(full_name(persons[0]), '%s %s' % (tree.person(20)['given'], tree.surname(20)),
+                         'wrong name returned')
+
+    def test_reads_versions_and_personas(self):
+        tree = self.server.tree
+        id = tree.id(1234)
+        self.assertEqual(self.fs.version(id)['version'], tree.version(1234), 'wrong version returned')
+        self.assertEqual(self.fs.persona(id)['id'], id, 'wrong persona returned')
+
+    def test_reads_pedigree(self):
+        pedigree = self.fs.pedigree(ancestors=3)
+        persons = dict([(person['id'], person) for person in pedigree['persons']])
+        self.assertEqual(len(persons), 15, 'wrong number of persons in pedigree')
+        me = persons[pedigree['id']]
+        for parent in me['parents'][0]['parent']:
+            self.assertTrue(parent['id'] in persons, 'parent missing from pedigree')
+
+    def test_searches(self):
+        results = self.fs.search(givenName='John', familyName='Smith', maxResults=5)
+        self.assertEqual(len(results['search']), 5, 'wrong number of results')
+        for result in results['search']:
+            self.assertEqual(full_name(result['person']), 'John Smith', 'wrong result')
+        more = self.fs.search(contextId=results['contextId'], startIndex=5, maxResults=5)
+        first_ids = set([result['id'] for result in results['search']])
+        for result in more['search']:
+            self.assertFalse(result['id'] in first_ids, 'next page repeats results')
+
+    def test_matches(self):
+        tree = self.server.tree
+        match = self.fs.match(tree.id(self.server.me))
+        person = tree.person(self.server.me)
+        for result in match['match']:
+            self.assertEqual(full_name(result['person']), '%s %s' % (person['given'], person['surname']),
+                             'match has a different name')
+            self.assertNotEqual(result['id'], person['id'], 'person matched with themselves')
+
+    def test_standardizes(self):
+        self.assertEqual(self.fs.place(5061446)['official'], 'London', 'wrong place returned')
+        self.assertEqual(self.fs.place(place='paris')['id'], '5061509', 'wrong place found')
+        self.assertEqual(self.fs.name('John Smith')['fields'][1]['text'], 'Smith', 'wrong name returned')
+        self.assertEqual(self.fs.date('1 Jan 2000')['normalized'], '1 January 2000', 'wrong date returned')
+        self.assertEqual(self.fs.culture(1)['value'], 'North America', 'wrong culture returned')
+
+    def test_returns_404_for_unknown_person(self):
+        self.assertRaises(urllib2.HTTPError, self.fs.person, 'ABCD-123')
+
+    def test_simulates_latency(self):
+        sleeps = []
+        self.server.sleep = sleeps.append
+        self.server.latency = 0.25
+        self.fs.person()
+        self.assertEqual(sleeps, [0.25], 'latency not simulated')
+
+    def test_simulates_errors(self):
+        server = FakeServer(size=1000, founders=100, error_rate=1)
+        fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=WSGITransport(server),
+                                       retry_policy=RetryPolicy(max_attempts=1))
+        try:
+            fs.person()
+        except urllib2.HTTPError, error:
+            self.assertEqual(error.code, 503, 'wrong error status')
+        else:
+            self.fail('error not simulated')
+
+    def test_throttles(self):
+        server = FakeServer(size=1000, founders=100, rate=0.5, burst=2)
+        fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=WSGITransport(server),
+                                       retry_policy=RetryPolicy(max_attempts=1))
+        fs.person()
+        fs.version(server.tree.id(1))
+        try:
+            fs.person()
+        except urllib2.HTTPError, error:
+            self.assertEqual(error.code, 429, 'wrong error status')
+            self.assertEqual(error.info().get('Retry-After'), '2', 'wrong Retry-After header')
+        else:
+            self.fail('requests not throttled')
+
+
+if __name__ == '__main__':
+    unittest.main()
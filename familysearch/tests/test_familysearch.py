@@ -1,4 +1,5 @@
 import familysearch
+import httplib
 import pickle
 import unittest
 import urllib2
@@ -102,6 +103,47 @@ class TestFamilySearch(unittest.TestCase):
         self.assertIn('HTTP_COOKIE', request_environ, 'cookie header not included in request')
         self.assertIn(self.cookie, request_environ['HTTP_COOKIE'], 'previously-set cookie not included in cookie header')
 
+    def test_keeps_connection_alive(self):
+        headers = default_headers.copy()
+        headers['Connection'] = 'keep-alive'
+        headers['Content-Length'] = str(len(sample_person1))
+        add_request_intercept(sample_person1, headers=headers)
+        fs = familysearch.FamilySearch(self.agent, self.key)
+        fs.person()
+        self.assertEqual(fs.connection_pool.idle('http', 'www.dev.usys.org'), 1, 'keep-alive connection not returned to pool')
+
+    def test_closes_connection_not_kept_alive(self):
+        add_request_intercept(sample_person1)
+        fs = familysearch.FamilySearch(self.agent, self.key)
+        fs.person()
+        self.assertEqual(fs.connection_pool.idle('http', 'www.dev.usys.org'), 0, 'closed connection returned to pool')
+
+    def test_pool_size_zero_disables_keep_alive(self):
+        headers = default_headers.copy()
+        headers['Connection'] = 'keep-alive'
+        headers['Content-Length'] = str(len(sample_person1))
+        add_request_intercept(sample_person1, headers=headers)
+        fs = familysearch.FamilySearch(self.agent, self.key, pool_size=0)
+        fs.person()
+        self.assertEqual(fs.connection_pool.idle('http', 'www.dev.usys.org'), 0, 'connection kept despite pool_size=0')
+
+    def test_retries_stale_connection_only_for_get(self):
+        from familysearch.keepalive import KeepAliveHTTPHandler
+        class StaleConnection(object):
+            def request(self, *args):
+                raise httplib.BadStatusLine('')
+            def close(self):
+                pass
+        add_request_intercept(sample_person1)
+        for (data, retried) in [(None, True), ('username=FAKE_USERNAME', False)]:
+            handler = KeepAliveHTTPHandler()
+            handler.pool.put('http', 'www.dev.usys.org', StaleConnection())
+            request = urllib2.Request('http://www.dev.usys.org/familytree/v2/person', data)
+            if retried:
+                self.assertEqual(handler.http_open(request).read(), sample_person1, 'GET not retried')
+            else:
+                self.assertRaises(httplib.BadStatusLine, handler.http_open, request)
+
     def test_pickle_restores_logged_out_session(self):
         fs_logged_out = familysearch.FamilySearch(self.agent, self.key, base='https://api.familysearch.org')
         fs_logged_out_restored = pickle.loads(pickle.dumps(fs_logged_out))
@@ -1,5 +1,8 @@
 import familysearch
+import random
+import time
 import unittest
+import wsgi_intercept
 import wsgi_intercept.httplib_intercept
 try:
     import json
@@ -287,6 +290,115 @@ class TestFamilyTreePedigree(TestFamilyTree):
         self.assertIn('properties=all', request_environ['QUERY_STRING'], 'one of multiple query parameters not included')
 
 
+class TestFamilyTreeChunking(TestFamilyTree):
+
+    def add_echo_intercept(self, key):
+        """Install an intercept echoing each requested ID, recording the paths requested."""
+        paths = []
+        def echo_app(environ, start_response):
+            paths.append(environ['PATH_INFO'])
+            ids = environ['PATH_INFO'].split('/')[-1].split(',')
+            time.sleep(random.random() * 0.01)
+            start_response('200 OK', default_headers.items())
+            return [json.dumps({key: [{'id': id, 'version': '1'} for id in ids]})]
+        wsgi_intercept.add_wsgi_intercept('www.dev.usys.org', 80, lambda: echo_app)
+        return paths
+
+    def test_splits_long_list_of_persons(self):
+        paths = self.add_echo_intercept('persons')
+        ids = ['ID-%d' % i for i in range(25)]
+        self.fs.person(ids)
+        self.assertEqual(len(paths), 3, 'long list of person IDs not split into chunks')
+        requested = sorted([path.split('/')[-1] for path in paths])
+        self.assertEqual(requested, sorted([','.join(ids[0:10]), ','.join(ids[10:20]), ','.join(ids[20:25])]), 'wrong chunks requested')
+
+    def test_merges_chunks_in_input_order(self):
+        self.add_echo_intercept('persons')
+        ids = ['ID-%d' % i for i in range(45)]
+        persons = self.fs.person(ids)
+        self.assertEqual([person['id'] for person in persons], ids, 'chunked results not returned in input order')
+
+    def test_does_not_split_short_list(self):
+        paths = self.add_echo_intercept('pedigrees')
+        self.fs.pedigree(['ID-%d' % i for i in range(10)])
+        self.assertEqual(len(paths), 1, 'short list of person IDs split into chunks')
+
+    def test_version_allows_more_ids(self):
+        paths = self.add_echo_intercept('versions')
+        self.fs.version(['ID-%d' % i for i in range(100)])
+        self.assertEqual(len(paths), 1, 'version request split below its higher limit')
+
+    def test_changes_id_limit(self):
+        paths = self.add_echo_intercept('personas')
+        self.fs.id_limits['persona'] = 2
+        personas = self.fs.persona([self.id, self.id2, self.id])
+        self.assertEqual(len(paths), 2, 'changed ID limit not used')
+        self.assertEqual(len(personas), 3, 'chunked persona response has wrong length')
+
+
+class TestFamilyTreeIter(TestFamilyTree):
+
+    add_echo_intercept = TestFamilyTreeChunking.add_echo_intercept.im_func
+
+    def test_iter_persons_matches_person(self):
+        add_request_intercept(sample_person_list)
+        persons = self.fs.person([self.id, self.id2])
+        add_request_intercept(sample_person_list)
+        self.assertEqual(list(self.fs.iter_persons([self.id, self.id2])), persons,
+                         'iterated persons differ from person')
+
+    def test_iter_persons_accepts_me(self):
+        request_environ = add_request_intercept(sample_person1)
+        persons = list(self.fs.iter_persons('me'))
+        self.assertTrue(request_environ['PATH_INFO'].endswith('person'), 'person request failed with "me"')
+        self.assertEqual(len(persons), 1, 'single person not yielded')
+
+    def test_iter_personas_and_versions(self):
+        add_request_intercept(sample_persona_list)
+        self.assertEqual(list(self.fs.iter_personas([self.id, self.id2])), self.fs.persona([self.id, self.id2]),
+                         'iterated personas differ from persona')
+        add_request_intercept(sample_version_list)
+        self.assertEqual(list(self.fs.iter_versions([self.id, self.id2])), self.fs.version([self.id, self.id2]),
+                         'iterated versions differ from version')
+
+    def test_iter_requests_chunks_in_order(self):
+        paths = self.add_echo_intercept('persons')
+        ids = ['ID-%d' % i for i in range(25)]
+        persons = self.fs.iter_persons(ids)
+        self.assertEqual(persons.next()['id'], ids[0], 'wrong first person')
+        self.assertEqual(len(paths), 1, 'later chunks requested before they were needed')
+        self.assertEqual([person['id'] for person in persons], ids[1:], 'persons not yielded in input order')
+        self.assertEqual([path.split('/')[-1] for path in paths],
+                         [','.join(ids[0:10]), ','.join(ids[10:20]), ','.join(ids[20:25])], 'wrong chunks requested')
+
+    def test_iter_closes_abandoned_response(self):
+        closed = []
+        open_url = self.fs._open_url
+        def recording_open_url(*args):
+            response = open_url(*args)
+            close = response.close
+            def recording_close():
+                closed.append(True)
+                close()
+            response.close = recording_close
+            return response
+        self.fs._open_url = recording_open_url
+        add_request_intercept(sample_person_list)
+        persons = self.fs.iter_persons([self.id, self.id2])
+        persons.next()
+        self.assertEqual(closed, [], 'response closed before it was read')
+        persons.close()
+        self.assertEqual(closed, [True], 'abandoned response not closed')
+
+    def test_iter_runs_hooks(self):
+        events = []
+        for event in ['after_body', 'after_decode', 'after_clean']:
+            self.fs.add_hook(event, lambda event, info: events.append(event))
+        add_request_intercept(sample_person_list)
+        list(self.fs.iter_persons([self.id, self.id2]))
+        self.assertEqual(events, ['after_body', 'after_decode', 'after_clean'], 'hooks not run in order')
+
+
 class TestFamilyTreeSearch(TestFamilyTree):
 
     def test_adds_one_query_param_from_kwargs(self):
@@ -320,6 +432,72 @@ class TestFamilyTreeSearch(TestFamilyTree):
         self.assertIn('mother.birthPlace=Paris', request_environ['QUERY_STRING'], 'one of multiple query parameters not included')
 
 
+class TestFamilyTreeIterSearch(TestFamilyTree):
+
+    def add_pages_intercept(self, pages, count):
+        """Install an intercept returning each page of result IDs in turn, recording the query strings."""
+        queries = []
+        def pages_app(environ, start_response):
+            queries.append(environ['QUERY_STRING'])
+            ids = pages[len(queries) - 1]
+            search = {'contextId': 'FAKE_CONTEXT_ID', 'count': count,
+                      'search': [{'id': id, 'score': 1.0} for id in ids]}
+            start_response('200 OK', default_headers.items())
+            return [json.dumps({'searches': [search]})]
+        wsgi_intercept.add_wsgi_intercept('www.dev.usys.org', 80, lambda: pages_app)
+        return queries
+
+    def test_yields_all_pages(self):
+        queries = self.add_pages_intercept([['A', 'B'], ['C', 'D'], ['E']], 5)
+        results = list(self.fs.iter_search(givenName='John', page_size=2))
+        self.assertEqual([result['id'] for result in results], ['A', 'B', 'C', 'D', 'E'], 'wrong results')
+        self.assertEqual(len(queries), 3, 'wrong number of pages requested')
+        self.assertIn('givenName=John', queries[0], 'search parameters not sent')
+        for (query, start) in zip(queries[1:], ['2', '4']):
+            self.assertIn('contextId=FAKE_CONTEXT_ID', query, 'contextId not sent for later page')
+            self.assertIn('startIndex=' + start, query, 'wrong startIndex sent')
+            self.assertNotIn('givenName', query, 'search parameters sent for later page')
+
+    def test_prefetches_next_page(self):
+        queries = self.add_pages_intercept([['A', 'B'], ['C', 'D'], ['E']], 5)
+        results = self.fs.iter_search(givenName='John', page_size=2)
+        results.next()
+        for i in range(100):
+            if len(queries) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(queries), 2, 'next page not requested while the first was consumed')
+
+    def test_stops_at_limit(self):
+        queries = self.add_pages_intercept([['A', 'B', 'C'], ['D', 'E', 'F']], 100)
+        results = list(self.fs.iter_search(givenName='John', page_size=3, limit=3))
+        self.assertEqual(len(results), 3, 'limit not applied')
+        self.assertEqual(len(queries), 1, 'page beyond the limit requested')
+
+    def test_zero_limit_sends_no_request(self):
+        queries = self.add_pages_intercept([['A', 'B']], 2)
+        self.assertEqual(list(self.fs.iter_search(givenName='John', limit=0)), [], 'results returned')
+        self.assertEqual(queries, [], 'search requested')
+
+    def test_starts_from_start_index(self):
+        queries = self.add_pages_intercept([['K', 'L'], ['M', 'N'], ['O']], 15)
+        results = list(self.fs.iter_search({'startIndex': 10}, givenName='John', page_size=2))
+        self.assertEqual([result['id'] for result in results], ['K', 'L', 'M', 'N', 'O'], 'wrong results')
+        self.assertIn('startIndex=10', queries[0], 'startIndex not sent for first page')
+        for (query, start) in zip(queries[1:], ['12', '14']):
+            self.assertIn('startIndex=' + start, query, 'wrong startIndex sent')
+
+    def test_skips_duplicate_persons(self):
+        self.add_pages_intercept([['A', 'B'], ['B', 'C'], ['A', 'D']], 6)
+        results = list(self.fs.iter_search(givenName='John', page_size=2, limit=4))
+        self.assertEqual([result['id'] for result in results], ['A', 'B', 'C', 'D'], 'duplicates not skipped')
+
+    def test_stops_at_empty_page(self):
+        queries = self.add_pages_intercept([['A', 'B'], []], 10)
+        self.assertEqual(len(list(self.fs.iter_search(givenName='John', page_size=2))), 2, 'wrong results')
+        self.assertEqual(len(queries), 2, 'pages requested after an empty page')
+
+
 class TestFamilyTreeMatch(TestFamilyTree):
 
     def test_accepts_single_match(self):
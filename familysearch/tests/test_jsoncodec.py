@@ -0,0 +1,186 @@
+import os
+import unittest
+from StringIO import StringIO
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from familysearch import jsoncodec
+from common import *
+
+
+def remove_nones(value):
+    """Remove all None values from a decoded document, after decoding it (the reference behaviour)."""
+    if isinstance(value, dict):
+        return dict([(k, remove_nones(v)) for (k, v) in value.iteritems() if v is not None])
+    elif isinstance(value, list):
+        return [remove_nones(i) for i in value if i is not None]
+    else:
+        return value
+
+
+class TestLoadsClean(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.backends = [jsoncodec.make_backend(name) for name in jsoncodec.available()]
+
+    def test_matches_remove_nones(self):
+        for filename in ['person_list.json', 'pedigree.json', 'search.json', 'place_list.json',
+                         'date_list.json', 'culture_list.json']:
+            data = load_sample(filename)
+            expected = remove_nones(json.loads(data))
+            for backend in self.backends:
+                self.assertEqual(backend.loads_clean(data), expected,
+                                 'nulls not removed from %s like remove_nones with %s' % (filename, backend.name))
+
+    def test_removes_nested_nulls(self):
+        data = '{"a": [1, null, [null, {"b": null, "c": 2}]], "d": null, "e": {"f": null}}'
+        for backend in self.backends:
+            self.assertEqual(backend.loads_clean(data), {'a': [1, [{'c': 2}]], 'e': {}},
+                             'nested nulls not removed with %s' % backend.name)
+
+    def test_removes_nulls_from_top_level_list(self):
+        for backend in self.backends:
+            self.assertEqual(backend.loads_clean('[null, {"a": null}]'), [{}],
+                             'nulls not removed from list with %s' % backend.name)
+
+    def test_object_hook_removes_nulls(self):
+        data = '{"a": [1, null], "b": null, "c": {"d": null, "e": 3}}'
+        self.assertEqual(json.loads(data, object_hook=jsoncodec._remove_nones_object),
+                         {'a': [1], 'c': {'e': 3}}, 'object_hook fallback did not remove nulls')
+
+    def test_loads_keeps_nulls(self):
+        for backend in self.backends:
+            self.assertEqual(backend.loads('{"a": null, "b": [null]}'), {'a': None, 'b': [None]},
+                             'nulls removed with %s' % backend.name)
+
+    def test_returns_same_types(self):
+        def types(value):
+            if isinstance(value, dict):
+                return dict([(types(key), types(item)) for (key, item) in value.items()])
+            if isinstance(value, list):
+                return [types(item) for item in value]
+            return (value, type(value))
+        for filename in ['person_list.json', 'search.json', 'place_list.json']:
+            data = load_sample(filename)
+            expected = types(json.loads(data))
+            for backend in self.backends:
+                self.assertEqual(types(backend.loads(data)), expected,
+                                 'types of %s differ with %s' % (filename, backend.name))
+        for backend in self.backends:
+            self.assertEqual(types(backend.loads_clean('{"a": "x", "b": [null, "y"]}')),
+                             {(u'a', unicode): (u'x', unicode), (u'b', unicode): [(u'y', unicode)]},
+                             'strings not decoded to unicode with %s' % backend.name)
+            self.assertEqual(types(backend.raw_decode_clean('["x"]', 0)[0]), [(u'x', unicode)],
+                             'incremental decoding returned str with %s' % backend.name)
+
+
+class TestBackendSelection(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.original = jsoncodec.backend
+        self.environ = os.environ.get('FAMILYSEARCH_JSON')
+
+    def tearDown(self):
+        jsoncodec.backend = self.original
+        if self.environ is None:
+            os.environ.pop('FAMILYSEARCH_JSON', None)
+        else:
+            os.environ['FAMILYSEARCH_JSON'] = self.environ
+
+    def test_uses_fastest_available(self):
+        os.environ.pop('FAMILYSEARCH_JSON', None)
+        self.assertEqual(jsoncodec.use().name, jsoncodec.available()[0], 'fastest library not used')
+        self.assertTrue('json' in jsoncodec.available() or 'simplejson' in jsoncodec.available(),
+                        'standard library not available')
+
+    def test_forced_by_name(self):
+        for name in jsoncodec.available():
+            jsoncodec.use(name)
+            self.assertEqual(jsoncodec.backend.name, name, 'library not used')
+            self.assertEqual(jsoncodec.loads_clean('{"a": null, "b": 1}'), {'b': 1},
+                             'nulls not removed with %s' % name)
+
+    def test_forced_by_environment(self):
+        name = jsoncodec.available()[-1]
+        os.environ['FAMILYSEARCH_JSON'] = name
+        self.assertEqual(jsoncodec.use().name, name, 'library named by environment not used')
+
+    def test_rejects_unsupported_library(self):
+        self.assertRaises(ValueError, jsoncodec.use, 'pickle')
+
+    def test_fails_for_missing_library(self):
+        missing = [name for (name, backend_class) in jsoncodec.BACKENDS if name not in jsoncodec.available()]
+        for name in missing:
+            self.assertRaises(ImportError, jsoncodec.use, name)
+        self.assertEqual(jsoncodec.backend, self.original, 'backend changed by failed switch')
+
+    def test_round_trips(self):
+        obj = {'persons': [{'id': 'KW3B-NNM', 'names': [u'J\xf6rg'], 'living': False, 'version': 3}]}
+        self.assertEqual(jsoncodec.loads(jsoncodec.dumps(obj)), obj, 'not decoded to the encoded object')
+
+
+class RecordingFile(StringIO):
+
+    def __init__(self, data):
+        StringIO.__init__(self, data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return StringIO.read(self, size)
+
+
+class TestIterItems(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.original = jsoncodec.backend
+
+    def tearDown(self):
+        jsoncodec.backend = self.original
+
+    def test_matches_loads_clean(self):
+        for (filename, key) in [('person_list.json', 'persons'), ('persona_list.json', 'personas'),
+                                ('version_list.json', 'versions'), ('pedigree.json', 'pedigrees')]:
+            data = load_sample(filename)
+            expected = jsoncodec.loads_clean(data)[key]
+            for name in jsoncodec.available():
+                jsoncodec.use(name)
+                for chunk_size in [1, 7, 100, 65536]:
+                    self.assertEqual(list(jsoncodec.iter_items(StringIO(data), key, chunk_size)), expected,
+                                     'items of %s differ with %s and %d-byte chunks' % (filename, name, chunk_size))
+
+    def test_yields_items_before_end_of_document(self):
+        data = '{"persons": [%s]}' % ','.join(['{"id": "P%d", "notes": null}' % i for i in range(1000)])
+        fp = RecordingFile(data)
+        items = jsoncodec.iter_items(fp, 'persons', 100)
+        self.assertEqual(items.next(), {'id': 'P0'}, 'wrong first item')
+        self.assertTrue(fp.reads < 3, 'whole document read before first item')
+        self.assertEqual(len(list(items)), 999, 'wrong number of items')
+        self.assertEqual(fp.read(), '', 'document not read to the end')
+
+    def test_skips_other_members(self):
+        data = ' { "version" : 12345 , "other": [{"persons": [1]}], "persons" : [ {"a": 1} , {"b": [null]} ] , "n": null } '
+        self.assertEqual(list(jsoncodec.iter_items(StringIO(data), 'persons', 3)), [{'a': 1}, {'b': []}],
+                         'wrong items yielded')
+
+    def test_yields_nothing_without_array(self):
+        for data in ['{}', '{"persons": []}', '{"persons": null}', '{"other": [1, 2]}']:
+            self.assertEqual(list(jsoncodec.iter_items(StringIO(data), 'persons')), [],
+                             'items yielded from %s' % data)
+
+    def test_decodes_numbers_split_between_chunks(self):
+        data = '{"persons": [12345, 678]}'
+        self.assertEqual(list(jsoncodec.iter_items(StringIO(data), 'persons', 2)), [12345, 678],
+                         'number split between chunks not decoded')
+
+    def test_rejects_invalid_documents(self):
+        for data in ['', '[1, 2]', '{"persons": [{"a": 1}', '{"persons": [{"a": 1} {"b": 2}]}']:
+            self.assertRaises(ValueError, list, jsoncodec.iter_items(StringIO(data), 'persons', 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import familysearch
+import threading
+import time
+import unittest
+import urllib2
+from familysearch import jsoncodec, model
+from familysearch.fakeserver import FakeServer
+from familysearch.matching import DedupPipeline, MatchResult, blocking_keys, match_pairs, normalize_name, pair_key
+from familysearch.transport import WSGITransport
+from common import *
+
+
+class TestMatchPairs(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.server = FakeServer(size=10000, founders=100, seed=3)
+        self.tree = self.server.tree
+        self.fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY',
+                                            transport=WSGITransport(self.server))
+        self.ids = [self.tree.id(number) for number in range(5000, 5010)]
+
+    def test_scores_each_pair(self):
+        pairs = [(self.ids[0], other) for other in self.ids[1:]]
+        results = list(self.fs.iter_matches(pairs))
+        self.assertEqual(sorted([(result.person_id, result.candidate_id) for result in results]), sorted(pairs),
+                         'wrong pairs scored')
+        for result in results:
+            expected = self.fs.match(result.person_id, id=result.candidate_id)['match'][0]
+            self.assertEqual(result.match, expected, 'wrong match returned')
+            self.assertEqual((result.score, result.confidence), (expected['score'], expected['confidence']),
+                             'wrong score')
+            self.assertEqual(result.error, None, 'error reported')
+
+    def test_skips_repeated_and_reversed_pairs(self):
+        requests = []
+        match = self.fs.match
+        def recording_match(person_id, options={}, **kw_options):
+            requests.append(pair_key(person_id, kw_options['id']))
+            return match(person_id, options, **kw_options)
+        self.fs.match = recording_match
+        (a, b, c) = self.ids[:3]
+        results = list(match_pairs(self.fs, [(a, b), (b, a), (a, b), (a, a), (b, c), (c, b), (a, c)]))
+        self.assertEqual(sorted(requests), sorted([pair_key(a, b), pair_key(b, c), pair_key(a, c)]),
+                         'repeated pairs requested')
+        self.assertEqual(len(results), 3, 'wrong number of results')
+
+    def test_scores_duplicates_above_strangers(self):
+        number = 5000
+        person = self.tree.person(number)
+        candidates = self.tree.search(person['given'], person['surname'], person['gender'])
+        duplicate = [candidate for candidate in candidates if candidate != number][0]
+        stranger = [other for other in range(6000, 7000) if other not in candidates][0]
+        results = dict([(result.candidate_id, result) for result in
+                        self.fs.iter_matches([(self.tree.id(number), self.tree.id(duplicate)),
+                                              (self.tree.id(number), self.tree.id(stranger))])])
+        self.assertTrue(results[self.tree.id(duplicate)].score > results[self.tree.id(stranger)].score,
+                        'stranger scored above duplicate')
+        self.assertEqual(results[self.tree.id(stranger)].confidence, 'Low', 'wrong confidence for stranger')
+
+    def test_reports_errors_without_stopping(self):
+        pairs = [(self.ids[0], other) for other in self.ids[1:4]] + [('MISSING-1', self.ids[0])]
+        results = dict([((result.person_id, result.candidate_id), result) for result in self.fs.iter_matches(pairs)])
+        failed = results.pop(('MISSING-1', self.ids[0]))
+        self.assertTrue(isinstance(failed.error, urllib2.HTTPError), 'error not reported')
+        self.assertEqual(failed.score, None, 'score reported for failed request')
+        self.assertEqual(len([result for result in results.values() if result.score is not None]), 3,
+                         'other pairs not scored')
+
+    def test_only_returns_candidate_entry(self):
+        (a, b, c) = self.ids[:3]
+        match = self.fs.match
+        def other_match(person_id, options={}, **kw_options):
+            result = match(person_id, options, **kw_options)
+            if kw_options['id'] == b:
+                result['match'][0] = dict(result['match'][0], id=c)
+            elif kw_options['id'] == c:
+                result['match'][0] = dict(result['match'][0], id='MERGED-1', requestedId=c)
+            return result
+        self.fs.match = other_match
+        results = dict([(result.candidate_id, result) for result in self.fs.iter_matches([(a, b), (a, c)])])
+        self.assertEqual(results[b].match, None, 'entry for another person returned')
+        self.assertEqual(results[b].score, None, 'score of another person returned')
+        self.assertEqual(results[c].match['id'], 'MERGED-1', 'entry for merged candidate not returned')
+
+    def test_consumes_pairs_lazily(self):
+        consumed = [0]
+        def pairs():
+            for other in self.ids[1:]:
+                consumed[0] += 1
+                yield (self.ids[0], other)
+        results = self.fs.iter_matches(pairs(), max_concurrency=2)
+        self.assertTrue(isinstance(results.next(), MatchResult), 'wrong result type')
+        self.assertTrue(consumed[0] <= 3, 'pairs consumed before they were needed')
+
+    def test_bounds_concurrency(self):
+        lock = threading.Lock()
+        active = [0, 0]
+        match = self.fs.match
+        def slow_match(*args, **kwargs):
+            lock.acquire()
+            active[0] += 1
+            active[1] = max(active)
+            lock.release()
+            time.sleep(0.01)
+            try:
+                return match(*args, **kwargs)
+            finally:
+                lock.acquire()
+                active[0] -= 1
+                lock.release()
+        self.fs.match = slow_match
+        list(self.fs.iter_matches([(self.ids[0], other) for other in self.ids[1:]], max_concurrency=3))
+        self.assertEqual(active[1], 3, 'wrong number of concurrent requests')
+
+
+class TestDedupPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.server = FakeServer(size=10000, founders=100, seed=3)
+        self.tree = self.server.tree
+        self.fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY',
+                                            transport=WSGITransport(self.server))
+        person = self.tree.person(5000)
+        self.namesakes = self.tree.search(person['given'], person['surname'], person['gender'])
+        self.others = [number for number in range(6000, 6010) if number not in self.namesakes]
+        self.requests = []
+        match = self.fs.match
+        def recording_match(person_id, options={}, **kw_options):
+            self.requests.append(pair_key(person_id, kw_options['id']))
+            return match(person_id, options, **kw_options)
+        self.fs.match = recording_match
+
+    def persons(self, numbers):
+        return self.fs.person([self.tree.id(number) for number in numbers])
+
+    def test_normalizes_names(self):
+        self.assertEqual(normalize_name(u'Jos\xe9 Mar\xeda  GARC\xcdA'), u'jose garcia', 'name not normalized')
+        self.assertEqual(normalize_name('John Smith'), u'john smith', 'byte string not normalized')
+        self.assertEqual(normalize_name(' , '), None, 'key made without words')
+
+    def test_blocking_keys(self):
+        person = jsoncodec.loads_clean(load_sample('person1.json'))['persons'][0]
+        self.assertEqual(blocking_keys(person), [(u'john smith', 195, '5061446')], 'wrong keys')
+        self.assertEqual(blocking_keys(model.Person.from_json(person)), blocking_keys(person),
+                         'model keys differ from dict keys')
+        self.assertEqual(blocking_keys(person, bucket_years=50, use_place=False), [(u'john smith', 39, None)],
+                         'wrong keys without place')
+        self.assertEqual(blocking_keys({'id': 'ABCD-123'}), [], 'keys made without a name')
+
+    def test_scores_only_pairs_in_same_block(self):
+        pipeline = DedupPipeline(self.fs, bucket_years=1000, use_place=False)
+        pipeline.add(self.persons(self.namesakes + self.others))
+        results = pipeline.run()
+        names = {}
+        for number in self.namesakes + self.others:
+            person = self.tree.person(number)
+            names.setdefault((person['given'], person['surname']), []).append(person['id'])
+        expected = []
+        for ids in names.values():
+            ids.sort()
+            expected.extend([(ids[i], other) for i in range(len(ids)) for other in ids[i + 1:]])
+        expected.sort()
+        self.assertTrue(len(expected) < len(self.namesakes + self.others) ** 2 // 4, 'too few pairs skipped')
+        self.assertEqual(sorted(self.requests), expected, 'wrong pairs scored')
+        self.assertEqual(pipeline.requests, len(expected), 'wrong number of requests counted')
+        self.assertEqual(len(results), len(expected), 'wrong number of results')
+        scores = [result.score for result in results]
+        self.assertEqual(scores, sorted(scores, reverse=True), 'results not ranked by score')
+
+    def test_blocks_by_birth_year_and_place(self):
+        pipeline = DedupPipeline(self.fs)
+        pipeline.add(self.persons(self.namesakes))
+        for (key, ids) in pipeline.blocks.items():
+            numbers = [self.tree.number(id) for id in ids]
+            self.assertEqual(len(set([self.tree.person(number)['birth'].year // 10 for number in numbers])), 1,
+                             'block spans several decades')
+            self.assertEqual(len(set([self.tree.person(number)['birth_place'][2] for number in numbers])), 1,
+                             'block spans several places')
+        self.assertTrue(len(pipeline.blocks) > 1, 'namesakes not split up')
+
+    def test_filters_by_min_score(self):
+        pipeline = DedupPipeline(self.fs, bucket_years=1000, use_place=False)
+        pipeline.add(self.persons(self.namesakes))
+        results = pipeline.run(min_score=0.5)
+        self.assertTrue(results, 'no results')
+        self.assertTrue(len(results) < pipeline.requests, 'no results filtered')
+        self.assertTrue(min([result.score for result in results]) >= 0.5, 'low score returned')
+
+    def test_skips_oversized_blocks(self):
+        pipeline = DedupPipeline(self.fs, bucket_years=1000, use_place=False, max_block_size=3)
+        pipeline.add(self.persons(self.namesakes))
+        self.assertEqual(pipeline.run(), [], 'oversized block scored')
+        self.assertEqual(self.requests, [], 'oversized block requested')
+        self.assertEqual(len(pipeline.oversized_blocks()), 1, 'oversized block not listed')
+
+    def test_adds_crawled_and_typed_persons(self):
+        root = self.tree.generation_start(5) + 3
+        pipeline = DedupPipeline(self.fs)
+        pipeline.add(self.fs.iter_descendants(self.tree.id(root), 1))
+        pipeline.add(model.Person.from_json(self.fs.person(self.tree.id(root))))
+        self.assertEqual(pipeline.persons, 1 + len(self.tree.children(root)), 'wrong number of persons added')
+
+    def test_find_duplicates(self):
+        results = self.fs.find_duplicates(self.persons(self.namesakes), bucket_years=1000, use_place=False)
+        self.assertEqual(len(results), len(self.requests), 'wrong number of results')
+        self.assertTrue(isinstance(results[0], MatchResult), 'wrong result type')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import familysearch
+import familysearch.metrics
+import unittest
+import urllib2
+from familysearch.metrics import Histogram, MetricsRegistry
+from familysearch.transport import WSGITransport
+from common import *
+
+sample_person1 = load_sample('person1.json')
+sample_login = load_sample('login.json')
+
+
+class TestHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.id = 'FAKE_PERSON_ID'
+
+    def record_events(self, fs):
+        """Add a hook for every event, returning the list of (event, info) pairs recorded."""
+        events = []
+        for event in familysearch.metrics.EVENTS:
+            fs.add_hook(event, lambda event, info: events.append((event, info)))
+        return events
+
+    def test_runs_hooks_in_order(self):
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session,
+                                       transport=WSGITransport(make_app(sample_person1)))
+        events = self.record_events(fs)
+        fs.person(self.id)
+        self.assertEqual([event for (event, info) in events],
+                         ['before_send', 'after_headers', 'after_body', 'after_decode', 'after_clean'],
+                         'wrong hooks run')
+        info = events[-1][1]
+        self.assertEqual(info.endpoint, '/familytree/v2/person', 'wrong endpoint label')
+        self.assertEqual(info.method, 'GET', 'wrong method recorded')
+        self.assertTrue(self.id in info.url, 'wrong URL recorded')
+        self.assertEqual(info.status, 200, 'wrong status recorded')
+        self.assertEqual(info.bytes, len(sample_person1), 'wrong number of bytes recorded')
+        self.assertTrue(info.elapsed('before_send', 'after_clean') >= 0, 'times not recorded')
+
+    def test_labels_endpoint_without_ids(self):
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session,
+                                       transport=WSGITransport(make_app(sample_person1)),
+                                       metrics=MetricsRegistry())
+        events = self.record_events(fs)
+        fs._request(fs.familytree_base + 'person/ABCD-123,EFGH-456').read()
+        fs._request(fs.familytree_base + 'person/IJKL-789?names=all').read()
+        fs.person(['ABCD-123', 'EFGH-456'])
+        self.assertEqual(set([info.endpoint for (event, info) in events]), set(['/familytree/v2/person']),
+                         'IDs included in endpoint label')
+        self.assertEqual(fs.metrics.bytes_received.keys(), ['/familytree/v2/person'], 'one series per ID set')
+
+    def test_runs_error_hooks(self):
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session,
+                                       transport=WSGITransport(make_app('', status='404 Not Found')))
+        events = self.record_events(fs)
+        self.assertRaises(urllib2.HTTPError, fs.person, self.id)
+        self.assertEqual([event for (event, info) in events], ['before_send', 'on_error'], 'wrong hooks run')
+        self.assertEqual(events[-1][1].status, 404, 'error status not recorded')
+        self.assertTrue(isinstance(events[-1][1].error, urllib2.HTTPError), 'error not recorded')
+
+    def test_runs_hooks_for_identity_requests(self):
+        fs = familysearch.FamilySearch(self.agent, self.key,
+                                       transport=WSGITransport(make_app(sample_login)))
+        events = self.record_events(fs)
+        fs.login('FAKE_USERNAME', 'FAKE_PASSWORD')
+        self.assertEqual([event for (event, info) in events],
+                         ['before_send', 'after_headers', 'after_body', 'after_decode'],
+                         'wrong hooks run')
+        self.assertEqual(events[0][1].endpoint, '/identity/v2/login', 'wrong endpoint label')
+        self.assertEqual(events[0][1].method, 'POST', 'wrong method recorded')
+
+    def test_rejects_unknown_event(self):
+        fs = familysearch.FamilySearch(self.agent, self.key)
+        self.assertRaises(ValueError, fs.add_hook, 'after_lunch', lambda event, info: None)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.id = 'FAKE_PERSON_ID'
+        self.timer = familysearch.metrics.timer
+        self.ticks = [0]
+        def timer():
+            # Every event happens 10ms after the previous one
+            self.ticks[0] += 1
+            return self.ticks[0] * 0.01
+        familysearch.metrics.timer = timer
+
+    def tearDown(self):
+        familysearch.metrics.timer = self.timer
+
+    def test_collects_metrics(self):
+        registry = MetricsRegistry()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, metrics=registry,
+                                       transport=WSGITransport(make_app(sample_person1)))
+        fs.person(self.id)
+        fs.person(self.id)
+        endpoint = '/familytree/v2/person'
+        self.assertEqual(registry.latency[(endpoint, 'network')].count, 2, 'network time not recorded')
+        self.assertAlmostEqual(registry.latency[(endpoint, 'network')].sum, 0.04, 6, 'wrong network time recorded')
+        self.assertAlmostEqual(registry.latency[(endpoint, 'decode')].sum, 0.02, 6, 'wrong decode time recorded')
+        self.assertAlmostEqual(registry.latency[(endpoint, 'clean')].sum, 0.02, 6, 'wrong clean time recorded')
+        self.assertEqual(registry.bytes_received[endpoint], 2 * len(sample_person1), 'wrong bytes received')
+        self.assertEqual(registry.statuses, {(endpoint, 200): 2}, 'wrong statuses recorded')
+        self.assertEqual(registry.errors, {}, 'errors recorded for successful requests')
+
+    def test_counts_errors(self):
+        registry = MetricsRegistry()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, metrics=registry,
+                                       transport=WSGITransport(make_app('', status='404 Not Found')))
+        self.assertRaises(urllib2.HTTPError, fs.person, self.id)
+        endpoint = '/familytree/v2/person'
+        self.assertEqual(registry.statuses, {(endpoint, 404): 1}, 'error status not recorded')
+        self.assertEqual(registry.errors, {(endpoint, 'HTTPError'): 1}, 'error not recorded')
+
+    def test_exports_dict(self):
+        registry = MetricsRegistry()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, metrics=registry,
+                                       transport=WSGITransport(make_app(sample_person1)))
+        fs.person(self.id)
+        metrics = registry.as_dict()['/familytree/v2/person']
+        self.assertEqual(metrics['statuses'], {200: 1}, 'wrong statuses exported')
+        self.assertEqual(metrics['bytes_received'], len(sample_person1), 'wrong bytes exported')
+        self.assertEqual(sorted(metrics['latency'].keys()), ['clean', 'decode', 'network'], 'wrong phases exported')
+        self.assertEqual(metrics['latency']['network']['count'], 1, 'wrong histogram exported')
+
+    def test_exports_prometheus_text(self):
+        registry = MetricsRegistry()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, metrics=registry,
+                                       transport=WSGITransport(make_app(sample_person1)))
+        fs.person(self.id)
+        lines = registry.prometheus().splitlines()
+        self.assertIn('# TYPE familysearch_request_seconds histogram', lines, 'histogram type not exported')
+        self.assertIn('familysearch_request_seconds_bucket{endpoint="/familytree/v2/person",phase="network",le="+Inf"} 1',
+                      lines, 'histogram buckets not exported')
+        self.assertIn('familysearch_request_seconds_count{endpoint="/familytree/v2/person",phase="decode"} 1',
+                      lines, 'histogram count not exported')
+        self.assertIn('familysearch_received_bytes_total{endpoint="/familytree/v2/person"} %d' % len(sample_person1),
+                      lines, 'bytes received not exported')
+        self.assertIn('familysearch_responses_total{endpoint="/familytree/v2/person",status="200"} 1',
+                      lines, 'statuses not exported')
+
+    def test_resets(self):
+        registry = MetricsRegistry()
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, metrics=registry,
+                                       transport=WSGITransport(make_app(sample_person1)))
+        fs.person(self.id)
+        registry.reset()
+        self.assertEqual(registry.as_dict(), {}, 'metrics not reset')
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_counts_values_in_buckets(self):
+        histogram = Histogram([0.1, 1])
+        for value in [0.05, 0.1, 0.5, 2]:
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(0.1, 2), (1, 3), (float('inf'), 4)], 'wrong bucket counts')
+        self.assertEqual(histogram.count, 4, 'wrong count')
+        self.assertAlmostEqual(histogram.sum, 2.65, 6, 'wrong sum')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import familysearch
+import pickle
+import unittest
+import wsgi_intercept
+import wsgi_intercept.httplib_intercept
+from familysearch import jsoncodec, model
+from familysearch.fakeserver import FakeServer
+from familysearch.transport import WSGITransport
+from common import *
+
+
+class TestModel(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.persons = jsoncodec.loads_clean(load_sample('person_list.json'))['persons']
+
+    def test_round_trips_samples(self):
+        for (filename, key) in [('person_list.json', 'persons'), ('persona_list.json', 'personas'),
+                                ('pedigree.json', 'pedigrees'), ('person2.json', 'persons')]:
+            for result in jsoncodec.loads_clean(load_sample(filename))[key]:
+                obj = model.results[key].from_json(result)
+                self.assertEqual(obj.to_json_dict(), result, 'model of %s differs from its JSON' % filename)
+                for person in getattr(obj, 'persons', None) or [obj]:
+                    person.assertions
+                self.assertEqual(obj.to_json_dict(), result, 'decoded model of %s differs from its JSON' % filename)
+
+    def test_reads_fields(self):
+        person = model.Person.from_json(self.persons[0])
+        self.assertEqual(person.id, self.persons[0]['id'], 'wrong ID')
+        self.assertEqual(person.gender, 'Male', 'wrong gender')
+        self.assertEqual(person.name, 'John Smith', 'wrong name')
+        self.assertEqual(person.names[0].forms[0].pieces[1].value, 'Smith', 'wrong surname')
+        self.assertEqual(person.birth.date.normalized, '1 January 1950', 'wrong birth date')
+        self.assertEqual(person.birth.date.earliest, '2433283', 'wrong astronomical date')
+        self.assertEqual(person.birth.place.id, '5061446', 'wrong birth place')
+        self.assertEqual(person.death, None, 'death found')
+
+    def test_decodes_assertions_lazily(self):
+        person = model.Person.from_json(self.persons[0])
+        self.assertEqual(person._assertions, None, 'assertions decoded before access')
+        self.assertTrue(isinstance(person._raw_assertions, str), 'assertions not kept as JSON')
+        self.assertTrue(isinstance(person.assertions['events'][0].value, model.Event), 'events not decoded')
+        self.assertEqual(person._raw_assertions, None, 'encoded assertions kept after decoding')
+
+    def test_uses_slots(self):
+        person = model.Person.from_json(self.persons[0])
+        self.assertFalse(hasattr(person, '__dict__'), 'person has a __dict__')
+        self.assertFalse(hasattr(person.names[0], '__dict__'), 'name has a __dict__')
+        self.assertRaises(AttributeError, setattr, person, 'nickname', 'Jack')
+
+    def test_interns_enum_values(self):
+        first = model.Person.from_json(jsoncodec.loads_clean(load_sample('person1.json'))['persons'][0])
+        second = model.Person.from_json(jsoncodec.loads_clean(load_sample('person1.json'))['persons'][0])
+        self.assertTrue(first.gender is second.gender, 'gender not shared')
+        self.assertTrue(first.birth.type is second.birth.type, 'event type not shared')
+        self.assertTrue(first.birth.place.version is second.birth.place.version, 'place version not shared')
+
+    def test_keeps_unknown_attributes(self):
+        data = {'id': 'ABCD-123', 'modified': 12345,
+                'assertions': {'characteristics': [{'value': {'type': 'Occupation', 'detail': 'Baker'}}],
+                               'events': [{'value': {'type': 'Birth', 'date': {'original': '1900',
+                                                                               'astro': {'other': 1}}}}]}}
+        person = model.Person.from_json(data)
+        self.assertEqual(person.extra, {'modified': 12345}, 'unknown attribute not kept')
+        self.assertEqual(person.assertions['characteristics'][0].value['detail'], 'Baker',
+                         'unknown assertion not kept as a dict')
+        self.assertEqual(person.to_json_dict(), data, 'unknown attributes not returned')
+
+    def test_relationships(self):
+        server = FakeServer(size=1000, founders=100)
+        fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=WSGITransport(server),
+                                       typed=True)
+        number = 300
+        person = fs.person(server.tree.id(number), parents='summary', families='summary')
+        (father, mother) = server.tree.parents(number)
+        self.assertEqual(person.father.id, server.tree.id(father), 'wrong father')
+        self.assertEqual(person.mother.id, server.tree.id(mother), 'wrong mother')
+        self.assertEqual([child.id for child in person.families[0].children],
+                         [server.tree.id(child) for child in server.tree.children(number)], 'wrong children')
+
+    def test_compares_and_pickles(self):
+        person = model.Person.from_json(self.persons[0])
+        copy = pickle.loads(pickle.dumps(person, 2))
+        self.assertEqual(copy, person, 'unpickled person differs')
+        self.assertNotEqual(model.Person.from_json(self.persons[1]), person, 'different persons equal')
+        self.assertNotEqual(model.Persona.from_json(self.persons[0]), person, 'persona equals person')
+
+
+class TestTypedFamilySearch(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        wsgi_intercept.httplib_intercept.install()
+        self.fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', session='FAKE_SESSION_ID',
+                                            typed=True)
+
+    def tearDown(self):
+        clear_request_intercpets()
+        wsgi_intercept.httplib_intercept.uninstall()
+
+    def test_person_returns_models(self):
+        add_request_intercept(load_sample('person_list.json'))
+        persons = self.fs.person(['ABCD-123', 'EFGH-456'])
+        self.assertEqual([person.__class__ for person in persons], [model.Person, model.Person],
+                         'persons not returned as models')
+        add_request_intercept(load_sample('person1.json'))
+        self.assertTrue(isinstance(self.fs.person('ABCD-123'), model.Person), 'person not returned as a model')
+
+    def test_persona_and_pedigree_return_models(self):
+        add_request_intercept(load_sample('persona_list.json'))
+        self.assertTrue(isinstance(self.fs.persona(['ABCD-123', 'EFGH-456'])[0], model.Persona),
+                        'persona not returned as a model')
+        add_request_intercept(load_sample('pedigree.json'))
+        pedigree = self.fs.pedigree('ABCD-123')
+        self.assertTrue(isinstance(pedigree, model.Pedigree), 'pedigree not returned as a model')
+        self.assertEqual(pedigree.person().id, pedigree.id, 'root person not found in pedigree')
+
+    def test_iterators_return_models(self):
+        add_request_intercept(load_sample('person_list.json'))
+        persons = list(self.fs.iter_persons(['ABCD-123', 'EFGH-456']))
+        self.assertEqual([person.__class__ for person in persons], [model.Person, model.Person],
+                         'iterated persons not returned as models')
+
+    def test_version_returns_dicts(self):
+        add_request_intercept(load_sample('version_list.json'))
+        self.assertEqual(type(self.fs.version(['ABCD-123', 'EFGH-456'])[0]), dict, 'version not returned as dict')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import familysearch
+import os
+import shutil
+import tempfile
+import unittest
+import wsgi_intercept.httplib_intercept
+from familysearch.ratelimit import RateLimiter, SharedTokenBucket, TokenBucket
+from common import *
+
+sample_person1 = load_sample('person1.json')
+
+
+class FakeClock(object):
+    """A clock that only advances when slept on."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def use_fake_clock(bucket, clock):
+    bucket.clock = clock
+    bucket.sleep = clock.sleep
+    bucket._store(bucket.burst, clock())
+    return bucket
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_allows_burst(self):
+        bucket = use_fake_clock(TokenBucket(2, burst=5), self.clock)
+        for i in range(5):
+            bucket.acquire()
+        self.assertEqual(self.clock.slept, [], 'waited within burst size')
+
+    def test_waits_after_burst(self):
+        bucket = use_fake_clock(TokenBucket(2, burst=5), self.clock)
+        for i in range(6):
+            bucket.acquire()
+        self.assertEqual(self.clock.slept, [0.5], 'wrong wait after burst exhausted')
+
+    def test_refills_at_rate(self):
+        bucket = use_fake_clock(TokenBucket(2, burst=5), self.clock)
+        for i in range(5):
+            bucket.acquire()
+        self.clock.now += 1
+        self.assertTrue(bucket.try_acquire(), 'bucket not refilled')
+        self.assertTrue(bucket.try_acquire(), 'bucket not refilled at rate')
+        self.assertFalse(bucket.try_acquire(), 'bucket refilled above rate')
+
+    def test_rejects_more_tokens_than_burst(self):
+        self.assertRaises(ValueError, TokenBucket, 2, burst=0.5)
+        self.assertRaises(ValueError, RateLimiter, 2, burst=0.5)
+        bucket = use_fake_clock(TokenBucket(2, burst=1), self.clock)
+        self.assertRaises(ValueError, bucket.acquire, 2)
+        self.assertRaises(ValueError, bucket.try_acquire, 2)
+        self.assertEqual(self.clock.slept, [], 'waited for tokens that can never be available')
+        self.assertEqual(bucket.acquire(1), 0, 'token not taken')
+
+
+class TestSharedTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'bucket')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shares_state_between_buckets(self):
+        bucket1 = use_fake_clock(SharedTokenBucket(self.path, 1, burst=3), self.clock)
+        bucket2 = SharedTokenBucket(self.path, 1, burst=3)
+        bucket2.clock = self.clock
+        self.assertTrue(bucket1.try_acquire(), 'shared bucket empty')
+        self.assertTrue(bucket2.try_acquire(), 'shared bucket empty')
+        self.assertTrue(bucket1.try_acquire(), 'shared bucket empty')
+        self.assertFalse(bucket2.try_acquire(), 'shared bucket state not shared')
+        bucket1.close()
+        bucket2.close()
+
+    def test_shares_state_between_processes(self):
+        bucket = SharedTokenBucket(self.path, 0.001, burst=2)
+        pid = os.fork()
+        if pid == 0:
+            os._exit(int(not bucket.try_acquire()))
+        self.assertEqual(os.waitpid(pid, 0)[1], 0, 'child process could not take token')
+        self.assertTrue(bucket.try_acquire(), 'shared bucket empty')
+        self.assertFalse(bucket.try_acquire(), 'shared bucket state not shared with child process')
+        bucket.close()
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.clock = FakeClock()
+        wsgi_intercept.httplib_intercept.install()
+
+    def tearDown(self):
+        clear_request_intercpets()
+        wsgi_intercept.httplib_intercept.uninstall()
+
+    def test_one_bucket_per_key(self):
+        limiter = RateLimiter(1)
+        self.assertTrue(limiter.bucket('key1') is limiter.bucket('key1'), 'bucket not reused for key')
+        self.assertFalse(limiter.bucket('key1') is limiter.bucket('key2'), 'bucket shared between keys')
+
+    def test_consulted_before_request(self):
+        add_request_intercept(sample_person1)
+        limiter = RateLimiter(4, burst=1)
+        use_fake_clock(limiter.bucket(self.key), self.clock)
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session, rate_limiter=limiter)
+        fs.person()
+        fs.person()
+        fs.person()
+        self.assertEqual(self.clock.slept, [0.25, 0.25], 'requests not rate limited')
+
+
+if __name__ == '__main__':
+    unittest.main()
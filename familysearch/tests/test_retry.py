@@ -0,0 +1,94 @@
+import familysearch
+import time
+import unittest
+import urllib2
+import wsgi_intercept.httplib_intercept
+from familysearch.retry import RetryPolicy, parse_retry_after
+from common import *
+
+sample_person1 = load_sample('person1.json')
+
+
+class TestRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.delays = []
+        wsgi_intercept.httplib_intercept.install()
+        self.fs = familysearch.FamilySearch(self.agent, self.key, session=self.session)
+        self.fs.retry_policy.sleep = self.delays.append
+
+    def tearDown(self):
+        clear_request_intercpets()
+        wsgi_intercept.httplib_intercept.uninstall()
+
+    def test_retries_service_unavailable(self):
+        requests = add_sequence_intercept([('503 Service Unavailable', {}, ''),
+                                           ('200 OK', default_headers, sample_person1)])
+        self.fs.person()
+        self.assertEqual(len(requests), 2, 'request not retried after error 503')
+        self.assertEqual(self.fs.retry_policy.retries, 1, 'retry not counted')
+        self.assertEqual(self.fs.retry_policy.retries_by_status, {503: 1}, 'retry not counted by status')
+
+    def test_gives_up_after_max_attempts(self):
+        requests = add_sequence_intercept([('500 Internal Server Error', {}, '')] * 3)
+        self.assertRaises(urllib2.HTTPError, self.fs.person)
+        self.assertEqual(len(requests), 3, 'wrong number of attempts')
+        self.assertEqual(self.fs.retry_policy.failures, 1, 'failure not counted')
+
+    def test_does_not_retry_other_statuses(self):
+        requests = add_sequence_intercept([('404 Not Found', {}, '')])
+        self.assertRaises(urllib2.HTTPError, self.fs.person)
+        self.assertEqual(len(requests), 1, 'request retried after error 404')
+        self.assertEqual(self.fs.retry_policy.retries, 0, 'retry counted for error 404')
+
+    def test_does_not_retry_post(self):
+        requests = add_sequence_intercept([('503 Service Unavailable', {}, '')])
+        self.assertRaises(urllib2.HTTPError, self.fs.login, 'FAKE_USERNAME', 'FAKE_PASSWORD')
+        self.assertEqual([request['REQUEST_METHOD'] for request in requests], ['POST'], 'POST request retried')
+
+    def test_honors_retry_after(self):
+        add_sequence_intercept([('503 Service Unavailable', {'Retry-After': '7'}, ''),
+                                ('200 OK', default_headers, sample_person1)])
+        self.fs.person()
+        self.assertEqual(self.delays, [7], 'Retry-After header not honored')
+
+    def test_custom_statuses(self):
+        fs = familysearch.FamilySearch(self.agent, self.key, retry_policy=RetryPolicy(statuses=[429]))
+        fs.retry_policy.sleep = self.delays.append
+        requests = add_sequence_intercept([('429 Too Many Requests', {}, ''),
+                                           ('200 OK', default_headers, sample_person1)])
+        fs.person()
+        self.assertEqual(len(requests), 2, 'request not retried after custom status')
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_backoff_is_exponential(self):
+        policy = RetryPolicy(backoff=1, jitter=0)
+        self.assertEqual([policy.delay(attempt) for attempt in (1, 2, 3)], [1, 2, 4], 'backoff not exponential')
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(backoff=1, max_backoff=3, jitter=0)
+        self.assertEqual(policy.delay(5), 3, 'backoff not capped at max_backoff')
+
+    def test_jitter_reduces_delay(self):
+        policy = RetryPolicy(backoff=1, jitter=0.5)
+        for i in range(20):
+            delay = policy.delay(1)
+            self.assertTrue(0.5 <= delay <= 1, 'jittered delay out of range')
+
+    def test_parses_retry_after_seconds(self):
+        self.assertEqual(parse_retry_after({'Retry-After': '120'}), 120, 'Retry-After seconds not parsed')
+
+    def test_parses_retry_after_date(self):
+        date = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 60))
+        delay = parse_retry_after({'Retry-After': date})
+        self.assertTrue(55 <= delay <= 60, 'Retry-After date not parsed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+import familysearch
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+from familysearch import model
+from familysearch.cache import PersonCache
+from familysearch.fakeserver import FakeServer
+from familysearch.store import SQLiteStore
+from familysearch.transport import WSGITransport
+
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'store.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stores_results_by_id_and_params(self):
+        store = SQLiteStore(self.path)
+        store.set_many('person', [('A', {'id': 'A', 'version': '12'}), ('B', {'id': 'B'})], {'names': 'all'})
+        self.assertEqual(store.get_many('person', ['A', 'B', 'C'], {'names': 'all'}),
+                         {'A': {'id': 'A', 'version': '12'}, 'B': {'id': 'B'}}, 'wrong results returned')
+        self.assertEqual(store.get_many('person', ['A']), {}, 'result returned for other params')
+        self.assertEqual(store.get_many('persona', ['A'], {'names': 'all'}), {}, 'result returned for other endpoint')
+        self.assertEqual(store.version('person', 'A', {'names': 'all'}), '12', 'wrong version stored')
+        self.assertEqual((store.hits, store.misses), (2, 3), 'wrong counters')
+
+    def test_shared_between_instances(self):
+        SQLiteStore(self.path).set_many('version', [('A', {'version': '1'})])
+        self.assertEqual(SQLiteStore(self.path).get_many('version', ['A']), {'A': {'version': '1'}},
+                         'result not shared')
+        store = pickle.loads(pickle.dumps(SQLiteStore(self.path, ttl=60, max_entries=10, access_interval=5)))
+        self.assertEqual((store.path, store.ttl, store.max_entries, store.access_interval), (self.path, 60, 10, 5),
+                         'settings not pickled')
+        self.assertEqual(store.get_many('version', ['A']), {'A': {'version': '1'}}, 'unpickled store empty')
+
+    def test_uses_write_ahead_log(self):
+        store = SQLiteStore(self.path)
+        self.assertEqual(store._connection().execute('PRAGMA journal_mode').fetchone()[0], 'wal', 'WAL not used')
+
+    def test_expires_entries(self):
+        store = SQLiteStore(self.path, ttl=60, ttls={'version': 0})
+        store.set_many('version', [('A', {'version': '1'})])
+        store.set_many('person', [('A', {'id': 'A'})])
+        self.assertEqual(store.get_many('version', ['A']), {}, 'expired result returned')
+        self.assertEqual(store.get_many('person', ['A']), {'A': {'id': 'A'}}, 'result expired early')
+        store.evict()
+        self.assertEqual(store.stats()['entries'], 1, 'expired entry not removed')
+
+    def test_evicts_least_recently_used_by_entries(self):
+        store = SQLiteStore(self.path, max_entries=2, evict_interval=1, access_interval=0)
+        store.set_many('person', [('A', 1)])
+        store.set_many('person', [('B', 2)])
+        store.get_many('person', ['A'])
+        store.set_many('person', [('C', 3)])
+        self.assertEqual(sorted(store.get_many('person', ['A', 'B', 'C']).keys()), ['A', 'C'],
+                         'wrong entry evicted')
+        self.assertEqual(store.evictions, 1, 'eviction not counted')
+
+    def test_marks_entries_used_at_intervals(self):
+        store = SQLiteStore(self.path, access_interval=60)
+        store.set_many('person', [('A', 1)])
+        accessed = store._connection().execute('SELECT accessed FROM entries').fetchone()[0]
+        store.get_many('person', ['A'])
+        self.assertEqual(store._connection().execute('SELECT accessed FROM entries').fetchone()[0], accessed,
+                         'entry marked again within access_interval')
+        store.access_interval = 0
+        store.get_many('person', ['A'])
+        self.assertTrue(store._connection().execute('SELECT accessed FROM entries').fetchone()[0] > accessed,
+                        'entry not marked after access_interval')
+
+    def test_reads_while_another_connection_writes(self):
+        store = SQLiteStore(self.path, access_interval=0, timeout=5)
+        store.set_many('person', [('A', 1)])
+        writer = SQLiteStore(self.path)
+        writer._connection().execute('BEGIN IMMEDIATE')
+        try:
+            started = time.time()
+            self.assertEqual(store.get_many('person', ['A']), {'A': 1}, 'entry not read')
+            self.assertTrue(time.time() - started < 1, 'reader waited for writer')
+        finally:
+            writer._connection().execute('ROLLBACK')
+
+    def test_evicts_by_bytes(self):
+        store = SQLiteStore(self.path, max_bytes=3000, evict_interval=1)
+        for id in 'ABCDE':
+            store.set_many('place', [(id, 'x' * 1000)])
+        stats = store.stats()
+        self.assertTrue(stats['bytes'] <= 3000, 'store larger than max_bytes')
+        self.assertEqual(stats['entries'], 2, 'wrong number of entries kept')
+
+    def test_read_matches_results_by_id(self):
+        store = SQLiteStore(self.path)
+        fetched = store.read('person', ['A', 'B', 'C'], {},
+                             lambda ids: [{'id': 'C'}, {'requestedId': 'A', 'id': 'X'}, {'id': 'C'}])
+        self.assertEqual(fetched, [{'requestedId': 'A', 'id': 'X'}, {'id': 'C'}], 'results matched by position')
+        self.assertEqual(store.get_many('person', ['A', 'B', 'C']),
+                         {'A': {'requestedId': 'A', 'id': 'X'}, 'C': {'id': 'C'}}, 'results stored under wrong IDs')
+        self.assertEqual(store.read('place', ['1', '2'], {}, lambda ids: [['one'], ['two']]), [['one'], ['two']],
+                         'results without IDs not matched by position')
+
+    def test_storage_interface(self):
+        store = SQLiteStore(self.path)
+        store.set('key', {'body': 'BODY'})
+        self.assertEqual(store.get('key'), {'body': 'BODY'}, 'item not stored')
+        store.delete('key')
+        self.assertEqual(store.get('key', 'default'), 'default', 'item not deleted')
+
+
+class TestFamilySearchStore(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.directory = tempfile.mkdtemp()
+        self.store = SQLiteStore(os.path.join(self.directory, 'store.db'))
+        self.server = FakeServer(size=10000, founders=100, seed=3)
+        self.tree = self.server.tree
+        self.fs = self.familysearch()
+        self.ids = [self.tree.id(number) for number in range(5000, 5025)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def familysearch(self, **kwargs):
+        fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=WSGITransport(self.server),
+                                       store=self.store, **kwargs)
+        self.urls = []
+        fs.add_hook('before_send', lambda event, info: self.urls.append(info.url))
+        return fs
+
+    def test_reads_persons_through_store(self):
+        expected = self.fs.person(self.ids[:10])
+        self.urls = []
+        self.assertEqual(self.fs.person(self.ids[:10]), expected, 'stored persons differ')
+        self.assertEqual(self.urls, [], 'stored persons requested')
+        persons = self.fs.person(self.ids[5:15])
+        self.assertEqual([person['id'] for person in persons], self.ids[5:15], 'wrong persons returned')
+        self.assertEqual(len(self.urls), 1, 'wrong number of requests')
+        self.assertFalse(self.ids[5] in self.urls[0], 'stored person requested')
+        self.assertEqual(self.fs.person(self.ids[3])['id'], self.ids[3], 'single person not returned')
+
+    def test_separates_options(self):
+        self.fs.person(self.ids[0])
+        self.urls = []
+        self.fs.person(self.ids[0], names='all')
+        self.assertEqual(len(self.urls), 1, 'person with other options not requested')
+
+    def test_reads_other_endpoints_through_store(self):
+        for (method, args, kwargs) in [(self.fs.persona, (self.ids,), {}),
+                                       (self.fs.pedigree, (self.ids[:3],), {'ancestors': 2}),
+                                       (self.fs.place, (), {'place': 'Paris'}), (self.fs.date, ('1 Jan 1900',), {}),
+                                       (self.fs.name, ('John Smith',), {}), (self.fs.culture, (), {})]:
+            expected = method(*args, **kwargs)
+            self.urls = []
+            self.assertEqual(method(*args, **kwargs), expected, 'stored results of %s differ' % method.__name__)
+            self.assertEqual(self.urls, [], 'stored results of %s requested' % method.__name__)
+
+    def test_requests_versions_and_discards_changed_persons(self):
+        self.fs.person(self.ids[:10])
+        self.tree.touch(self.tree.number(self.ids[2]))
+        self.urls = []
+        versions = self.fs.version(self.ids[:10])
+        self.assertEqual(versions[2]['version'], self.tree.version(self.tree.number(self.ids[2])), 'stale version')
+        self.assertEqual(len(self.urls), 1, 'versions not requested')
+        list(self.fs.iter_versions(self.ids[:10]))
+        self.assertEqual(len(self.urls), 2, 'iterated versions not requested')
+        self.urls = []
+        persons = self.fs.person(self.ids[:10])
+        self.assertEqual(len(self.urls), 1, 'changed person not requested')
+        self.assertTrue(self.ids[2] in self.urls[0] and self.ids[3] not in self.urls[0], 'wrong persons requested')
+        self.assertEqual(persons[2]['version'], versions[2]['version'], 'stale person returned')
+
+    def test_iterators_read_through_store(self):
+        self.fs.person(self.ids[:10])
+        self.urls = []
+        persons = list(self.fs.iter_persons(self.ids))
+        self.assertEqual([person['id'] for person in persons], self.ids, 'wrong persons iterated')
+        self.assertEqual(len(self.urls), 2, 'stored persons requested')
+        self.urls = []
+        list(self.fs.iter_persons(self.ids))
+        self.assertEqual(self.urls, [], 'stored persons requested again')
+
+    def test_survives_restart(self):
+        self.fs.person(self.ids)
+        fs = pickle.loads(pickle.dumps(self.fs))
+        self.assertEqual(fs.store.path, self.store.path, 'store not pickled')
+        fs = self.familysearch(typed=True)
+        persons = fs.person(self.ids)
+        self.assertEqual(self.urls, [], 'stored persons requested by new instance')
+        self.assertTrue(isinstance(persons[0], model.Person), 'stored persons not returned as models')
+
+    def test_backs_person_cache(self):
+        PersonCache(self.fs, self.store).get(self.ids[:5])
+        cache = PersonCache(self.fs, self.store)
+        cache.get(self.ids[:5])
+        self.assertEqual(cache.hits, 5, 'persons not read from store')
+
+    def test_person_cache_sees_changes(self):
+        cache = PersonCache(self.fs)
+        cache.get(self.ids[:5])
+        number = self.tree.number(self.ids[1])
+        self.tree.touch(number)
+        self.urls = []
+        persons = cache.get(self.ids[:5])
+        self.assertEqual(persons[1]['version'], self.tree.version(number), 'stale person returned')
+        self.assertEqual((cache.hits, cache.misses), (4, 6), 'wrong counters')
+        self.assertEqual(len(self.urls), 2, 'version or changed person not requested')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import familysearch
+import httplib
+import unittest
+import urllib2
+import wsgi_intercept.httplib_intercept
+from StringIO import StringIO
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from familysearch.transport import Response, Transport, Urllib2Transport, WSGITransport
+from common import *
+
+sample_person1 = load_sample('person1.json')
+sample_login = load_sample('login.json')
+
+
+class TestWSGITransport(unittest.TestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        self.agent = 'TEST_USER_AGENT'
+        self.key = 'FAKE_DEV_KEY'
+        self.session = 'FAKE_SESSION_ID'
+        self.username = 'FAKE_USERNAME'
+        self.password = 'FAKE_PASSWORD'
+        self.cookie = 'FAKE_COOKIE=FAKE_VALUE'
+        self.id = 'FAKE_PERSON_ID'
+
+    def test_calls_app(self):
+        environ = {}
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session,
+                                       transport=WSGITransport(make_app(sample_person1, environ)))
+        person = fs.person(self.id, names='all')
+        self.assertEqual(person['id'], json.loads(sample_person1)['persons'][0]['id'], 'wrong person returned')
+        self.assertEqual(environ['PATH_INFO'], '/familytree/v2/person/' + self.id, 'wrong path passed to app')
+        self.assertIn('names=all', environ['QUERY_STRING'], 'query string not passed to app')
+        self.assertIn(self.agent, environ['HTTP_USER_AGENT'], 'user agent not passed to app')
+        self.assertEqual(environ['SERVER_NAME'], 'www.dev.usys.org', 'wrong server name passed to app')
+
+    def test_posts_data(self):
+        environ = {}
+        fs = familysearch.FamilySearch(self.agent, self.key,
+                                       transport=WSGITransport(make_app(sample_login, environ)))
+        fs.login(self.username, self.password)
+        self.assertEqual(environ['REQUEST_METHOD'], 'POST', 'login request not POSTed')
+        self.assertIn('username=' + self.username, environ['BODY'], 'request body not passed to app')
+        self.assertEqual(environ['CONTENT_LENGTH'], str(len(environ['BODY'])), 'wrong content length passed to app')
+        self.assertTrue(fs.logged_in, 'should be logged in after login')
+
+    def test_passes_cookies_back(self):
+        headers = default_headers.copy()
+        headers['Set-Cookie'] = self.cookie + '; Path=/'
+        fs = familysearch.FamilySearch(self.agent, self.key,
+                                       transport=WSGITransport(make_app(sample_login, headers=headers)))
+        fs.login(self.username, self.password)
+        environ = {}
+        fs.transport.app = make_app(sample_person1, environ)
+        fs.person()
+        self.assertIn(self.cookie, environ.get('HTTP_COOKIE', ''), 'previously-set cookie not included in cookie header')
+
+    def test_not_logged_in_if_error_401(self):
+        fs = familysearch.FamilySearch(self.agent, self.key, session=self.session,
+                                       transport=WSGITransport(make_app('', status='401 Unauthorized')))
+        self.assertRaises(urllib2.HTTPError, fs.person)
+        self.assertFalse(fs.logged_in, 'should not be logged in after receiving error 401')
+
+
+class TestCustomTransport(unittest.TestCase):
+
+    def test_uses_custom_transport(self):
+        class RecordingTransport(Transport):
+            def __init__(self):
+                self.urls = []
+            def send(self, request):
+                self.urls.append(request.get_full_url())
+                headers = httplib.HTTPMessage(StringIO('Content-Type: application/json\r\n'))
+                return Response(200, 'OK', headers, StringIO(sample_person1))
+        transport = RecordingTransport()
+        fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=transport)
+        fs.person()
+        self.assertEqual(len(transport.urls), 1, 'custom transport not used')
+        self.assertTrue(transport.urls[0].startswith('http://www.dev.usys.org/familytree/v2/person?'), 'wrong URL sent to custom transport')
+
+
+class TestUrllib2Transport(unittest.TestCase):
+
+    def setUp(self):
+        wsgi_intercept.httplib_intercept.install()
+
+    def tearDown(self):
+        clear_request_intercpets()
+        wsgi_intercept.httplib_intercept.uninstall()
+
+    def test_sends_request(self):
+        request_environ = add_request_intercept(sample_person1)
+        fs = familysearch.FamilySearch('TEST_USER_AGENT', 'FAKE_DEV_KEY', transport=Urllib2Transport())
+        person = fs.person()
+        self.assertEqual(person['id'], json.loads(sample_person1)['persons'][0]['id'], 'wrong person returned')
+        self.assertTrue(request_environ['PATH_INFO'].endswith('person'), 'wrong path requested')
+        self.assertEqual(fs.connection_pool, None, 'connection pool set for unpooled transport')
+
+
+if __name__ == '__main__':
+    unittest.main()
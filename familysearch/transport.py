@@ -0,0 +1,227 @@
+"""
+Pluggable transports carrying FamilySearch API requests
+
+Main classes: Transport, Response, Urllib2Transport, PooledTransport,
+WSGITransport, TransportHandler
+
+A transport sends a urllib2.Request and returns a Response holding the
+status, headers, and a file-like body. FamilySearch installs its transport
+in a urllib2 opener through a TransportHandler, so cookie handling, error
+handling (urllib2.HTTPError), and everything else urllib2 does on top of
+the network work the same with every transport.
+
+Example usage:
+
+from familysearch import FamilySearch
+from familysearch.transport import WSGITransport
+
+# Send requests to a WSGI application in-process, without sockets
+fs = FamilySearch('ClientApp/1.0', 'developer_key', transport=WSGITransport(app))
+"""
+
+import httplib
+import sys
+import urllib
+import urllib2
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import keepalive
+
+
+class Response(object):
+
+    """
+    A response returned by a Transport
+
+    Public attributes:
+
+    status -- HTTP status code (an int)
+    reason -- HTTP reason phrase
+    headers -- response headers (an httplib.HTTPMessage or similar object)
+    body -- file-like object from which the response body can be read
+    """
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+class Transport(object):
+
+    """
+    Base class for transports
+
+    Subclasses must implement send.
+    """
+
+    def send(self, request):
+        """
+        Send a urllib2.Request and return a Response.
+
+        Network errors should be raised as urllib2.URLError. Error statuses
+        must be returned as a Response, not raised.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release any resources (such as connections) held by this transport.
+        """
+        pass
+
+
+class Urllib2Transport(Transport):
+
+    """
+    A transport using urllib2's own handlers, with a new connection per request
+    """
+
+    def __init__(self):
+        """
+        Instantiate a Urllib2Transport.
+        """
+        self.handlers = {'http': urllib2.HTTPHandler()}
+        if hasattr(urllib2, 'HTTPSHandler'):
+            self.handlers['https'] = urllib2.HTTPSHandler()
+
+    def send(self, request):
+        scheme = request.get_type()
+        response = getattr(self.handlers[scheme], scheme + '_open')(request)
+        return Response(response.code, response.msg, response.info(), response)
+
+
+class PooledTransport(Urllib2Transport):
+
+    """
+    A transport reusing persistent (keep-alive) connections from a ConnectionPool
+    """
+
+    def __init__(self, pool_size=4, pool=None):
+        """
+        Instantiate a PooledTransport.
+
+        Keyword arguments:
+        pool_size (optional) -- number of idle connections to keep per host
+                                (defaults to 4; ignored if pool is given)
+        pool (optional) -- keepalive.ConnectionPool to use
+        """
+        if pool is None:
+            pool = keepalive.ConnectionPool(pool_size)
+        self.pool = pool
+        self.handlers = {'http': keepalive.KeepAliveHTTPHandler(pool)}
+        if hasattr(keepalive, 'KeepAliveHTTPSHandler'):
+            self.handlers['https'] = keepalive.KeepAliveHTTPSHandler(pool)
+
+    def close(self):
+        self.pool.clear()
+
+
+class WSGITransport(Transport):
+
+    """
+    A transport calling a WSGI application in-process, without any sockets
+
+    Requests for any host are passed to the application.
+    """
+
+    def __init__(self, app):
+        """
+        Instantiate a WSGITransport.
+
+        Keyword arguments:
+        app -- the WSGI application to call
+        """
+        self.app = app
+
+    def send(self, request):
+        environ = self.environ(request)
+        response = []
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            response[:] = [status, headers]
+            return body.append
+        body = []
+        result = self.app(environ, start_response)
+        try:
+            for data in result:
+                body.append(data)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        (status, headers) = response
+        (code, reason) = (status.split(' ', 1) + [''])[:2]
+        header_text = ''.join(['%s: %s\r\n' % (name, value) for (name, value) in headers])
+        return Response(int(code), reason, httplib.HTTPMessage(StringIO(header_text)),
+                        StringIO(''.join(body)))
+
+    def environ(self, request):
+        """
+        Return the WSGI environment for a urllib2.Request.
+        """
+        host = request.get_host()
+        if ':' in host:
+            (server_name, server_port) = host.split(':', 1)
+        elif request.get_type() == 'https':
+            (server_name, server_port) = (host, '443')
+        else:
+            (server_name, server_port) = (host, '80')
+        (path, query) = (request.get_selector().split('?', 1) + [''])[:2]
+        data = request.get_data() or ''
+        environ = {'REQUEST_METHOD': request.get_method(),
+                   'SCRIPT_NAME': '',
+                   'PATH_INFO': urllib.unquote(path),
+                   'QUERY_STRING': query,
+                   'SERVER_NAME': server_name,
+                   'SERVER_PORT': server_port,
+                   'SERVER_PROTOCOL': 'HTTP/1.1',
+                   'REMOTE_ADDR': '127.0.0.1',
+                   'wsgi.version': (1, 0),
+                   'wsgi.url_scheme': request.get_type(),
+                   'wsgi.input': StringIO(data),
+                   'wsgi.errors': sys.stderr,
+                   'wsgi.multithread': True,
+                   'wsgi.multiprocess': False,
+                   'wsgi.run_once': False}
+        for (name, value) in request.header_items():
+            name = name.upper().replace('-', '_')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+            environ[name] = value
+        if data:
+            environ['CONTENT_LENGTH'] = str(len(data))
+        return environ
+
+
+class TransportHandler(urllib2.HTTPHandler):
+
+    """
+    A urllib2 handler sending HTTP and HTTPS requests through a Transport
+
+    Replaces urllib2's default HTTP handler, and runs before its default HTTPS
+    handler.
+    """
+
+    handler_order = 400
+
+    def __init__(self, transport):
+        urllib2.HTTPHandler.__init__(self)
+        self.transport = transport
+
+    def http_open(self, req):
+        if not req.get_host():
+            raise urllib2.URLError('no host given')
+        response = self.transport.send(req)
+        resp = urllib2.addinfourl(response.body, response.headers, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+    https_open = http_open
+    https_request = urllib2.AbstractHTTPHandler.do_request_
@@ -0,0 +1,231 @@
+"""
+A minimal thread pool for running FamilySearch requests concurrently
+
+Main classes: WorkerPool, Future
+
+Python 2 has neither asyncio nor concurrent.futures, so this module provides
+the small subset of the concurrent.futures API used by this package.
+"""
+
+import Queue
+import sys
+import threading
+
+
+class Future(object):
+
+    """
+    The pending result of a call submitted to a WorkerPool
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        """
+        Return True if the call has finished.
+        """
+        return self._done
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to finish and return its result.
+
+        Re-raises the exception raised by the call, if any.
+        """
+        self._wait(timeout)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        Wait for the call to finish and return the exception it raised, or None.
+        """
+        self._wait(timeout)
+        if self._exc_info:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, fn):
+        """
+        Call fn with this future as its only argument once the call has finished.
+        """
+        self._condition.acquire()
+        try:
+            if not self._done:
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._condition.release()
+        fn(self)
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exc_info(self, exc_info):
+        self._finish(None, exc_info)
+
+    def _wait(self, timeout):
+        self._condition.acquire()
+        try:
+            if timeout is None:
+                while not self._done:
+                    self._condition.wait()
+            elif not self._done:
+                self._condition.wait(timeout)
+            if not self._done:
+                raise RuntimeError('timed out waiting for result')
+        finally:
+            self._condition.release()
+
+    def _finish(self, result, exc_info):
+        self._condition.acquire()
+        try:
+            self._result = result
+            self._exc_info = exc_info
+            self._done = True
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        for fn in callbacks:
+            fn(self)
+
+
+class WorkerPool(object):
+
+    """
+    A pool of daemon threads that run submitted calls
+
+    Threads are started lazily, up to max_workers. Calls submitted from one of
+    the pool's own threads (as when a concurrent call fans out further) run
+    inline, so that nested use of a pool can never deadlock waiting for a
+    free worker. Threads keep waiting for calls until shutdown is called.
+    """
+
+    def __init__(self, max_workers=8):
+        """
+        Instantiate a WorkerPool.
+
+        Keyword arguments:
+        max_workers (optional) -- maximum number of threads (defaults to 8)
+        """
+        self.max_workers = max_workers
+        self._tasks = Queue.Queue()
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) to run and return a Future for its result.
+        """
+        if self._shutdown:
+            raise RuntimeError('cannot submit calls to a WorkerPool after shutdown')
+        future = Future()
+        if self.max_workers < 1 or getattr(self._local, 'worker', False):
+            self._run(future, fn, args, kwargs)
+            return future
+        self._lock.acquire()
+        try:
+            if self._idle <= 0 and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                self._threads.append(thread)
+                thread.start()
+            else:
+                self._idle -= 1
+        finally:
+            self._lock.release()
+        self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def map(self, fn, iterable):
+        """
+        Call fn on each item of iterable concurrently.
+
+        Returns a list of results in the same order as iterable. If any call
+        raises an exception, the first one (in order) is re-raised after all
+        calls have finished.
+        """
+        futures = [self.submit(fn, item) for item in iterable]
+        for future in futures:
+            future.exception()
+        return [future.result() for future in futures]
+
+    def imap_unordered(self, fn, iterable, limit=None):
+        """
+        Call fn on each item of iterable concurrently, yielding (item, future) pairs as the calls finish.
+
+        At most limit calls (defaults to max_workers) are pending at once,
+        and iterable is only consumed as calls finish, so it may be very
+        long. Exceptions are left in the futures rather than re-raised.
+        """
+        if limit is None:
+            limit = self.max_workers
+        limit = max(1, limit)
+        done = Queue.Queue()
+        items = iter(iterable)
+        pending = 0
+        exhausted = False
+        while True:
+            while not exhausted and pending < limit:
+                try:
+                    item = items.next()
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = self.submit(fn, item)
+                future.add_done_callback(lambda future, item=item: done.put((item, future)))
+                pending += 1
+            if not pending:
+                break
+            yield done.get()
+            pending -= 1
+
+    def shutdown(self, wait=True):
+        """
+        Stop the pool's threads once the calls already submitted have run.
+
+        If wait is set, waits for the threads to exit (unless called from one
+        of them). Calls can no longer be submitted afterwards.
+        """
+        self._lock.acquire()
+        try:
+            self._shutdown = True
+            threads = self._threads
+            self._threads = []
+        finally:
+            self._lock.release()
+        for thread in threads:
+            self._tasks.put(None)
+        if wait and not getattr(self._local, 'worker', False):
+            for thread in threads:
+                thread.join()
+
+    def _work(self):
+        self._local.worker = True
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            (future, fn, args, kwargs) = task
+            self._run(future, fn, args, kwargs)
+            self._lock.acquire()
+            self._idle += 1
+            self._lock.release()
+
+    def _run(self, future, fn, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except:
+            future.set_exc_info(sys.exc_info())
+        else:
+            future.set_result(result)